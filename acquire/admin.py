@@ -0,0 +1,176 @@
+# Looking into and managing a running backend. The backend answers commands on
+# a 0MQ REP socket of its own, in its own loop, but only for so long each time
+# round, so a busy operator can't hold up the games. A command is a line of
+# words, and every answer is JSON:
+#
+#     games [START [COUNT]]   games by number, with their players and moves;
+#                             when there are more, next is where to start.
+#     game NUMBER             all of one game.
+#     players                 how many players are logged in and in games.
+#     queues                  how much is waiting to go out, and on timers.
+#     end NUMBER              end a started game now, paying everyone out.
+#     evict NUMBER            forget a game now, whatever it's doing.
+#     log_level LEVEL         log at LEVEL (debug, info, ...) from now on.
+#
+# To ask from the command line (see the stats module):
+#
+#     python acquire/stats.py ipc://acquire/backend_admin games
+
+import json
+import logging
+import zmq
+from timeit import default_timer as timer
+
+from acquire import gametools
+
+# Most games one games command lists.
+max_listed = 1000
+
+
+class Admin(object):
+    """Answers commands about backend on a REP socket, for no more than budget
+    seconds at a go.
+    """
+
+    def __init__(self, backend, socket, budget=0.005):
+        self.backend = backend
+        self.socket = socket
+        self.budget = budget
+        self.commands = {
+            'games': self.games,
+            'game': self.game,
+            'players': self.players,
+            'queues': self.queues,
+            'end': self.end,
+            'evict': self.evict,
+            'log_level': self.log_level,
+        }
+
+    def answer(self):
+        """Reply to the requests waiting on the socket until there are none left
+        or the budget is spent. Returns how many were answered; any left over
+        wait for next time.
+        """
+        deadline = timer() + self.budget
+        answered = 0
+        while True:
+            try:
+                request = self.socket.recv(zmq.NOBLOCK)
+            except zmq.ZMQError, e:
+                if e.errno == zmq.EAGAIN:
+                    return answered
+                raise
+            try:
+                reply = json.dumps(self.command(*request.split()))
+            except Exception, e:
+                self.backend.log.exception('could not encode admin answer')
+                reply = json.dumps({'error': '%s: %s' % (e.__class__.__name__, 
+                                                         e)})
+            self.socket.send(reply)
+            answered += 1
+            if timer() >= deadline:
+                return answered
+
+    def command(self, *words):
+        """Returns the answer to the command made of words. A command that 
+        fails is answered with its error, whatever it is, so nothing asked 
+        here can stop the backend.
+        """
+        if not words or words[0] not in self.commands:
+            return {'error': 'unknown command',
+                    'commands': sorted(self.commands)}
+        try:
+            return self.commands[words[0]](*words[1:])
+        except (TypeError, ValueError, gametools.GameError), e:
+            self.backend.log.debug('admin command %r failed', words,
+                                   exc_info=True)
+            return {'error': str(e) or e.__class__.__name__}
+        except Exception, e:
+            self.backend.log.exception('error in admin command %r', words)
+            return {'error': '%s: %s' % (e.__class__.__name__, e)}
+
+    def game_numbered(self, number):
+        """Returns the backend's game numbered number, a string.
+
+        Raises ValueError if there's no such game.
+        """
+        game = self.backend.game_numbered(int(number))
+        if game is None:
+            raise ValueError('no game numbered %s' % number)
+        return game
+
+    #### Commands
+
+    def games(self, start=0, count=100):
+        """Lists count of the games, from the start-th, or as many as the
+        budget allows. When games are left over, next is the start for the
+        rest.
+        """
+        start, count = int(start), min(int(count), max_listed)
+        deadline = timer() + self.budget
+        games_list = self.backend.games_list
+        listed = []
+        for game in games_list[start:start + count]:
+            listed.append({
+                'number': game['number'],
+                'players': [p['name'] for p in game['players']],
+                'started': game['started'],
+                'ended': game['ended'],
+                'moves': len(getattr(game, 'moves', ())),
+            })
+            if timer() >= deadline:
+                break
+        answer = {'total': len(games_list), 'games': listed}
+        if start + len(listed) < len(games_list):
+            answer['next'] = start + len(listed)
+        return answer
+
+    def game(self, number):
+        """All of the numbered game."""
+        game = self.game_numbered(number)
+        revision, _ = self.backend.published_games.get(game['number'],
+                                                       (0, None))
+        return {'game': game, 'revision': revision,
+                'moves': getattr(game, 'moves', None)}
+
+    def players(self):
+        """How many players are logged in, and how many are in games."""
+        return {'logged_in': len(self.backend.players),
+                'in_games': len(self.backend.player_games)}
+
+    def queues(self):
+        """What's waiting: messages to publish, and calls on the timers."""
+        backend = self.backend
+        return {'pub_queue': len(backend.pub_queue),
+                'pub_queue_limit': backend.pub_queue_limit,
+                'taking_messages': backend.polling_pull,
+                'timers': len(backend.timers),
+                'turn_clocks': len(backend.turn_clocks)}
+
+    def end(self, number):
+        """End the numbered game, as if it could have ended by the rules."""
+        game = self.game_numbered(number)
+        stock_market_shares = gametools.force_game_over(game)
+        self.backend.record_game(game)
+        self.backend.send_to_frontends('game_over', game=game,
+                                       stock_market_shares=stock_market_shares)
+        self.backend.log.info('Ended game %d.', game['number'])
+        return {'ended': game['number']}
+
+    def evict(self, number):
+        """Forget the numbered game, telling its players it's over."""
+        game = self.game_numbered(number)
+        self.backend.evict_game(game)
+        self.backend.log.info('Evicted game %d.', game['number'])
+        return {'evicted': game['number']}
+
+    def log_level(self, level):
+        """Set the backend's log level, by name or number."""
+        if level.isdigit():
+            level = int(level)
+        else:
+            name, level = level, logging.getLevelName(level.upper())
+            if not isinstance(level, int):
+                raise ValueError('no log level named %s' % name)
+        self.backend.log.setLevel(level)
+        return {'log_level': logging.getLevelName(level)}
@@ -0,0 +1,95 @@
+# Getting done-with games out of a backend. A Reaper notes when each game last
+# changed, and every so often picks out the games nobody needs any more:
+# finished games that have sat idle a while, so players get a look at the final
+# scores first, and unstarted games whose host has gone and that nobody has
+# touched in longer. The backend forgets those, and finished ones are appended
+# to an Archive first.
+#
+# An archive is a gzip file of JSON lines, one per game: its number, when it
+# was archived (Unix time), the game dict, and the seed and move log that
+# replay it (see gametools). Each batch of games archived together is a gzip
+# member of its own, appended to the file, and gzip reads them all back as one
+# stream:
+#
+#     zcat acquire/games.archive.gz | head -1
+
+import gzip
+import json
+import os
+import time
+from timeit import default_timer as timer
+
+
+class Archive(object):
+    """The archive file at path."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def store(self, games):
+        """Append the games to the archive, all in one go, and sync it to
+        disk.
+        """
+        now = int(time.time())
+        lines = [json.dumps({'number': game['number'], 'archived': now,
+                             'game': game, 'seed': getattr(game, 'seed', None),
+                             'moves': getattr(game, 'moves', None)}) + '\n'
+                 for game in games]
+        with open(self.path, 'ab') as f:
+            member = gzip.GzipFile(fileobj=f, mode='wb')
+            member.write(''.join(lines))
+            member.close()
+            f.flush()
+            os.fsync(f.fileno())
+
+    def games(self):
+        """Yields every archived game's record, oldest first."""
+        if not os.path.exists(self.path):
+            return
+        f = gzip.open(self.path, 'rb')
+        try:
+            for line in f:
+                yield json.loads(line)
+        finally:
+            f.close()
+
+
+class Reaper(object):
+    """Picks games to forget, every `every` seconds by its owner's timer: 
+    finished games left idle for finished_idle seconds, and unstarted games 
+    whose host has gone left idle for lobby_idle seconds. An idle time of 0 
+    keeps those games. Finished games go to archive first, if there is one.
+    """
+
+    def __init__(self, every=60, finished_idle=600, lobby_idle=1800,
+                 archive=None):
+        self.every = every
+        self.finished_idle = finished_idle
+        self.lobby_idle = lobby_idle
+        self.archive = archive
+        self.touched = {}
+
+    def touch(self, number):
+        """Note that the numbered game just changed."""
+        self.touched[number] = timer()
+
+    def forget(self, number):
+        """Stop keeping track of the numbered game."""
+        self.touched.pop(number, None)
+
+    def reapable(self, games, host_gone):
+        """Returns the finished and the abandoned games among games.
+        host_gone(game) says whether the game's host has gone.
+        """
+        now = timer()
+        finished, abandoned = [], []
+        for game in games:
+            idle = now - self.touched.get(game['number'], now)
+            if game['ended']:
+                if self.finished_idle and idle >= self.finished_idle:
+                    finished.append(game)
+            elif not game['started']:
+                if (self.lobby_idle and idle >= self.lobby_idle and
+                    host_gone(game)):
+                    abandoned.append(game)
+        return finished, abandoned
@@ -2,11 +2,35 @@
 # 'path' key).
 
 import logging
-import Queue
 import sys
 import zmq
+from collections import deque
+from timeit import default_timer as timer
 
-from acquire import gametools
+from acquire import codec, delta, gametools, profiling, stats, topics
+from acquire.admin import Admin
+from acquire.archive import Archive, Reaper
+from acquire.journal import Journal
+from acquire.timers import Timers
+
+# Messages sent only to the frontends serving a game, or a player; everything 
+# else goes to the lobby, which every frontend hears. A frontend subscribes to 
+# a player's topic as it asks to log them in, and the subscription may not 
+# have reached the backend by the time the answer goes out, so answers to 
+# logging in go to the lobby.
+game_paths = """tile_played hotel_created survivor_chosen shares_disbursed 
+                purchased game_snapshot game_chat""".split()
+player_paths = ['error']
+
+def set_hwms(socket, send_hwm=0, recv_hwm=0):
+    """Set the socket's high-water marks, the number of messages it queues 
+    for each peer before blocking or dropping them. 0 leaves a mark at 0MQ's 
+    default.
+    """
+    if send_hwm:
+        socket.setsockopt(zmq.SNDHWM, send_hwm)
+    if recv_hwm:
+        socket.setsockopt(zmq.RCVHWM, recv_hwm)
 
 class Backend(object):
     """Run games of Acquire, log players in and out, and move chat messages."""
@@ -48,13 +72,16 @@ class Backend(object):
         if game:
             del message['path']
             message['game'] = {'players': game['players']}
+            message['game_number'] = game['number']
             self.send_to_frontends('game_chat', **message)
     
     
     #### Listing, starting, joining, leaving, and starting play of games.
     
     def games_list_message(self, message):
-        """Someone wants a list of all active games."""
+        """Someone wants a list of all active games. Changes after this are 
+        sent one game at a time as lobby_game messages.
+        """
         self.send_games_list_to_frontends()
     
     def start_game_message(self, message):
@@ -70,8 +97,11 @@ class Backend(object):
             game = gametools.new_game(self.next_game_number())
             gametools.add_player_named(game, player)
             self.games_list.append(game)
+            self.numbered_games[game['number']] = game
+            self.player_games[player] = game
+            self.record_game(game)
             self.send_to_frontends('started_game', player=player, game=game)
-            self.send_games_list_to_frontends()
+            self.send_lobby_game_to_frontends('add', game)
             self.log.debug('Game %d started by %s.', game['number'], player)
     
     def join_game_message(self, message):
@@ -83,9 +113,11 @@ class Backend(object):
             if game:
                 try:
                     gametools.add_player_named(game, player)
+                    self.player_games[player] = game
+                    self.record_game(game)
                     self.send_to_frontends('joined_game', player=player, 
                                            game=game)
-                    self.send_games_list_to_frontends()
+                    self.send_lobby_game_to_frontends('update', game)
                     self.log.debug('%s joined game %d.', player, game['number'])
                 except gametools.GameAlreadyStartedError:
                     error = 'Cannot join started game'
@@ -110,17 +142,19 @@ class Backend(object):
         if game:
             try:
                 gametools.remove_player_named(game, player)
+                del self.player_games[player]
+                self.record_game(game)
                 self.send_to_frontends('left_game', player=player, game=game)
+                if game['players']:
+                    self.send_lobby_game_to_frontends('update', game)
                 self.log.debug('%s left game %d.', player, game['number'])
             except gametools.GameAlreadyStartedError:
                 error = 'Game has started'
                 detail = ('You cannot leave a game that has already started.')
                 self.send_error(player, error, detail)
             if not game['players']:
-                self.games_list.remove(game)
-                self.send_to_frontends('game_over', game_number=game['number'])
+                self.evict_game(game)
                 self.log.debug('Game %d is over.', game['number'])
-            self.send_games_list_to_frontends()
     
     def play_game_message(self, message):
         """Someone wants to start the game. If it's not the host of the game, 
@@ -134,9 +168,20 @@ class Backend(object):
             except gametools.GamePlayNotAllowedError, e:
                 self.send_error(player_name, 'Cannot start game play', e)
                 return
+            self.record_game(game)
             self.send_to_frontends('play_game', game=game, player=player_name,
                                    start_tiles=start_tiles)
-            self.send_games_list_to_frontends()
+            self.send_lobby_game_to_frontends('update', game)
+    
+    def game_snapshot_message(self, message):
+        """A frontend missed some updates to a game and wants all of it."""
+        game = self.game_numbered(message['game_number'])
+        if game:
+            revision, published = self.published_games.get(game['number'], 
+                                                           (0, None))
+            self.send_to_frontends('game_snapshot', game=published or game, 
+                                   game_number=game['number'], 
+                                   revision=revision)
     
     
     #### Playing games.
@@ -154,6 +199,7 @@ class Backend(object):
         except gametools.GamePlayNotAllowedError, e:
             self.send_error(player_name, 'Cannot play tile', e)
             return
+        self.record_game(game)
         self.send_to_frontends('tile_played', game=game, tile=message['tile'], 
                                player=player_name, 
                                stock_market_shares=stock_market_shares)
@@ -171,6 +217,7 @@ class Backend(object):
         except gametools.GamePlayNotAllowedError, e:
             self.send_error(player_name, 'Cannot create hotel', e)
             return
+        self.record_game(game)
         self.send_to_frontends('hotel_created', game=game, hotel=hotel['name'], 
                                player=player_name)
     
@@ -188,6 +235,7 @@ class Backend(object):
         except gametools.GamePlayNotAllowedError, e:
             self.send_error(player_name, 'Cannot choose survivor', e)
             return
+        self.record_game(game)
         self.send_to_frontends('survivor_chosen', game=game, 
                                survivor=survivor['name'], player=player_name, 
                                stock_market_shares=stock_market_shares)
@@ -210,6 +258,7 @@ class Backend(object):
         except gametools.GamePlayNotAllowedError, e:
             self.send_error(player_name, 'Cannot disburse shares', e)
             return
+        self.record_game(game)
         self.send_to_frontends('shares_disbursed', game=game, 
                                player=player_name, disbursement=disbursement, 
                                survivor=survivor['name'])
@@ -228,6 +277,7 @@ class Backend(object):
         except gametools.GamePlayNotAllowedError, e:
             self.send_error(player_name, 'Cannot complete purchase', e)
             return
+        self.record_game(game)
         self.send_to_frontends('purchased', game=game, order=order, 
                                player=player_name)
         if game['ended']:
@@ -241,74 +291,466 @@ class Backend(object):
         self.log = logging.getLogger('Backend')
         self.log.setLevel(logging.DEBUG)
         self.log.addHandler(logging.StreamHandler())
+        self.timers = Timers(log=self.log)
+        self.turn_limit = 0
+        self.turn_clocks = {}
+        self.start_stats()
+    
+    def start_stats(self, prefix='acquire_backend'):
+        """Set up the metrics kept on this backend (see the stats module), 
+        and its profiler.
+        """
+        self.stats = stats.Stats(prefix)
+        self.profiler = profiling.Profiler(prefix, self.timers)
+        # Paths without a handler are counted together, so a frontend can't 
+        # make up new labels.
+        self.known_paths = set(name[:-len('_message')] for name in dir(self) 
+                               if name.endswith('_message'))
+        self.messages_in = self.stats.counter(
+            'messages_total', 'Messages handled, by path.', 'path')
+        self.handler_seconds = self.stats.histogram(
+            'handler_seconds', 'Seconds spent handling a message, by path.', 
+            'path')
+        self.handler_errors = self.stats.counter(
+            'handler_errors_total', 'Messages whose handler raised, by path.', 
+            'path')
+        self.turns_timed_out = self.stats.counter(
+            'turns_timed_out_total', 'Actions taken for players who ran out '
+            'of time, by action.', 'action')
+        self.bytes_in = self.stats.counter(
+            'received_bytes_total', 'Bytes of messages received.')
+        self.bytes_out = self.stats.counter(
+            'sent_bytes_total', 'Bytes of messages sent, topics included.')
+        self.stats.gauge('pub_queue', 'Messages waiting to be published.', 
+                         lambda: len(self.pub_queue))
+        self.stats.gauge('games', 'Games waiting to start or being played.', 
+                         lambda: self.count_games())
+        self.stats.gauge('players', 'Players logged in.', 
+                         lambda: len(self.players))
+        self.stats.gauge('read_pauses_total', 'Times taking messages stopped '
+                         'while the PUB queue was too long.', 
+                         lambda: self.read_pauses, kind='counter')
     
     def run(self, pub_address="tcp://127.0.0.1:16180", 
-            pull_address="tcp://127.0.0.1:27183"):
+            pull_address="tcp://127.0.0.1:27183", game_updates='full', 
+            pub_batch=False, journal_path=None, snapshot_every=10000, 
+            codec_name='json', send_hwm=0, recv_hwm=0, pub_queue_limit=10000, 
+            stats_address=None, reap_every=60, finished_idle=600, 
+            lobby_idle=1800, archive_path=None, turn_limit=0, 
+            admin_address=None, admin_budget=0.005):
         """Start the backend, with PUB and PULL sockets on the given addresses.
+        
+        game_updates is 'full' to send the whole game with each message about 
+        it, or 'delta' to send only what changed since its last revision.
+        
+        Every message goes out as a topic frame (see the topics module) 
+        followed by the message. If pub_batch is True, consecutive messages 
+        with the same topic share one topic frame, a message per frame after 
+        it; otherwise each message gets its own.
+        
+        If journal_path is given, games are kept on disk in files named after 
+        it (see the journal module), and picked up from there on starting. A 
+        snapshot of all games is taken every snapshot_every logged events.
+        
+        Messages are encoded and decoded with the codec named codec_name (see 
+        the codec module), which the frontends must use too.
+        
+        send_hwm and recv_hwm are the high-water marks of the PUB and PULL 
+        sockets (see set_hwms). A frontend that falls further behind than 
+        send_hwm misses messages, and asks for the games it needs again. The 
+        backend stops taking messages while more than pub_queue_limit are 
+        waiting to be published.
+        
+        If stats_address is given, the backend's metrics can be had from a 
+        REP socket there (see the stats module).
+        
+        Every reap_every seconds, games that are done with are forgotten (see 
+        the archive module): finished games left idle for finished_idle 
+        seconds, which are archived to archive_path first if it's given, and 
+        unstarted games whose host has logged out left idle for lobby_idle 
+        seconds. A reap_every of 0 keeps every game.
+        
+        A player who takes more than turn_limit seconds over an action has a 
+        default one taken for them (see start_turn_clock). A turn_limit of 0 
+        waits for them forever.
+        
+        If admin_address is given, the backend takes commands on a REP socket 
+        there (see the admin module), for no more than admin_budget seconds 
+        each time round its loop.
         """
         # Socket setup.
         self.context = zmq.Context()
-        self.pub_socket = self.context.socket(zmq.PUB)
-        self.pub_socket.bind(pub_address)
-        self.pull_socket = self.context.socket(zmq.PULL)
-        self.pull_socket.bind(pull_address)
+        pub_socket = self.context.socket(zmq.PUB)
+        set_hwms(pub_socket, send_hwm=send_hwm)
+        pub_socket.bind(pub_address)
+        pull_socket = self.context.socket(zmq.PULL)
+        set_hwms(pull_socket, recv_hwm=recv_hwm)
+        pull_socket.bind(pull_address)
         self.log.info("Acquire backend is listening on %s", pull_address)
         self.log.info("                 and sending on %s", pub_address)
+        stats_socket = stats_address and self.bind_stats(stats_address)
+        admin = None
+        if admin_address:
+            admin_socket = self.context.socket(zmq.REP)
+            admin_socket.bind(admin_address)
+            admin = Admin(self, admin_socket, admin_budget)
+            self.log.info("                 with admin on %s", admin_address)
         self.log.info("Press CTRL-D to exit.")
+        journal = journal_path and Journal(journal_path, snapshot_every)
+        reaper = reap_every and Reaper(reap_every, finished_idle, lobby_idle, 
+                                       archive_path and Archive(archive_path))
+        self.serve(pub_socket, pull_socket, game_updates, pub_batch, sys.stdin, 
+                   journal, codec_name, pub_queue_limit, stats_socket, reaper,
+                   turn_limit, admin)
+    
+    def bind_stats(self, stats_address):
+        """Returns a REP socket bound to stats_address, for stats requests."""
+        stats_socket = self.context.socket(zmq.REP)
+        stats_socket.bind(stats_address)
+        self.log.info("                 with stats on %s", stats_address)
+        return stats_socket
+    
+    def serve(self, pub_socket, pull_socket, game_updates='full', 
+              pub_batch=False, stdin=None, journal=None, codec_name='json', 
+              pub_queue_limit=10000, stats_socket=None, reaper=None, 
+              turn_limit=0, admin=None):
+        """Handle messages from pull_socket and send what comes of them out 
+        on pub_socket, forever. If stdin is given, stop at its end of file. If 
+        journal is given, start with the games it restores and keep it up to 
+        date. Messages both ways go through the named codec. Messages aren't 
+        taken from pull_socket while more than pub_queue_limit are waiting to 
+        go out. Requests on stats_socket, if given, are answered with the 
+        backend's metrics. If reaper is given, it picks games to forget. 
+        Players get turn_limit seconds for each action, if it isn't 0. 
+        Commands on admin's socket, if given, are answered (see the admin 
+        module).
+        
+        Anything else to be done at some time goes on self.timers (see the 
+        timers module), which are run each time round the loop.
+        """
+        self.pub_socket = pub_socket
+        self.pull_socket = pull_socket
+        self.stdin = stdin
+        self.stats_socket = stats_socket
+        self.codec = codec.named(codec_name)
         
-        # Queue and collection setup.
-        self.pub_queue = Queue.Queue()
+        # Queue and collection setup. Only this thread touches the queue, so it 
+        # needn't be a Queue.Queue.
+        self.pub_queue = deque()
+        self.pub_queue_limit = pub_queue_limit
+        self.pub_batch = pub_batch
         self.players = set()
         self.games_list = []
+        self.numbered_games = {}
+        self.player_games = {}
+        self.game_updates = game_updates
+        self.published_games = {}
+        self.journal = journal
+        self.reaper = reaper
+        self.turn_limit = turn_limit
+        self.admin = admin
+        if journal:
+            self.restore_games(journal.restore(), journal.last_number)
+        else:
+            self.restore_games([], 0)
+        if reaper:
+            self.timers.call_every(reaper.every, self.reap_games)
         
         # Listen forever until end of file (CTRL-D on *nix) seen on stdin.
+        self.start_polling()
         while True:
             self._runloop()
     
     def _runloop(self):
         """A single run-through of all sockets handled by this backend."""
-        inputs = [self.pull_socket, sys.stdin]
-        outputs = [] if self.pub_queue.empty() else [self.pub_socket]
-        exceptionals = inputs + [self.pub_socket]
-        read, write, error = zmq.select(inputs, outputs, exceptionals)
-        for fileno in read:
-            if fileno == self.pull_socket:
-                self.route_message(self.pull_socket.recv_json())
-            elif fileno == sys.stdin.fileno():
-                for _ in sys.stdin:
-                    pass
-                sys.exit(0)
-        for fileno in write:
-            if fileno == self.pub_socket:
-                try:
-                    self.pub_socket.send_json(self.pub_queue.get_nowait())
-                except Queue.Empty:
-                    pass
-        for fileno in error:
-            if fileno == self.pub_socket:
-                raise Exception('PUB socket in exceptional state')
-            elif fileno == self.pull_socket:
-                raise Exception('PULL socket in exceptional state')
-            elif fileno == sys.stdin.fileno():
+        events = self.poll()
+        if self.pull_socket in events:
+            self.receive_messages()
+        if self.stdin and self.stdin.fileno() in events:
+            if events[self.stdin.fileno()] & zmq.POLLERR:
                 raise Exception('stdin in exceptional state')
+            for _ in self.stdin:
+                pass
+            if self.journal:
+                self.journal.close()
+            sys.exit(0)
+        self.timers.run_due()
+        if self.journal:
+            # Everything handled this time round goes to disk together, before 
+            # anyone hears about it.
+            self.journal.flush()
+        if self.pub_socket in events:
+            self.publish_messages()
+        if self.stats_socket in events:
+            self.stats.answer(self.stats_socket, 
+                              {'profile': self.profiler.command})
+        if self.admin and self.admin.socket in events:
+            self.admin.answer()
+    
+    def start_polling(self):
+        """Register the sockets this backend reads from with a poller, once 
+        and for all.
+        """
+        self.poller = zmq.Poller()
+        self.poller.register(self.pull_socket, zmq.POLLIN)
+        if self.stdin:
+            self.poller.register(self.stdin.fileno(), zmq.POLLIN)
+        if self.stats_socket:
+            self.poller.register(self.stats_socket, zmq.POLLIN)
+        if self.admin:
+            self.poller.register(self.admin.socket, zmq.POLLIN)
+        self.polling_pub = False
+        self.polling_pull = True
+        self.read_pauses = 0
+    
+    def poll(self):
+        """Wait until there's something to do, and return a dict of the ready 
+        sockets' events. The PUB socket is polled only while messages are 
+        waiting for it, and the PULL socket only while there aren't too many.
+        """
+        if bool(self.pub_queue) != self.polling_pub:
+            self.polling_pub = not self.polling_pub
+            if self.polling_pub:
+                self.poller.register(self.pub_socket, zmq.POLLOUT)
+            else:
+                self.poller.unregister(self.pub_socket)
+        backed_up = len(self.pub_queue) > self.pub_queue_limit
+        if backed_up == self.polling_pull:
+            self.polling_pull = not backed_up
+            if self.polling_pull:
+                self.poller.register(self.pull_socket, zmq.POLLIN)
+                self.log.info('Publishing caught up, taking messages again.')
+            else:
+                self.poller.unregister(self.pull_socket)
+                self.read_pauses += 1
+                self.log.info('%d messages waiting to be published, not '
+                              'taking any more for now.', len(self.pub_queue))
+        return dict(self.poller.poll(self.timers.timeout()))
+    
+    def receive_messages(self, limit=100):
+        """Route messages waiting on the PULL socket, up to limit of them so 
+        that publishing gets a turn.
+        """
+        for _ in xrange(limit):
+            try:
+                data = self.pull_socket.recv(zmq.NOBLOCK)
+            except zmq.ZMQError, e:
+                if e.errno == zmq.EAGAIN:
+                    return
+                raise
+            self.bytes_in.add(n=len(data))
+            try:
+                message = self.codec.decode(data)
+            except ValueError:
+                self.log.exception('could not decode message')
+                continue
+            # Handlers may take the path out of the message.
+            path = message['path']
+            if path not in self.known_paths:
+                path = 'unknown'
+            start = timer()
+            self.route_message(message)
+            elapsed = timer() - start
+            self.handler_seconds.observe(path, elapsed)
+            self.profiler.handled(path + '_message', elapsed)
+            self.messages_in.add(path)
+    
+    def publish_messages(self):
+        """Send everything waiting in the PUB queue, or as much as the socket 
+        will take without blocking (a worker's socket to the router can fill 
+        up; a PUB socket drops messages instead).
+        """
+        queue = self.pub_queue
+        encode = self.codec.encode
+        while queue:
+            batch = [queue.popleft()]
+            topic = batch[0][0]
+            if self.pub_batch:
+                while queue and queue[0][0] == topic:
+                    batch.append(queue.popleft())
+            parts = [topic] + [encode(message) for _, message in batch]
+            try:
+                self.pub_socket.send_multipart(parts, zmq.NOBLOCK)
+            except zmq.ZMQError, e:
+                if e.errno == zmq.EAGAIN:
+                    queue.extendleft(reversed(batch))
+                    return
+                raise
+            self.bytes_out.add(n=sum(map(len, parts)))
     
     def route_message(self, message):
         """Pass message along to a path-specific handler."""
-        handler_name = message['path'] + '_message'
+        path = message['path']
+        handler_name = path + '_message'
         if hasattr(self, handler_name):
             try:
                 getattr(self, handler_name)(message)
             except Exception:
-                self.log.exception('error handling %s message', message['path'])
+                self.log.exception('error handling %s message', path)
+                self.handler_errors.add(path)
         else:
-            self.log.debug('unimplemented message %s', message['path'])
+            self.log.debug('unimplemented message %s', path)
     
     def send_to_frontends(self, path, **message):
         """Send a message with the given path and key-value pairs to the 
-        frontends.
+        frontends. A message about a game gets the game's next revision number.
         """
+        game = message.get('game')
+        if path in game_paths:
+            topic = topics.game(message.get('game_number') or game['number'])
+        elif path in player_paths:
+            topic = topics.player(message['player'])
+        else:
+            topic = topics.lobby
+        if game and 'number' in game and 'revision' not in message:
+            self.revise_game(message, topic != topics.lobby)
         message.update(dict(path=path))
-        self.pub_queue.put(message)
+        self.pub_queue.append((topic, message))
+    
+    def revise_game(self, message, send_delta=True):
+        """Give the message's game its next revision number. When sending 
+        deltas, the game in the message is swapped for what changed since the 
+        last revision, unless this is the game's first or send_delta is False.
+        
+        Lobby messages about a game always carry all of it, so frontends that 
+        don't follow the game's topic can still make sense of them, and those 
+        that do can pick up its deltas from there.
+        """
+        game = message['game']
+        number = game['number']
+        revision, published = self.published_games.get(number, (0, None))
+        revision += 1
+        if self.game_updates == 'delta':
+            changes, current = delta.track(published, game)
+            if published is None or not send_delta:
+                message['game'] = current
+            else:
+                del message['game']
+                message['game_number'] = number
+                message['game_delta'] = changes or {}
+            published = current
+        self.published_games[number] = (revision, published)
+        message['revision'] = revision
+    
+    def record_game(self, game):
+        """Have the journal, if any, log what just happened to game, and the 
+        reaper, if any, note that it isn't idle. Whoever's up next gets a 
+        fresh turn clock.
+        """
+        if self.journal:
+            self.journal.record(game)
+        if self.reaper:
+            self.reaper.touch(game['number'])
+        self.start_turn_clock(game)
+    
+    def restore_games(self, games, last_number):
+        """Pick up the given games, restored from a journal, if any. New games 
+        are numbered from after last_number.
+        """
+        for game in games:
+            self.games_list.append(game)
+            self.numbered_games[game['number']] = game
+            for player in game['players']:
+                self.player_games[player['name']] = game
+            if self.reaper:
+                self.reaper.touch(game['number'])
+            self.start_turn_clock(game)
+        self._next_game_number = last_number
+        if games:
+            self.log.info('Restored %d games.', len(games))
+    
+    def forget_game(self, game):
+        """Forget all about a game that's been taken out of games_list."""
+        number = game['number']
+        del self.numbered_games[number]
+        self.published_games.pop(number, None)
+        for player in game['players']:
+            if self.player_games.get(player['name']) is game:
+                del self.player_games[player['name']]
+        if self.journal:
+            self.journal.drop(number)
+        if self.reaper:
+            self.reaper.forget(number)
+        self.timers.cancel(self.turn_clocks.pop(number, None))
+    
+    def start_turn_clock(self, game):
+        """If there's a turn limit, give the player at the head of the game's 
+        action queue that long to act, in place of any time they had left. 
+        Games that aren't being played have no clock.
+        """
+        number = game['number']
+        self.timers.cancel(self.turn_clocks.pop(number, None))
+        if (self.turn_limit and game['started'] and not game['ended'] and 
+            game['action_queue']):
+            self.turn_clocks[number] = self.timers.call_later(
+                self.turn_limit, self.turn_timed_out, number)
+    
+    def turn_timed_out(self, game_number):
+        """The numbered game's turn clock ran out. Take the default action 
+        (see gametools.default_action) as if its player had sent it, so 
+        everyone hears about it the usual way. A game that could end, or 
+        whose player has nothing they can do, is ended instead, so that a 
+        game everyone has walked away from finishes and can be reaped.
+        """
+        game = self.numbered_games.get(game_number)
+        self.turn_clocks.pop(game_number, None)
+        if not game:
+            return
+        action = gametools.default_action(game)
+        # With no hotels on the board, the game can end only in name.
+        if action is None or (gametools.hotels_on_board(game) and 
+                              gametools.game_can_end(game)):
+            self.log.debug('Time ran out in game %d, ending it.', game_number)
+            self.turns_timed_out.add('game_over')
+            stock_market_shares = gametools.force_game_over(game)
+            self.record_game(game)
+            self.send_to_frontends('game_over', game=game, 
+                                   stock_market_shares=stock_market_shares)
+            return
+        path = action.pop('action')
+        self.log.debug('%s ran out of time in game %d, doing %s for them.', 
+                       action['player'], game_number, path)
+        self.turns_timed_out.add(path)
+        action['path'] = path
+        self.route_message(action)
+    
+    def evict_game(self, game):
+        """Forget a game at once, whatever it's doing. Its players hear that 
+        it's over, and the lobby that it's gone.
+        """
+        self.games_list.remove(game)
+        self.forget_game(game)
+        self.send_to_frontends('game_over', game_number=game['number'])
+        self.send_lobby_game_to_frontends('remove', game)
+    
+    def reap_games(self):
+        """Forget the games the reaper picks, archiving the finished ones. 
+        The lobby hears that they're gone, and the players in abandoned games 
+        that they're over.
+        """
+        finished, abandoned = self.reaper.reapable(self.games_list, 
+                                                   self.host_gone)
+        if not finished and not abandoned:
+            return
+        if finished and self.reaper.archive:
+            self.reaper.archive.store(finished)
+        reaped = set(game['number'] for game in finished + abandoned)
+        self.games_list = [game for game in self.games_list 
+                           if game['number'] not in reaped]
+        for game in finished:
+            self.forget_game(game)
+            self.send_lobby_game_to_frontends('remove', game)
+        for game in abandoned:
+            self.forget_game(game)
+            self.send_to_frontends('game_over', game_number=game['number'])
+            self.send_lobby_game_to_frontends('remove', game)
+        self.log.info('Reaped %d finished and %d abandoned games.', 
+                      len(finished), len(abandoned))
+    
+    def host_gone(self, game):
+        """Returns True if the game's host isn't logged in."""
+        host = gametools.host(game)
+        return host is None or host['name'] not in self.players
     
     def send_error(self, player, error, detail):
         """Send an error message to the given player. error should be a 
@@ -328,27 +770,40 @@ class Backend(object):
         return self._next_game_number
     
     def send_games_list_to_frontends(self):
-        """Send the list of games to the frontends."""
-        self.send_to_frontends('games_list', games_list=self.games_list)
+        """Send the lobby summaries of all games to the frontends."""
+        summaries = map(gametools.lobby_summary, self.games_list)
+        self.send_to_frontends('games_list', games_list=summaries)
+    
+    def send_lobby_game_to_frontends(self, event, game):
+        """Tell the frontends that a game was added to the lobby, updated, or 
+        removed from it. Added and updated games come with their lobby summary.
+        """
+        if event == 'remove':
+            self.send_to_frontends('lobby_game', event=event, 
+                                   game_number=game['number'])
+        else:
+            self.send_to_frontends('lobby_game', event=event, 
+                                   summary=gametools.lobby_summary(game))
     
     def game_for_player(self, player_name):
         """Returns the game that the named player is currently in, or None if 
         there is no such game.
         """
-        for game in self.games_list:
-            if player_name in map(lambda p: p['name'], game['players']):
-                return game
-        return None
+        return self.player_games.get(player_name)
     
     def game_numbered(self, game_number):
         """Returns the game with the given game number, or None if there is no 
         such game.
         """
-        for game in self.games_list:
-            if game['number'] == game_number:
-                return game
-        return None
-    
+        try:
+            return self.numbered_games.get(game_number)
+        except TypeError:
+            return None
+
+    def count_games(self):
+        """Returns the number of games waiting to start or being played."""
+        return len(self.games_list)
+
 
 if __name__ == '__main__':
     Backend().run()
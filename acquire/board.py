@@ -0,0 +1,287 @@
+# The Acquire board as bitmasks. Each of the 108 cells gets one bit, numbered
+# down each column from 1A (bit 0) to 12I (bit 107), so any set of tiles is
+# just an int and finding neighbours takes a handful of shifts. (Bit numbers
+# are one less than NetAcquire's Tile-IDs.)
+
+rows = 'ABCDEFGHI'
+tile_names = tuple(str(c) + r for c in range(1, 13) for r in rows)
+tile_indices = dict((t, i) for i, t in enumerate(tile_names))
+
+full = (1 << len(tile_names)) - 1
+safe_size = 11
+row_a = sum(1 << i for i in xrange(0, len(tile_names), len(rows)))
+row_i = row_a << (len(rows) - 1)
+
+
+def spread(mask):
+    """Returns the mask of cells orthogonally adjacent to any cell in mask.
+    Cells of mask itself are included only if they neighbour another cell of
+    mask.
+    """
+    return (((mask & ~row_a) >> 1) | ((mask & ~row_i) << 1) |
+            (mask >> len(rows)) | (mask << len(rows))) & full
+
+neighbours = tuple(spread(1 << i) for i in xrange(len(tile_names)))
+
+
+def index(tile):
+    """Returns the cell number of tile, or None if tile is not on the board."""
+    return tile_indices.get(tile)
+
+def bit(tile):
+    """Returns the mask with just tile's bit set, or 0 if tile is not on the 
+    board.
+    """
+    i = tile_indices.get(tile)
+    return 0 if i is None else 1 << i
+
+def mask_of(tiles):
+    """Returns the mask with a bit set for each on-board tile in tiles."""
+    mask = 0
+    for tile in tiles:
+        i = tile_indices.get(tile)
+        if i is not None:
+            mask |= 1 << i
+    return mask
+
+def cells(mask):
+    """Yield the cell number of each bit set in mask, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def tiles_in(mask):
+    """Returns the list of tiles whose bits are set in mask."""
+    return [tile_names[i] for i in cells(mask)]
+
+def size(mask):
+    """Returns the number of bits set in mask."""
+    return bin(mask).count('1')
+
+
+class Groups(object):
+    """Connected groups of tiles, as a disjoint-set forest over cells. Each 
+    group knows its size, its cells (as a mask), and its label: the name of the 
+    hotel it makes up, or None.
+    """
+
+    __slots__ = ('placed', 'parent', 'sizes', 'masks', 'labels')
+
+    def __init__(self):
+        self.placed = 0
+        self.parent = range(len(tile_names))
+        self.sizes = [0] * len(tile_names)
+        self.masks = [0] * len(tile_names)
+        self.labels = [None] * len(tile_names)
+
+    def copy(self):
+        """Returns an independent copy of these groups."""
+        groups = Groups.__new__(Groups)
+        groups.placed = self.placed
+        groups.parent = self.parent[:]
+        groups.sizes = self.sizes[:]
+        groups.masks = self.masks[:]
+        groups.labels = self.labels[:]
+        return groups
+
+    def find(self, cell):
+        """Returns the cell at the root of cell's group."""
+        parent = self.parent
+        while parent[cell] != cell:
+            parent[cell] = parent[parent[cell]]
+            cell = parent[cell]
+        return cell
+
+    def union(self, a, b):
+        """Join the groups of cells a and b. Returns the root of the joined 
+        group, which keeps a label if either group had one.
+        """
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if self.sizes[a] < self.sizes[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.sizes[a] += self.sizes[b]
+        self.masks[a] |= self.masks[b]
+        self.labels[a] = self.labels[a] or self.labels[b]
+        return a
+
+    def add(self, cell, within=full):
+        """Put cell on the board and join it with the groups of its placed 
+        neighbours in the mask within. Returns the root of cell's group.
+        """
+        self.placed |= 1 << cell
+        self.parent[cell] = cell
+        self.sizes[cell] = 1
+        self.masks[cell] = 1 << cell
+        self.labels[cell] = None
+        root = cell
+        for other in cells(neighbours[cell] & self.placed & within):
+            root = self.union(root, other)
+        return root
+
+
+class Board(object):
+    """The tiles of one game: a mask of lonely tiles, a mask per hotel, and the 
+    connected groups they make up.
+
+    The board also keeps two masks of tiles that matter to players: dead, the 
+    tiles that would merge safe hotels, and creators, the tiles that would 
+    found a hotel. These only change when place or grow does.
+
+    A board built with from_game remembers which tile lists it came from, so
+    watching can tell whether those lists have since been replaced or resized.
+    """
+
+    __slots__ = ('lonely', 'names', 'hotels', 'groups', 'dead', 'creators', 
+                 '_watched')
+
+    def __init__(self, lonely=0, hotels=()):
+        """A new board from a lonely tiles mask and a sequence of (hotel name,
+        mask) pairs in hotel order.
+        """
+        self.lonely = lonely
+        self.names = [name for name, _ in hotels]
+        self.hotels = dict(hotels)
+        self.groups = Groups()
+        for name, mask in hotels:
+            if mask:
+                first = next(cells(mask))
+                for cell in cells(mask):
+                    self.groups.add(cell, 0)
+                    self.groups.union(first, cell)
+                self.groups.labels[self.groups.find(first)] = name
+        for cell in cells(lonely & ~self.groups.placed):
+            self.groups.add(cell, lonely)
+        self.dead = self.safe_merge_mask()
+        self.creators = self.creation_mask()
+        self._watched = ()
+
+    @classmethod
+    def from_game(cls, game):
+        """A new board showing the tiles in the given game dict."""
+        hotels = [(h['name'], mask_of(h['tiles']))
+                  for h in game.get('hotels', [])]
+        board = cls(mask_of(game.get('lonely_tiles', [])), hotels)
+        board.watch(game)
+        return board
+
+    def copy(self):
+        """Returns an independent copy of this board, watching nothing."""
+        board = Board.__new__(Board)
+        board.lonely = self.lonely
+        board.names = self.names
+        board.hotels = self.hotels.copy()
+        board.groups = self.groups.copy()
+        board.dead = self.dead
+        board.creators = self.creators
+        board._watched = ()
+        return board
+
+    def watch(self, game):
+        """Remember the game's tile lists as they are right now."""
+        lists = [game.get('lonely_tiles')]
+        lists.extend(h['tiles'] for h in game.get('hotels', []))
+        self._watched = [(l, len(l) if l is not None else 0) for l in lists]
+
+    def watching(self, game):
+        """Returns True if the game's tile lists are the same lists, of the
+        same lengths, as when last watched.
+        """
+        lists = [game.get('lonely_tiles')]
+        lists.extend(h['tiles'] for h in game.get('hotels', []))
+        if len(lists) != len(self._watched):
+            return False
+        for l, (watched, length) in zip(lists, self._watched):
+            if l is not watched or (l is not None and len(l) != length):
+                return False
+        return True
+
+    #### Queries
+
+    def in_hotels(self):
+        """Returns the mask of all cells that are in a hotel."""
+        mask = 0
+        for m in self.hotels.itervalues():
+            mask |= m
+        return mask
+
+    def where(self, cell):
+        """Returns 'lonely', a hotel name, or None if nothing is at cell."""
+        if self.lonely & (1 << cell):
+            return 'lonely'
+        if not self.groups.placed & (1 << cell):
+            return None
+        return self.groups.labels[self.groups.find(cell)]
+
+    def hotels_adjacent(self, cell):
+        """Returns the names of hotels next to cell, in hotel order."""
+        groups = self.groups
+        nearby = set(groups.labels[groups.find(c)] 
+                     for c in cells(neighbours[cell] & groups.placed))
+        return [n for n in self.names if n in nearby]
+
+    def hotel_size(self, name):
+        """Returns the number of tiles in the named hotel."""
+        mask = self.hotels[name]
+        if not mask:
+            return 0
+        return self.groups.sizes[self.groups.find(next(cells(mask)))]
+
+    def lonely_cluster(self, cell):
+        """Returns the mask of lonely tiles that would join cell's group if a 
+        tile was played there.
+        """
+        groups = self.groups
+        cluster = 0
+        for other in cells(neighbours[cell] & self.lonely):
+            cluster |= groups.masks[groups.find(other)]
+        return cluster & self.lonely
+
+    def creation_mask(self):
+        """Returns the mask of empty cells that would found a hotel if played:
+        those next to a lonely tile but not next to any hotel.
+        """
+        in_hotels = self.in_hotels()
+        return (spread(self.lonely) & ~(self.lonely | in_hotels) &
+                ~spread(in_hotels))
+
+    def safe_merge_mask(self):
+        """Returns the mask of cells next to two or more safe hotels."""
+        seen = twice = 0
+        for name, mask in self.hotels.iteritems():
+            if self.hotel_size(name) >= safe_size:
+                around = spread(mask) & ~mask
+                twice |= seen & around
+                seen |= around
+        return twice
+
+    #### Changes
+
+    def place(self, cell):
+        """Put a lonely tile on cell."""
+        self.groups.add(cell)
+        self.lonely |= 1 << cell
+        self.creators = self.creation_mask()
+
+    def grow(self, name, mask):
+        """Add the cells of mask to the named hotel. Any cells not yet on the 
+        board are placed, joining up with their neighbours, and any other 
+        hotel joined up with is taken over by this one.
+        """
+        groups = self.groups
+        for cell in cells(mask & ~groups.placed):
+            groups.add(cell)
+        root = groups.find(next(cells(mask)))
+        groups.labels[root] = name
+        joined = groups.masks[root]
+        for other in self.names:
+            if other != name and self.hotels[other] & joined:
+                self.hotels[other] = 0
+        self.hotels[name] = joined
+        self.lonely &= ~joined
+        self.creators = self.creation_mask()
+        if groups.sizes[root] >= safe_size:
+            self.dead = self.safe_merge_mask()
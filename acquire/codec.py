@@ -0,0 +1,350 @@
+# How messages between the backend and its frontends are turned into bytes and
+# back. Everything that goes over a backend socket is encoded and decoded by
+# one of these codecs, picked by name in acquire.cfg, and every process
+# talking to a backend must be set up with the same one.
+#
+#     json    plain JSON text, as always. Easy to read off the wire, and the
+#             fastest, since the json module does the work in C.
+#     binary  a compact tagged encoding for the same values. Tile names, hotel
+#             names and the other strings that turn up in every message are a
+#             byte each, as are small ints.
+#
+# The binary codec trades CPU for bandwidth: on messages carrying whole games
+# it's about a fifth the size of JSON, but it's written in Python, so encoding
+# takes about five times as long and decoding about twice as long. Stick with
+# json unless the link between the backend and the frontends is what's slow.
+#
+# Strings come back as unicode from both codecs, lists as lists, and dicts as
+# dicts, so frontends can't tell which was used.
+#
+# Run this module to compare the codecs on the messages from some games:
+#
+#     python acquire/codec.py --games 20
+
+import json
+import optparse
+import random
+import struct
+import sys
+from timeit import default_timer as timer
+try:
+    import acquire
+except ImportError:
+    import os
+    path_here = os.path.dirname(os.path.realpath(__file__))
+    sys.path.insert(0, os.path.realpath(os.path.join(path_here, '../')))
+from acquire import board, gametools
+
+
+class JSONCodec(object):
+    """Messages as JSON text."""
+
+    name = 'json'
+
+    def encode(self, message):
+        """Returns message as a string of bytes."""
+        return json.dumps(message)
+
+    def decode(self, data):
+        """Returns the message encoded in data."""
+        return json.loads(data)
+
+
+#### The binary encoding
+#
+# Each value starts with a tag byte:
+#     0x00-0x02             None, False, True.
+#     0x03, 0x04, 0x05      an int in the next 1, 4 or 8 bytes, signed.
+#     0x06                  a float in the next 8 bytes.
+#     0x07                  a UTF-8 string: a length, then that many bytes.
+#     0x08                  a list: a length, then that many values.
+#     0x09                  a dict: a length, then that many key-value pairs.
+#     0x0a                  an int too big for 8 bytes, as a string.
+#     0x10-0x7f             a string from the interned list below.
+#     0x80-0xeb             a tile, by its board cell number.
+#     0xec-0xff             an int from 0 to 19.
+# Lengths are a byte, or 0xff and the next 4 bytes for 255 and up. Multi-byte
+# numbers are big-endian.
+#
+# Only ever add interned strings to the end of the list, and only while there
+# are tags free for them.
+
+interned = tuple(gametools.hotel_names + """
+    path game game_number game_delta revision player players name cash shares
+    rack tiles hotels hotel number started ended tilebag lonely_tiles
+    action_queue action merge_info choices survivor order end_game trade sell
+    disbursement tile stock_market_shares start_tiles summary event
+    games_list error detail message
+    play_tile create_hotel choose_survivor disburse_shares purchase
+    tile_played hotel_created survivor_chosen shares_disbursed purchased
+    play_game game_over game_snapshot lobby_game add update remove
+    login logout logged_in logged_out duplicate_name lobby_chat game_chat
+    start_game join_game leave_game started_game joined_game left_game
+    = d r x a i
+    """.split())
+
+first_interned = 0x10
+first_tile = 0x80
+first_small_int = first_tile + len(board.tile_names)
+small_ints = 0x100 - first_small_int
+assert first_interned + len(interned) <= first_tile
+
+interned_tags = dict((s, chr(first_interned + i))
+                     for i, s in enumerate(interned))
+tile_tags = dict((t, chr(first_tile + i))
+                 for i, t in enumerate(board.tile_names))
+small_int_tags = [chr(first_small_int + i) for i in xrange(small_ints)]
+
+# What each single-byte tag decodes to, if it's one of those.
+tag_values = {}
+for i, s in enumerate(interned):
+    tag_values[first_interned + i] = unicode(s)
+for i, t in enumerate(board.tile_names):
+    tag_values[first_tile + i] = unicode(t)
+for i in xrange(small_ints):
+    tag_values[first_small_int + i] = i
+
+
+class BinaryCodec(object):
+    """Messages in the compact binary encoding described above."""
+
+    name = 'binary'
+
+    def encode(self, message):
+        """Returns message as a string of bytes."""
+        chunks = []
+        encode_value(message, chunks.append)
+        return ''.join(chunks)
+
+    def decode(self, data):
+        """Returns the message encoded in data.
+
+        Raises ValueError if data isn't a single encoded value.
+        """
+        try:
+            value, end = decode_value(data, 0)
+        except (IndexError, struct.error, KeyError), e:
+            raise ValueError('truncated or corrupt message: %s' % e)
+        if end != len(data):
+            raise ValueError('%d bytes left over' % (len(data) - end))
+        return value
+
+
+pack_int8 = struct.Struct('>b').pack
+pack_int32 = struct.Struct('>i').pack
+pack_int64 = struct.Struct('>q').pack
+
+def encode_length(length, write):
+    if length < 0xff:
+        write(chr(length))
+    else:
+        write('\xff' + struct.pack('>I', length))
+
+def encode_value(value, write):
+    # Checked by exact type, most common first, since this runs for every 
+    # value in every message.
+    kind = type(value)
+    if kind is dict:
+        write('\x09')
+        encode_length(len(value), write)
+        for key, item in value.iteritems():
+            encode_value(key, write)
+            encode_value(item, write)
+    elif kind is str or kind is unicode:
+        tag = interned_tags.get(value) or tile_tags.get(value)
+        if tag:
+            write(tag)
+            return
+        if kind is unicode:
+            value = value.encode('utf-8')
+        write('\x07')
+        encode_length(len(value), write)
+        write(value)
+    elif kind is list or kind is tuple:
+        write('\x08')
+        encode_length(len(value), write)
+        for item in value:
+            encode_value(item, write)
+    elif kind is int or kind is long:
+        if 0 <= value < small_ints:
+            write(small_int_tags[value])
+        elif -0x80 <= value < 0x80:
+            write('\x03' + pack_int8(value))
+        elif -0x80000000 <= value < 0x80000000:
+            write('\x04' + pack_int32(value))
+        elif -0x8000000000000000 <= value < 0x8000000000000000:
+            write('\x05' + pack_int64(value))
+        else:
+            digits = str(value)
+            write('\x0a')
+            encode_length(len(digits), write)
+            write(digits)
+    elif value is None:
+        write('\x00')
+    elif value is True:
+        write('\x02')
+    elif value is False:
+        write('\x01')
+    elif kind is float:
+        write('\x06' + struct.pack('>d', value))
+    elif isinstance(value, basestring):
+        encode_value(unicode(value), write)
+    elif isinstance(value, dict):
+        encode_value(dict(value), write)
+    elif isinstance(value, (list, tuple)):
+        encode_value(list(value), write)
+    else:
+        raise TypeError('cannot encode %r' % (value,))
+
+def decode_length(data, offset):
+    length = ord(data[offset])
+    if length < 0xff:
+        return length, offset + 1
+    return struct.unpack_from('>I', data, offset + 1)[0], offset + 5
+
+def decode_value(data, offset):
+    """Returns the value starting at offset in data, and the offset just past
+    it.
+    """
+    tag = ord(data[offset])
+    offset += 1
+    if tag >= first_interned:
+        return tag_values[tag], offset
+    if tag == 0x09:
+        length, offset = decode_length(data, offset)
+        value = {}
+        for _ in xrange(length):
+            key, offset = decode_value(data, offset)
+            value[key], offset = decode_value(data, offset)
+        return value, offset
+    if tag == 0x08:
+        length, offset = decode_length(data, offset)
+        value = []
+        for _ in xrange(length):
+            item, offset = decode_value(data, offset)
+            value.append(item)
+        return value, offset
+    if tag in (0x07, 0x0a):
+        length, offset = decode_length(data, offset)
+        end = offset + length
+        if end > len(data):
+            raise IndexError('string runs past the end')
+        if tag == 0x0a:
+            return int(data[offset:end]), end
+        return data[offset:end].decode('utf-8'), end
+    if tag <= 0x02:
+        return (None, False, True)[tag], offset
+    if tag == 0x03:
+        return struct.unpack_from('>b', data, offset)[0], offset + 1
+    if tag == 0x04:
+        return struct.unpack_from('>i', data, offset)[0], offset + 4
+    if tag == 0x05:
+        return struct.unpack_from('>q', data, offset)[0], offset + 8
+    if tag == 0x06:
+        return struct.unpack_from('>d', data, offset)[0], offset + 8
+    raise KeyError('unknown tag 0x%02x' % tag)
+
+
+codecs = {
+    'json': JSONCodec(),
+    'binary': BinaryCodec(),
+}
+
+def named(name):
+    """Returns the codec with the given name.
+
+    Raises ValueError if there's no such codec.
+    """
+    try:
+        return codecs[name]
+    except KeyError:
+        raise ValueError('unknown codec %r; pick one of %s' %
+                         (name, ', '.join(sorted(codecs))))
+
+
+#### Comparing codecs
+
+move_paths = {
+    'play_tile': 'tile_played',
+    'create_hotel': 'hotel_created',
+    'choose_survivor': 'survivor_chosen',
+    'disburse_shares': 'shares_disbursed',
+    'purchase': 'purchased',
+}
+
+def game_messages(seed, players=4, max_moves=1000):
+    """Play a game with random moves, and return the backend message about
+    each move, each with the whole game as it was after the move.
+    """
+    rng = random.Random(seed)
+    game = gametools.new_game(seed, seed)
+    for i in xrange(players):
+        gametools.add_player_named(game, 'player%d' % i)
+    gametools.start_game(game)
+    messages = []
+    while len(messages) < max_moves:
+        actions = list(gametools.legal_actions(game))
+        if not actions:
+            break
+        action = rng.choice(actions)
+        move = [action['action'], action['player']]
+        if action['action'] in ('create_hotel', 'choose_survivor'):
+            move.append(action['hotel'])
+        elif action['action'] == 'play_tile':
+            move.append(action['tile'])
+        elif action['action'] == 'disburse_shares':
+            move.append(dict((k, action[k])
+                             for k in ('hotel', 'trade', 'sell')))
+        elif action['action'] == 'purchase':
+            move.extend([action['order'], action['end_game']])
+        gametools.make_move(game, move)
+        message = dict((k, v) for k, v in action.iteritems()
+                              if k != 'action')
+        message.update(path=move_paths[action['action']], revision=1,
+                       game=json.loads(json.dumps(game)))
+        messages.append(message)
+    return messages
+
+def compare(messages, rounds=3):
+    """Returns, for each codec name, a tuple of the mean bytes per message and
+    the mean microseconds to encode and to decode one, best of rounds.
+    """
+    results = {}
+    for name, codec in sorted(codecs.iteritems()):
+        encoded = [codec.encode(m) for m in messages]
+        size = float(sum(map(len, encoded))) / len(messages)
+        encode_time = decode_time = float('inf')
+        for _ in xrange(rounds):
+            start = timer()
+            for message in messages:
+                codec.encode(message)
+            encode_time = min(encode_time, timer() - start)
+            start = timer()
+            for data in encoded:
+                codec.decode(data)
+            decode_time = min(decode_time, timer() - start)
+        results[name] = (size, encode_time * 1e6 / len(messages),
+                         decode_time * 1e6 / len(messages))
+    return results
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--games', type='int', default=20,
+                      help='number of games to take messages from')
+    parser.add_option('--seed', type='int', default=0,
+                      help='seed for the first game')
+    options, _ = parser.parse_args(argv)
+    messages = []
+    for seed in xrange(options.seed, options.seed + options.games):
+        messages.extend(game_messages(seed))
+    print '%d messages from %d games' % (len(messages), options.games)
+    print '%-8s %10s %12s %12s' % ('codec', 'bytes', 'encode us',
+                                   'decode us')
+    for name, (size, encode_us, decode_us) in sorted(
+            compare(messages).iteritems()):
+        print '%-8s %10.1f %12.1f %12.1f' % (name, size, encode_us,
+                                              decode_us)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+# Game updates as deltas. Rather than publish the whole game dict with every
+# message, the backend can send just what changed since the game's previous
+# revision, and frontends patch their copy of the game to match.
+#
+# A delta is always a dict, in one of these forms:
+#     {'=': value}                   the value was replaced outright.
+#     {'d': {key: delta}, 'r': keys} a dict had keys changed, added (as
+#                                    replacements) or removed ('r' is optional).
+#     {'x': indices, 'a': items}     a list lost the items at indices, then had
+#                                    items added to the end.
+#     {'i': {index: delta}}          a list of the same length had some of its
+#                                    dicts or lists changed in place.
+#     {}                             nothing changed.
+# Keys and indices are strings in 'd' and 'i' deltas so deltas can be sent as
+# JSON.
+
+
+def freeze(value):
+    """Returns a copy of value made of new dicts and lists, down to the
+    scalars.
+    """
+    if isinstance(value, dict):
+        return dict((k, freeze(v)) for k, v in value.iteritems())
+    if isinstance(value, list):
+        return [freeze(v) for v in value]
+    return value
+
+def track(old, new):
+    """Work out what changed from old to new. old must be a copy that nobody
+    else changes, like one from freeze or a previous call.
+
+    Returns a (delta, copy) pair, where delta is None if nothing changed, and
+    copy is a copy of new that shares whatever parts of old are unchanged.
+    """
+    if type(old) is type(new) and old == new:
+        # Most of a game stays put between revisions, and == finds that out 
+        # much faster than walking it.
+        return None, old
+    if isinstance(new, dict) and isinstance(old, dict):
+        changes = {}
+        copy = {}
+        for key, value in new.iteritems():
+            if key in old:
+                change, copy[key] = track(old[key], value)
+                if change is not None:
+                    changes[key] = change
+            else:
+                copy[key] = freeze(value)
+                changes[key] = {'=': copy[key]}
+        removed = [k for k in old if k not in new]
+        if not changes and not removed:
+            return None, old
+        delta = {'d': changes}
+        if removed:
+            delta['r'] = removed
+        return delta, copy
+    if isinstance(new, list) and isinstance(old, list):
+        if len(new) == len(old):
+            changes = {}
+            copy = []
+            for i, (before, after) in enumerate(zip(old, new)):
+                change, item = track(before, after)
+                copy.append(item)
+                if change is not None:
+                    changes[str(i)] = change
+            if all('=' not in c for c in changes.itervalues()):
+                return {'i': changes}, copy
+        removed, kept = spliced(old, new)
+        if kept:
+            added = freeze(new[len(kept):])
+            return {'x': removed, 'a': added}, kept + added
+    copy = freeze(new)
+    return {'=': copy}, copy
+
+def spliced(old, new):
+    """Match new against old as old with some items taken out and others put 
+    on the end. Returns the indices of the items of old taken out, and the 
+    list of those left.
+    """
+    removed = []
+    kept = []
+    i = 0
+    for after in new:
+        j = i
+        while j < len(old) and (type(old[j]) is not type(after) or 
+                                old[j] != after):
+            j += 1
+        if j == len(old):
+            break
+        removed.extend(xrange(i, j))
+        kept.append(old[j])
+        i = j + 1
+    removed.extend(xrange(i, len(old)))
+    return removed, kept
+
+def patch(old, delta):
+    """Returns old with delta applied. Anything delta doesn't change is shared
+    with old, and old itself is left alone.
+    """
+    if not delta:
+        return old
+    if '=' in delta:
+        return delta['=']
+    if 'd' in delta:
+        new = dict(old)
+        for key, change in delta['d'].iteritems():
+            new[key] = patch(old.get(key), change)
+        for key in delta.get('r', ()):
+            new.pop(key, None)
+        return new
+    if 'i' in delta:
+        new = list(old)
+        for index, change in delta['i'].iteritems():
+            new[int(index)] = patch(old[int(index)], change)
+        return new
+    removed = set(delta['x'])
+    return [v for i, v in enumerate(old) if i not in removed] + delta['a']
+
+
+class GameCache(object):
+    """A frontend's copies of the games it hears about, by game number, each
+    at the revision it was last seen.
+    """
+
+    def __init__(self):
+        self.games = {}
+        self.missing = set()
+
+    def resolve(self, message):
+        """Bring the cached copy of the message's game up to date, and make
+        sure the message has the whole game under 'game'.
+
+        Returns False if the message carries a delta that cannot be applied
+        because revisions were missed, or True otherwise.
+        """
+        if 'revision' not in message:
+            if (message.get('path') == 'game_over' or 
+                message.get('path') == 'lobby_game' and 
+                message.get('event') == 'remove'):
+                self.forget(message.get('game_number'))
+            return True
+        revision = message['revision']
+        if 'game' in message:
+            game = message['game']
+            self.games[game['number']] = (revision, game)
+            self.missing.discard(game['number'])
+            return True
+        number = message['game_number']
+        cached_revision, game = self.games.get(number, (None, None))
+        if cached_revision != revision - 1:
+            self.forget(number)
+            return False
+        game = patch(game, message['game_delta'])
+        self.games[number] = (revision, game)
+        message['game'] = game
+        return True
+
+    def request(self, number):
+        """Returns True if a snapshot of the numbered game should be asked for:
+        the first time it goes missing, but not again until it shows up.
+        """
+        if number in self.missing:
+            return False
+        self.missing.add(number)
+        return True
+
+    def forget(self, number):
+        """Stop keeping the numbered game."""
+        self.games.pop(number, None)
@@ -1,8 +1,10 @@
 # Game-manipulating functions. (Games are just dicts so they can be easily 
 # passed around and serialized and such.)
 
-from collections import defaultdict
-from random import choice, shuffle
+from itertools import combinations_with_replacement
+import random
+
+from acquire import board
 
 
 hotel_names = 'sackson zeta america fusion hydra quantum phoenix'.split()
@@ -21,11 +23,87 @@ class GamePlayNotAllowedError(GameError):
 
 #### Game creation
 
-def new_game(number=None):
-    """Factory for new games. Sets up the basic attributes."""
-    game = {'players': [], 'started': False, 'ended': False}
+class Game(dict):
+    """A game made by new_game. It is still just a dict, and serializes as 
+    one, but it can also hang on to state derived from its contents, and 
+    keeps the seed and moves that replay would need to make it again.
+    """
+    __slots__ = ('board', 'ledger', 'seed', 'moves', 'rng')
+    
+    def __init__(self, *args, **kwargs):
+        super(Game, self).__init__(*args, **kwargs)
+        self.board = None
+        self.ledger = None
+        self.seed = None
+        self.moves = []
+        self.rng = None
+
+def new_game(number=None, seed=None):
+    """Factory for new games. Sets up the basic attributes. Without a seed, 
+    one is picked at random.
+    """
+    game = Game(players=[], started=False, ended=False)
     if number is not None:
         game['number'] = number
+    game.seed = random.getrandbits(32) if seed is None else seed
+    return game
+
+
+#### Moves
+#
+# Every successful call that changes a game made by new_game is logged as a 
+# move: a tuple of the function's name and its arguments, with players, hotels 
+# and tiles given by name, and purchase orders and disbursements as tuples of 
+# (key, value) pairs. Games keep their moves for good, so moves share the 
+# strings the game already holds rather than copies of them. Any randomness in 
+# a move comes from a generator seeded with the game's seed and the number of 
+# moves before it, so replaying the moves from the same seed makes exactly the 
+# same game. The generator is thrown out once the move is logged.
+
+move_names = """add_player_named remove_player_named start_game play_tile 
+                create_hotel choose_survivor disburse_shares purchase 
+                force_game_over""".split()
+
+def log_move(game, *move):
+    """Append a move to the game's move log, if it keeps one."""
+    if isinstance(game, Game):
+        game.moves.append(move)
+        game.rng = None
+
+def rng_for(game):
+    """Returns the random number generator for the game's current move. Any 
+    game dict not made by new_game gets the random module itself.
+    """
+    if getattr(game, 'seed', None) is None:
+        return random
+    if game.rng is None:
+        game.rng = random.Random((game.seed << 32) + len(game.moves))
+    return game.rng
+
+def make_move(game, move):
+    """Make a logged move again. Returns whatever the move's function does.
+    
+    Raises GameError for a move that is not one of move_names.
+    """
+    name, args = move[0], list(move[1:])
+    if name not in move_names:
+        raise GameError('unknown move %r' % name)
+    if name not in ('add_player_named', 'remove_player_named', 'start_game', 
+                    'force_game_over'):
+        args[0] = player_named(game, args[0])
+    if name in ('create_hotel', 'choose_survivor'):
+        args[1] = hotel_named(game, args[1])
+    if name in ('disburse_shares', 'purchase'):
+        args[1] = dict(args[1])
+    return globals()[name](game, *args)
+
+def replay(seed, moves, number=None):
+    """Returns a new game made by making each of moves in order, starting from 
+    the given seed.
+    """
+    game = new_game(number, seed)
+    for move in moves:
+        make_move(game, move)
     return game
 
 
@@ -49,6 +127,7 @@ def add_player_named(game, player_name):
         raise GameAlreadyStartedError()
     if not player_named(game, player_name):
         game['players'].append({'name': player_name})
+        log_move(game, 'add_player_named', player_name)
 
 def remove_player_named(game, player_name):
     """If possible, remove the player named player_name from the game.
@@ -58,6 +137,17 @@ def remove_player_named(game, player_name):
     if game['started'] and not game['ended']:
         raise GameAlreadyStartedError()
     game['players'].remove(player_named(game, player_name))
+    log_move(game, 'remove_player_named', player_name)
+
+def lobby_summary(game):
+    """Returns what the lobby needs to know about a game: a dict of its number, 
+    its players' names, and whether it has started.
+    """
+    return {
+        'number': game['number'],
+        'players': [p['name'] for p in game['players']],
+        'started': game['started'],
+    }
 
 def host(game):
     """Returns the host player of the given game, or None if no players are in
@@ -100,9 +190,10 @@ def start_game(game):
         raise GameError('cannot start a game with no players')
     
     set_up_hotels(game)
+    rng = rng_for(game)
     
     game['tilebag'] = [str(i) + a for i in range(1, 13) for a in 'ABCDEFGHI']
-    shuffle(game['tilebag'])
+    rng.shuffle(game['tilebag'])
     
     # To figure out the starting player, everyone draws one tile from the bag 
     # and puts it on the board. The player who drew the tile closest to row A 
@@ -113,7 +204,7 @@ def start_game(game):
     starting_order = starting_tiles.keys()
     starting_order.sort(key=lambda t: t[-1] + t[:-1])
     starting_player = starting_tiles[starting_order[0]]
-    shuffle(game['players'])
+    rng.shuffle(game['players'])
     game['players'].remove(starting_player)
     game['players'].insert(0, starting_player)
     game['lonely_tiles'] = starting_order
@@ -130,6 +221,7 @@ def start_game(game):
     game['started'] = True
     for tile in starting_tiles:
         starting_tiles[tile] = starting_tiles[tile]['name']
+    log_move(game, 'start_game')
     return starting_tiles
 
 def set_up_hotels(game):
@@ -156,49 +248,71 @@ def adjacent_tiles(tile):
     adjacent.extend(str(col) + r for r in adjacent_rows)
     return adjacent
 
+def board_for(game):
+    """Returns the bitboard for the given game. Games made by new_game keep 
+    theirs between calls, rebuilding it only if their tile lists were replaced 
+    or resized since; any other game dict gets a fresh board.
+    """
+    cached = getattr(game, 'board', None)
+    if cached is not None and cached.watching(game):
+        return cached
+    fresh = board.Board.from_game(game)
+    if isinstance(game, Game):
+        game.board = fresh
+    return fresh
+
 def where_is_tile(game, tile):
     """Return one of the following, depending on what surrounds the tile:
         - None if the tile is off the board.
         - 'lonely' if the tile is on the board but in no hotels.
         - 'sackson' or 'zeta' or ... if the tile is in a hotel.
     """
-    if tile in game['lonely_tiles']:
-        return 'lonely'
-    return next((h['name'] for h in game['hotels'] if tile in h['tiles']), None)
+    cell = board.index(tile)
+    if cell is None:
+        return None
+    return board_for(game).where(cell)
 
 def tiles_that_create_hotels(game):
     """Return a list of tiles that, if played, would cause a new hotel to be 
     created.
     """
-    tiles = []
-    for on_board in game['lonely_tiles']:
-        for adjacent in adjacent_tiles(on_board):
-            if adjacent in game['lonely_tiles']:
-                continue
-            here_they_are = set(where_is_tile(game, t) 
-                                for t in adjacent_tiles(adjacent))
-            if here_they_are & set(hotel_names):
-                continue
-            tiles.append(adjacent)
-    return tiles
+    return board.tiles_in(board_for(game).creators)
 
 def grows_hotel(game, tile):
     """Returns the hotel that would grow if tile was played, or None if no such 
     hotel exists.
     """
-    nearby = set(where_is_tile(game, t) for t in adjacent_tiles(tile))
+    cell = board.index(tile)
+    if cell is None:
+        return None
+    nearby = board_for(game).hotels_adjacent(cell)
     return next((h for h in game['hotels'] if h['name'] in nearby), None)
 
 def tiles_that_merge_safe_hotels(game):
     """Return a list of tiles that are unplayable because, if played, they would
     merge a hotel that is safe.
     """
-    tiles = defaultdict(int)
-    for hotel in game['hotels']:
-        if hotel_safe(hotel): 
-            for tile in tiles_adjacent_to_hotel(hotel):
-                tiles[tile] += 1
-    return [t for t, i in tiles.iteritems() if i > 1]
+    return board.tiles_in(board_for(game).dead)
+
+def unplayable_tiles(game):
+    """Return a list of tiles that cannot be played right now: those that would 
+    merge safe hotels and, if every hotel is on the board, those that would 
+    create a hotel.
+    """
+    game_board = board_for(game)
+    unplayable = game_board.dead
+    if not hotels_off_board(game):
+        unplayable |= game_board.creators
+    return board.tiles_in(unplayable)
+
+def playable_tiles(game, player):
+    """Return the list of tiles in player's rack that can be played right now.
+    """
+    game_board = board_for(game)
+    unplayable = game_board.dead
+    if not hotels_off_board(game):
+        unplayable |= game_board.creators
+    return [t for t in player['rack'] if not board.bit(t) & unplayable]
 
 def merge_survivors(game, tile):
     """Returns a list of the possible surviving hotels that would be involved in
@@ -208,11 +322,40 @@ def merge_survivors(game, tile):
     adjacent_hotels = hotels_adjacent_to_tile(game, tile)
     if len(adjacent_hotels) < 2:
         return None
-    elif adjacent_hotels:
-        largest = max(map(lambda h: len(h['tiles']), adjacent_hotels))
-        return [h for h in adjacent_hotels if len(h['tiles']) == largest]
-    else:
-        return []
+    sizes = board_for(game).hotel_size
+    largest = max(sizes(h['name']) for h in adjacent_hotels)
+    return [h for h in adjacent_hotels if sizes(h['name']) == largest]
+
+
+#### Changing the board
+#
+# Tiles only ever get on to the board by way of these functions, which change a 
+# game's cached board in step with its tile lists. That way the board's dead 
+# and creation tiles are worked out once per change, not once per question.
+
+def place_lonely_tile(game, tile):
+    """Put tile on the board, in no hotel."""
+    game_board = board_for(game)
+    game['lonely_tiles'].append(tile)
+    game_board.place(board.index(tile))
+    game_board.watch(game)
+
+def add_to_hotel(game, hotel, tiles, absorbed=()):
+    """Put tiles in hotel, taking any that were lonely off of the lonely 
+    tiles. The tiles of any hotels in absorbed move into hotel too, taking 
+    those hotels off the board.
+    """
+    game_board = board_for(game)
+    mask = board.mask_of(tiles)
+    if mask & game_board.lonely:
+        game['lonely_tiles'][:] = [t for t in game['lonely_tiles'] 
+                                           if not board.bit(t) & mask]
+    for other in absorbed:
+        hotel['tiles'].extend(other['tiles'])
+        other['tiles'] = []
+    hotel['tiles'].extend(tiles)
+    game_board.grow(hotel['name'], mask)
+    game_board.watch(game)
 
 
 #### Hotels
@@ -224,9 +367,84 @@ def hotel_named(game, hotel_name):
     """
     return next((h for h in game['hotels'] if h['name'] == hotel_name), None)
 
+class Shares(dict):
+    """A player's shares: a dict of hotel name to number of shares held, which 
+    keeps its ledger's bank counts right whenever a number is set.
+    """
+    __slots__ = ('ledger',)
+    
+    def __init__(self, ledger, *args, **kwargs):
+        super(Shares, self).__init__(*args, **kwargs)
+        self.ledger = ledger
+    
+    def __setitem__(self, hotel_name, shares):
+        bank = self.ledger.bank
+        if hotel_name in bank:
+            bank[hotel_name] -= shares - self.get(hotel_name, 0)
+        super(Shares, self).__setitem__(hotel_name, shares)
+    
+    def __reduce__(self):
+        # Copies are plain dicts; the ledger belongs to the original game.
+        return (dict, (dict(self),))
+
+class ShareLedger(object):
+    """The shares of one started game made by new_game: a row of Shares per 
+    player, in player order, and the number of shares of each hotel left in 
+    the bank.
+    """
+    __slots__ = ('rows', 'bank')
+    
+    def __init__(self, players):
+        """A new ledger for the given list of player dicts, whose shares dicts 
+        are swapped for rows of the ledger.
+        """
+        self.bank = dict.fromkeys(hotel_names, 25)
+        self.rows = []
+        for player in players:
+            row = Shares(self, player['shares'])
+            for hotel_name, shares in row.iteritems():
+                if hotel_name in self.bank:
+                    self.bank[hotel_name] -= shares
+            player['shares'] = row
+            self.rows.append(row)
+    
+    def keeping(self, game):
+        """Returns True if this ledger's rows are still the shares of the 
+        game's players, in order.
+        """
+        players = game['players']
+        return len(players) == len(self.rows) and all(
+            p['shares'] is row for p, row in zip(players, self.rows))
+
+class ScannedShares(object):
+    """What a ShareLedger knows, worked out afresh from the players of a plain 
+    game dict, which are left as they are.
+    """
+    __slots__ = ('rows', 'bank')
+    
+    def __init__(self, players):
+        self.rows = [p['shares'] for p in players]
+        self.bank = dict.fromkeys(hotel_names, 25)
+        for row in self.rows:
+            for hotel_name, shares in row.iteritems():
+                if hotel_name in self.bank:
+                    self.bank[hotel_name] -= shares
+
+def ledger_for(game):
+    """Returns the share ledger for the given started game. Games made by 
+    new_game keep theirs for as long as their players' shares stay put; any 
+    other game dict has its players' shares counted up again, untouched.
+    """
+    if not isinstance(game, Game):
+        return ScannedShares(game['players'])
+    ledger = game.ledger
+    if ledger is None or not ledger.keeping(game):
+        ledger = game.ledger = ShareLedger(game['players'])
+    return ledger
+
 def bank_shares(game, hotel):
     """Returns the number of shares in the bank for the given hotel."""
-    return 25 - sum(p['shares'].get(hotel['name'], 0) for p in game['players'])
+    return ledger_for(game).bank[hotel['name']]
 
 def share_price(hotel):
     """Returns the price per share of hotel."""
@@ -257,21 +475,16 @@ def tiles_adjacent_to_hotel(hotel):
     """Returns the set of tiles that are adjacent to, but not in, the given 
     hotel.
     """
-    tiles = set()
-    for tile in hotel['tiles']:
-        for adjacent in adjacent_tiles(tile):
-            if adjacent not in hotel['tiles']:
-                tiles.add(adjacent)
-    return tiles
+    mask = board.mask_of(hotel['tiles'])
+    return set(board.tiles_in(board.spread(mask) & ~mask))
 
 def hotels_adjacent_to_tile(game, tile):
     """Returns the list of hotels with a tile adjacent to the given tile."""
-    adjacent_hotel_names = set()
-    for adjacent in adjacent_tiles(tile):
-        location = where_is_tile(game, adjacent)
-        if location in hotel_names:
-            adjacent_hotel_names.add(location)
-    return [hotel_named(game, name) for name in adjacent_hotel_names]
+    cell = board.index(tile)
+    if cell is None:
+        return []
+    nearby = board_for(game).hotels_adjacent(cell)
+    return [h for h in game['hotels'] if h['name'] in nearby]
 
 def hotels_off_board(game):
     """Returns the list of hotels that are not on the board in the given game.
@@ -325,9 +538,12 @@ def play_tile(game, player, tile):
     given player.
     """
     ensure_action(game, 'play_tile', player)
-    if tile in tiles_that_merge_safe_hotels(game):
+    game_board = board_for(game)
+    tile_bit = board.bit(tile)
+    if tile_bit & game_board.dead:
         raise GamePlayNotAllowedError('tile %s is unplayable' % tile)
-    if not hotels_off_board(game) and tile in tiles_that_create_hotels(game):
+    creates_hotel = tile_bit & game_board.creators
+    if creates_hotel and not hotels_off_board(game):
         raise GamePlayNotAllowedError('cannot create hotel when all are '
                                       'already on board')
     if tile not in player['rack']:
@@ -336,7 +552,7 @@ def play_tile(game, player, tile):
     game['action_queue'].pop(0)
     
     stock_market_shares = None
-    if tile in tiles_that_create_hotels(game):
+    if creates_hotel:
         append_action(game, 'create_hotel', player, creation_tile=tile)
     else:
         survivors = merge_survivors(game, tile) or []
@@ -352,17 +568,67 @@ def play_tile(game, player, tile):
         else:
             hotel = grows_hotel(game, tile)
             if hotel:
-                hotel['tiles'].append(tile)
-                for t in adjacent_tiles(tile):
-                    if t in game['lonely_tiles']:
-                        hotel['tiles'].append(t)
-                        game['lonely_tiles'].remove(t)
+                cluster = game_board.lonely_cluster(board.index(tile))
+                add_to_hotel(game, hotel, [tile] + board.tiles_in(cluster))
             else:
-                game['lonely_tiles'].append(tile)
+                place_lonely_tile(game, tile)
             advance_turn(game, player)
+    log_move(game, 'play_tile', player['name'], 
+             board.tile_names[board.index(tile)])
     return stock_market_shares
 
 
+def preview_play_tile(game, player, tile):
+    """Work out what would happen if player played tile, without changing the 
+    game. Turn order is not checked, so any player can look ahead.
+    
+    Returns a dict whose 'result' is one of:
+        - 'lonely': the tile would sit on its own.
+        - 'grow': 'hotel' would grow to 'size' tiles.
+        - 'create': a hotel of 'size' tiles would be founded; 'hotels' lists 
+          the names of those available.
+        - 'merge': 'survivors' lists the names of the hotels that could 
+          survive, and 'bonuses' maps the name of each hotel that could 
+          disappear to a dict of player name to bonus. In a two-player game 
+          the stock market's share of bonuses depends on a tile drawn during 
+          the merge, so bonuses there leave it out and 'stock_market' is True.
+    
+    Raises GamePlayNotAllowedError if the tile could not be played.
+    """
+    game_board = board_for(game)
+    tile_bit = board.bit(tile)
+    if tile_bit & game_board.dead:
+        raise GamePlayNotAllowedError('tile %s is unplayable' % tile)
+    if tile not in player['rack']:
+        raise GamePlayNotAllowedError('must play tiles from tile rack')
+    cell = board.index(tile)
+    joining = 1 + board.size(game_board.lonely_cluster(cell))
+    if tile_bit & game_board.creators:
+        available = [h['name'] for h in hotels_off_board(game)]
+        if not available:
+            raise GamePlayNotAllowedError('cannot create hotel when all are '
+                                          'already on board')
+        return {'result': 'create', 'size': joining, 'hotels': available}
+    adjacent = hotels_adjacent_to_tile(game, tile)
+    if not adjacent:
+        return {'result': 'lonely'}
+    if len(adjacent) == 1:
+        hotel = adjacent[0]['name']
+        return {'result': 'grow', 'hotel': hotel, 
+                'size': game_board.hotel_size(hotel) + joining}
+    survivors = [h['name'] for h in merge_survivors(game, tile)]
+    rows = zip(game['players'], ledger_for(game).rows)
+    bonuses = {}
+    for hotel in adjacent:
+        if survivors == [hotel['name']]:
+            continue
+        holdings = [(row[hotel['name']], p['name']) for p, row in rows]
+        paid = merge_bonuses(holdings, share_price(hotel))
+        bonuses[hotel['name']] = dict(paid)
+    return {'result': 'merge', 'survivors': survivors, 'bonuses': bonuses, 
+            'stock_market': len(game['players']) == 2}
+
+
 #### Creating hotels
 
 def create_hotel(game, player, hotel):
@@ -377,19 +643,14 @@ def create_hotel(game, player, hotel):
                                       'creation tile')
     if hotel not in hotels_off_board(game):
         raise GamePlayNotAllowedError('must create hotel that is off the board')
-    hotel['tiles'] = [first_action['creation_tile']]
-    any_added = True
-    while any_added:
-        any_added = False
-        for tile in tiles_adjacent_to_hotel(hotel):
-            if tile in game['lonely_tiles']:
-                hotel['tiles'].append(tile)
-                game['lonely_tiles'].remove(tile)
-                any_added = True
+    creation_tile = first_action['creation_tile']
+    cluster = board_for(game).lonely_cluster(board.index(creation_tile))
+    add_to_hotel(game, hotel, [creation_tile] + board.tiles_in(cluster))
     if bank_shares(game, hotel):
         player['shares'][hotel['name']] += 1
     game['action_queue'].pop(0)
     advance_turn(game, player)
+    log_move(game, 'create_hotel', player['name'], hotel['name'])
 
 
 #### Merging hotels
@@ -407,57 +668,72 @@ def choose_survivor(game, player, survivor):
                                       (first_action['choices'],
                                        survivor['name']))
     game['action_queue'].pop(0)
-    return merge_hotels(game, player, first_action['tile'], survivor)
+    stock_market_tiles = merge_hotels(game, player, first_action['tile'], 
+                                      survivor)
+    log_move(game, 'choose_survivor', player['name'], survivor['name'])
+    return stock_market_tiles
 
 def pay_merge_bonuses(game, hotels):
     """For each hotel in hotels, compute and pay out the majority and minority 
     shareholder bonuses. If there are only two players, the stock market also 
     partakes.
     """
-    nearest_hundred_floor = lambda i: i - i % 100
     two_players = len(game['players']) == 2
+    rows = zip(game['players'], ledger_for(game).rows)
     stock_market_tiles = {}
     for hotel in hotels:
-        shares_held_by = lambda p: p['shares'][hotel['name']]
-        shares_held = set(shares_held_by(p) for p in game['players'])
-        stock_market = None
+        holdings = [(row[hotel['name']], p) for p, row in rows]
         if two_players and game['tilebag']:
-            random_tile = choice(game['tilebag'])
-            stock_market = int(random_tile[:-1])
-            shares_held.add(stock_market)
+            random_tile = rng_for(game).choice(game['tilebag'])
+            holdings.append((int(random_tile[:-1]), {'cash': 0}))
             stock_market_tiles[hotel['name']] = random_tile
-        most_held = max(shares_held)
-        if len(shares_held) > 1:
-            next_most_held = max(shares_held - set([most_held]))
-        else:
-            next_most_held = None
-        majority_holders = [p for p in game['players']
-                                    if shares_held_by(p) == most_held]
-        if most_held == stock_market:
-            majority_holders.append({'cash': 0})
-        minority_holders = [p for p in game['players'] 
-                                    if next_most_held and 
-                                       shares_held_by(p) == next_most_held]
-        if next_most_held and next_most_held == stock_market:
-            minority_holders.append({'cash': 0})
-        majority_bonus = share_price(hotel) * 10
-        minority_bonus = majority_bonus / 2
-        if len(majority_holders) > 1:
-            bonus = (majority_bonus + minority_bonus) / len(majority_holders)
-            majority_bonus = nearest_hundred_floor(bonus)
-            minority_bonus = 0
-        elif majority_holders:
-            if len(minority_holders) > 1:
-                bonus = minority_bonus / len(minority_holders)
-                minority_bonus = nearest_hundred_floor(bonus)
-            elif not minority_holders:
-                majority_bonus += minority_bonus
-        for p in majority_holders:
-            p['cash'] += majority_bonus
-        for p in minority_holders:
-            p['cash'] += minority_bonus
+        for holder, bonus in merge_bonuses(holdings, share_price(hotel)):
+            holder['cash'] += bonus
     return stock_market_tiles
 
+def merge_bonuses(holdings, price):
+    """Given a list of (shares, holder) pairs for a hotel whose shares cost 
+    price, return a list of (holder, bonus) pairs for the majority and 
+    minority shareholders.
+    """
+    nearest_hundred_floor = lambda i: i - i % 100
+    majority_holders, minority_holders = shareholders(holdings)
+    majority_bonus = price * 10
+    minority_bonus = majority_bonus / 2
+    if len(majority_holders) > 1:
+        bonus = (majority_bonus + minority_bonus) / len(majority_holders)
+        majority_bonus = nearest_hundred_floor(bonus)
+        minority_bonus = 0
+    elif majority_holders:
+        if len(minority_holders) > 1:
+            bonus = minority_bonus / len(minority_holders)
+            minority_bonus = nearest_hundred_floor(bonus)
+        elif not minority_holders:
+            majority_bonus += minority_bonus
+    return ([(h, majority_bonus) for h in majority_holders] + 
+            [(h, minority_bonus) for h in minority_holders])
+
+def shareholders(holdings):
+    """Given a list of (shares, holder) pairs, return the list of holders with 
+    the most shares and the list of holders with the next most shares, in one 
+    pass. Nobody gets to be a minority holder of zero shares.
+    """
+    most = next_most = None
+    majority, minority = [], []
+    for shares, holder in holdings:
+        if most is None or shares > most:
+            next_most, minority = most, majority
+            most, majority = shares, [holder]
+        elif shares == most:
+            majority.append(holder)
+        elif next_most is None or shares > next_most:
+            next_most, minority = shares, [holder]
+        elif shares == next_most:
+            minority.append(holder)
+    if not next_most:
+        minority = []
+    return majority, minority
+
 def merge_hotels(game, merging_player, tile, survivor):
     """Merge all hotels adjacent to the given tile into survivor, paying out 
     bonuses as appropriate, then queue actions on the game's action queue for 
@@ -515,6 +791,10 @@ def disburse_shares(game, player, disbursement):
     game['action_queue'].pop(0)
     if not game['action_queue']:
         clean_up_merge(game)
+    logged = [('hotel', from_hotel['name'])]
+    logged.extend((key, disbursement[key]) for key in ('sell', 'trade') 
+                                           if key in disbursement)
+    log_move(game, 'disburse_shares', player['name'], tuple(logged))
     return survivor
 
 def clean_up_merge(game):
@@ -528,14 +808,9 @@ def clean_up_merge(game):
     del game['merge_info']
     disappearing = [h for h in hotels_adjacent_to_tile(game, merge_tile) 
                             if h != survivor]
-    for hotel in disappearing:
-        survivor['tiles'].extend(hotel['tiles'])
-        hotel['tiles'] = []
-    survivor['tiles'].append(merge_tile)
-    for tile in adjacent_tiles(merge_tile):
-        if tile in game['lonely_tiles']:
-            survivor['tiles'].append(tile)
-            game['lonely_tiles'].remove(tile)
+    cluster = board_for(game).lonely_cluster(board.index(merge_tile))
+    add_to_hotel(game, survivor, [merge_tile] + board.tiles_in(cluster), 
+                 disappearing)
     advance_turn(game, merging_player)
 
 
@@ -572,10 +847,14 @@ def purchase(game, player, purchase_order, end_game=False):
         player['shares'][hotel_name] += shares
     player['cash'] -= subtotal
     game['action_queue'].pop(0)
+    stock_market_tiles = None
     if end_game and game_can_end(game):
-        return game_over(game)
+        stock_market_tiles = game_over(game)
     else:
         advance_turn(game, player, can_purchase=False)
+    log_move(game, 'purchase', player['name'], 
+             tuple(sorted(purchases.iteritems())), bool(end_game))
+    return stock_market_tiles
 
 
 #### End of turn
@@ -597,16 +876,151 @@ def advance_turn(game, player, can_purchase=True):
                player['cash'] > share_price(hotel):
                 append_action(game, 'purchase', player)
                 return
-    for tile in list(player['rack']):
-        if tile in tiles_that_merge_safe_hotels(game):
-            player['rack'].remove(tile)
+    dead = board_for(game).dead
+    player['rack'][:] = [t for t in player['rack'] if not board.bit(t) & dead]
     while len(player['rack']) < 6 and game['tilebag']:
         tile = game['tilebag'].pop()
-        if tile not in tiles_that_merge_safe_hotels(game):
+        if not board.bit(tile) & dead:
             player['rack'].append(tile)
     append_action(game, 'play_tile', player_after(game, player))
 
 
+#### Legal actions
+#
+# Everything the player at the head of the action queue is allowed to do, as 
+# dicts with the same keys as the backend's messages for those actions.
+
+def legal_actions(game):
+    """Yield each action that could be taken next in the given started game. 
+    Each is a dict with 'action' and 'player' keys, plus:
+        - play_tile: 'tile'.
+        - create_hotel: 'hotel', a hotel name.
+        - choose_survivor: 'hotel', a hotel name.
+        - disburse_shares: 'hotel', 'trade' (always even) and 'sell'.
+        - purchase: 'order', a dict of hotel name to shares, and 'end_game'.
+    Nothing is yielded once the game has ended.
+    """
+    if game['ended'] or not game['action_queue']:
+        return
+    first_action = game['action_queue'][0]
+    action_name = first_action['action']
+    player = player_named(game, first_action['player'])
+    legal = dict(action=action_name, player=player['name'])
+    if action_name == 'play_tile':
+        for tile in playable_tiles(game, player):
+            yield dict(legal, tile=tile)
+    elif action_name == 'create_hotel':
+        for hotel in hotels_off_board(game):
+            yield dict(legal, hotel=hotel['name'])
+    elif action_name == 'choose_survivor':
+        for hotel_name in first_action['choices']:
+            yield dict(legal, hotel=hotel_name)
+    elif action_name == 'disburse_shares':
+        held = player['shares'][first_action['hotel']]
+        survivor = hotel_named(game, game['merge_info']['survivor'])
+        most_traded = min(held / 2, bank_shares(game, survivor)) * 2
+        for trade in xrange(0, most_traded + 1, 2):
+            for sell in xrange(held - trade + 1):
+                yield dict(legal, hotel=first_action['hotel'], trade=trade, 
+                           sell=sell)
+    elif action_name == 'purchase':
+        end_game_choices = [False, True] if game_can_end(game) else [False]
+        for order in purchase_orders(game, player):
+            for end_game in end_game_choices:
+                yield dict(legal, order=order, end_game=end_game)
+
+def default_action(game):
+    """Returns what to do for a player who's run out of time: play their
+    first playable tile, create the first hotel off the board, pick the first
+    survivor offered, keep all their shares, or buy nothing and leave the game
+    going. Returns None if there's nothing they can do.
+    """
+    return next(legal_actions(game), None)
+
+def purchase_orders(game, player):
+    """Returns the list of purchase orders player could afford right now, 
+    including the empty order.
+    """
+    ledger = ledger_for(game)
+    prices = dict((h['name'], share_price(h)) for h in hotels_on_board(game) 
+                                              if ledger.bank[h['name']])
+    orders = []
+    for count in xrange(4):
+        for names in combinations_with_replacement(sorted(prices), count):
+            order = {}
+            for name in names:
+                order[name] = order.get(name, 0) + 1
+            if (sum(prices[n] for n in names) <= player['cash'] and 
+                    all(ledger.bank[n] >= order[n] for n in order)):
+                orders.append(order)
+    return orders
+
+
+#### Trying things out
+#
+# Snapshots let bots and hints play a move, look at the result, and put things 
+# back, without paying for a deepcopy of the game.
+
+class Snapshot(object):
+    """Everything about a game that playing it can change."""
+    __slots__ = ('game', 'lists', 'hotels', 'players', 'board', 'ledger', 
+                 'bank', 'moves')
+
+def snapshot(game):
+    """Returns a snapshot of the given started game, for restore."""
+    snap = Snapshot()
+    snap.game = dict((k, v) for k, v in game.iteritems() 
+                            if not isinstance(v, (list, dict)))
+    snap.lists = {}
+    for key in ('tilebag', 'lonely_tiles'):
+        snap.lists[key] = tuple(game[key])
+    snap.lists['action_queue'] = tuple(dict(a) for a in game['action_queue'])
+    if 'merge_info' in game:
+        snap.lists['merge_info'] = dict(game['merge_info'])
+    snap.hotels = [(h, tuple(h['tiles'])) for h in game['hotels']]
+    ledger = ledger_for(game)
+    snap.players = [(p, tuple(p['rack']), p['shares'], dict(p['shares']), 
+                     p['cash']) for p in game['players']]
+    snap.board = board_for(game).copy()
+    snap.ledger = ledger
+    snap.bank = dict(ledger.bank)
+    snap.moves = len(getattr(game, 'moves', ()))
+    return snap
+
+def restore(game, snap):
+    """Put the game back the way it was when the snapshot was taken. The same 
+    snapshot can be restored any number of times.
+    
+    The game's player and hotel dicts stay the same objects, so references to 
+    them held elsewhere remain good.
+    """
+    game.update(snap.game)
+    for key in ('tilebag', 'lonely_tiles'):
+        game[key] = list(snap.lists[key])
+    game['action_queue'] = [dict(a) for a in snap.lists['action_queue']]
+    if 'merge_info' in snap.lists:
+        game['merge_info'] = dict(snap.lists['merge_info'])
+    elif 'merge_info' in game:
+        del game['merge_info']
+    for hotel, tiles in snap.hotels:
+        hotel['tiles'] = list(tiles)
+    for player, rack, shares, held, cash in snap.players:
+        player['rack'] = list(rack)
+        # Set the numbers behind the ledger's back; the bank is put back whole.
+        dict.clear(shares)
+        dict.update(shares, held)
+        player['shares'] = shares
+        player['cash'] = cash
+    snap.ledger.bank = dict(snap.bank)
+    restored_board = snap.board.copy()
+    restored_board.watch(game)
+    if isinstance(game, Game):
+        game.board = restored_board
+        game.ledger = snap.ledger
+        del game.moves[snap.moves:]
+        game.rng = None
+
+
 #### End of game
 
 def game_can_end(game):
@@ -619,15 +1033,16 @@ def game_can_end(game):
     else:
         return False
 
-def game_over(game):
+def game_over(game, forced=False):
     """Attempt to end the game, paying out final bonuses and selling as many 
-    shares as possible.
+    shares as possible. If forced is True, the end-game conditions needn't be 
+    met.
     
     Raises GamePlayNotAllowedError if the game cannot end right now.
     """
     if game['ended']:
         raise GamePlayNotAllowedError('game is already over')
-    if not game_can_end(game):
+    if not forced and not game_can_end(game):
         raise GamePlayNotAllowedError('neither end-game condition met')
     stock_market_shares = {}
     for hotel in hotels_on_board(game):
@@ -640,6 +1055,18 @@ def game_over(game):
     game['ended'] = True
     return stock_market_shares
 
+def force_game_over(game):
+    """End a started game now, whether or not it could end by the rules, 
+    paying out as game_over does. For stopping a game that's going nowhere.
+    
+    Raises GamePlayNotAllowedError if the game hasn't started or is over.
+    """
+    if not game['started']:
+        raise GamePlayNotAllowedError('game has not started')
+    stock_market_tiles = game_over(game, forced=True)
+    log_move(game, 'force_game_over')
+    return stock_market_tiles
+
 def winners(game):
     """Return the list of players who won this game."""
     winning_cash = max(map(lambda p: p['cash'], game['players']))
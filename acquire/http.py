@@ -2,11 +2,16 @@ import logging
 import sys
 import zmq
 from mongrel2.handler import Connection, CTX
+from timeit import default_timer as timer
 
-broadcast_messages = """logged_in lobby_chat games_list started_game joined_game 
-                        left_game game_over logged_out""".split()
+from acquire import codec, profiling, stats, topics
+from acquire.delta import GameCache
+from acquire.timers import Timers
+
+broadcast_messages = """logged_in lobby_chat games_list lobby_game started_game 
+                        joined_game left_game game_over logged_out""".split()
 game_messages = """play_game tile_played hotel_created survivor_chosen 
-                   shares_disbursed purchased""".split()
+                   shares_disbursed purchased game_snapshot""".split()
 
 class Mongrel2Handler(object):
     """A Mongrel2 handler for Acquire."""
@@ -18,44 +23,75 @@ class Mongrel2Handler(object):
         self.clients = {}
         self.names = {}
         self.logging_in = {}
+        self.games = GameCache()
+        self.player_games = {}
         self.log = logging.getLogger('http')
         self.log.setLevel(logging.DEBUG)
         self.log.addHandler(logging.StreamHandler())
+        self.stats = stats.Stats('acquire_http')
+        self.timers = Timers(log=self.log)
+        self.profiler = profiling.Profiler('acquire_http', self.timers)
     
     def run(self, backend_push_address="tcp://127.0.0.1:27183", 
-            backend_sub_address="tcp://127.0.0.1:16180"):
-        """Start the handler listening indefinitely."""
+            backend_sub_address="tcp://127.0.0.1:16180", codec_name='json', 
+            stats_address=None):
+        """Start the handler listening indefinitely, talking to the backend 
+        with the codec named codec_name. Browsers still get JSON. If 
+        stats_address is given, a REP socket there answers stats requests and 
+        profile commands (see the stats and profiling modules).
+        """
+        self.codec = codec.named(codec_name)
         self.backend_push = CTX.socket(zmq.PUSH)
         self.backend_push.connect("tcp://127.0.0.1:27183")
         self.backend_sub = CTX.socket(zmq.SUB)
         self.backend_sub.connect("tcp://127.0.0.1:16180")
-        self.backend_sub.setsockopt(zmq.SUBSCRIBE, '')
+        self.subscriptions = topics.Subscriptions(self.backend_sub)
+        self.subscriptions.add(topics.lobby)
         
         poller = zmq.Poller()
         poller.register(self.backend_sub, zmq.POLLIN)
         poller.register(self.conn.reqs, zmq.POLLIN)
         poller.register(sys.stdin, zmq.POLLIN)
+        stats_socket = None
+        if stats_address:
+            stats_socket = CTX.socket(zmq.REP)
+            stats_socket.bind(stats_address)
+            poller.register(stats_socket, zmq.POLLIN)
         
         print "Acquire mongrel2 handler is up. Press CTRL-D to exit."
         
         while True:
-            ready = [a for a, _ in poller.poll()]
+            ready = [a for a, _ in poller.poll(self.timers.timeout())]
             if self.conn.reqs in ready:
                 try:
                     req = self.conn.recv_json()
                     if 'path' in req.data:
+                        start = timer()
                         self.client_message(req, req.data)
+                        self.profiler.handled('client_message', 
+                                              timer() - start)
                 except Exception:
                     self.log.exception('failed reading client message:')
             if self.backend_sub in ready:
-                try:
-                    self.backend_message(self.backend_sub.recv_json())
-                except Exception:
-                    self.log.exception('failed reading backend message')
+                # A topic frame, then one or more messages.
+                parts = self.backend_sub.recv_multipart()
+                if parts[0] not in self.subscriptions:
+                    continue
+                for part in parts[1:]:
+                    start = timer()
+                    try:
+                        self.backend_message(self.codec.decode(part))
+                    except Exception:
+                        self.log.exception('failed reading backend message')
+                    self.profiler.handled('backend_message', timer() - start)
             if sys.stdin.fileno() in ready:
                 for _ in sys.stdin:
                     pass
                 sys.exit(0)
+            if stats_socket in ready:
+                self.stats.answer(stats_socket, 
+                                  {'profile': self.profiler.command})
+            self.timers.run_due()
     
     def client_message(self, req, message):
         path = message['path']
@@ -63,12 +99,20 @@ class Mongrel2Handler(object):
             message.update({'player': self.clients[req.conn_id]})
         elif path == 'login':
             self.logging_in[message['player']] = req.conn_id
+            self.subscriptions.add(topics.player(message['player']))
         else:
             print 'unknown client sending non-login message'
             return
-        self.backend_push.send_json(message)
+        self.send_to_backend(message)
     
     def backend_message(self, message):
+        if not self.games.resolve(message):
+            if self.games.request(message['game_number']):
+                self.send_to_backend({
+                    'path': 'game_snapshot', 
+                    'game_number': message['game_number'],
+                })
+            return
         path = message['path']
         if path == 'logged_in':
             name = message['player']
@@ -77,12 +121,24 @@ class Mongrel2Handler(object):
                 del self.logging_in[name]
                 self.clients[conn_id] = name
                 self.names[name] = conn_id
+                if message['game']:
+                    self.follow_game(name, message['game'])
+        elif path in ('started_game', 'joined_game'):
+            if message['player'] in self.names:
+                self.follow_game(message['player'], message['game'])
+        elif path == 'left_game':
+            self.unfollow_game(message['player'])
+        elif path == 'lobby_game' and message['event'] == 'remove':
+            for name, number in self.player_games.items():
+                if number == message['game_number']:
+                    self.unfollow_game(name)
         elif path == 'duplicate_name':
             name = message['player']
             if name in self.logging_in:
                 conn_id = self.logging_in[name]
                 self.conn.deliver_json(self.sender_id, [conn_id], message)
                 del self.logging_in[name]
+                self.subscriptions.discard(topics.player(name))
                 return
         elif path == 'logged_out':
             name = message['player']
@@ -90,11 +146,14 @@ class Mongrel2Handler(object):
                 conn_id = self.names[name]
                 del self.names[name]
                 del self.clients[conn_id]
-        elif path == 'games_list':
-            for game in message['games_list']:
-                for player in game['players']:
-                    if 'rack' in player:
-                        del player['rack']
+                self.subscriptions.discard(topics.player(name))
+                self.unfollow_game(name)
+        if message.get('game'):
+            # The game may be kept for patching later, so leave it be.
+            message['game'] = dict(message['game'])
+            message['game']['players'] = [dict(p) for p in 
+                                          message['game'].get('players', [])]
+            message.pop('game_delta', None)
         if path in broadcast_messages:
             self.conn.deliver_json(self.sender_id, self.clients.keys(), message)
         elif path in game_messages:
@@ -125,6 +184,22 @@ class Mongrel2Handler(object):
         else:
             print 'cannot deliver message'
     
+    def send_to_backend(self, message):
+        """Send message to the backend."""
+        self.backend_push.send(self.codec.encode(message))
+    
+    def follow_game(self, name, game):
+        """Subscribe to messages about game on behalf of the named player."""
+        self.unfollow_game(name)
+        self.player_games[name] = game['number']
+        self.subscriptions.add(topics.game(game['number']))
+    
+    def unfollow_game(self, name):
+        """Drop the named player's reason for hearing about their game."""
+        number = self.player_games.pop(name, None)
+        if number is not None:
+            self.subscriptions.discard(topics.game(number))
+
 
 if __name__ == '__main__':
     Mongrel2Handler('test').run()
@@ -0,0 +1,235 @@
+# Keep games on disk so a backend can pick up where it left off. Every move
+# made in a game is appended to a log as a line of JSON, and every so often all
+# the games are written out as a snapshot, in the compact form from the model
+# module, and the log starts over. Restoring loads the latest snapshot and
+# makes the moves logged since.
+#
+# Writing a snapshot takes seconds for thousands of games, so it's done by a
+# forked child working from its copy of the games, while the backend goes on
+# logging. The log up to the snapshot is set aside as PATH.log.old until the
+# snapshot is safely in place, and replayed along with PATH.log if it isn't.
+#
+# Log lines are [sequence number, game number, event], where event is one of:
+#     ['new', seed]   the game was made by new_game with the given seed.
+#     ['drop']        the game was done with and forgotten.
+#     a move          a move from the game's move log (see gametools).
+# The snapshot notes the last sequence number it includes, so lines that made
+# it into a snapshot are skipped even if the log wasn't cleared after it.
+
+import cPickle as pickle
+import gc
+import json
+import os
+
+from acquire import gametools, model
+
+
+class Journal(object):
+    """The log and snapshot files for the games of one backend, both named
+    after path. A snapshot is taken once snapshot_every events have been
+    logged since the last one.
+    """
+
+    def __init__(self, path, snapshot_every=10000):
+        self.log_path = path + '.log'
+        self.old_log_path = path + '.log.old'
+        self.snapshot_path = path + '.snapshot'
+        self.snapshot_every = snapshot_every
+        self.games = {}
+        self.written = {}
+        self.changed = set()
+        self.dropped = []
+        self.sequence = 0
+        self.last_number = 0
+        self.logged = 0
+        self.log_file = None
+        self.writer = None
+
+    def restore(self):
+        """Load the games from the latest snapshot and the log since. Returns
+        the games, in order of game number.
+        """
+        # Nothing made here is garbage, so don't keep looking for some.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._restore()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _restore(self):
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = pickle.load(f)
+            self.sequence = snapshot['sequence']
+            self.last_number = snapshot['last_number']
+            for compact in snapshot['games']:
+                game = compact.to_dict()
+                self.games[game['number']] = game
+        # Lines can turn up in both logs, if a crash came while the set-aside 
+        # log was being added to; each is made once, in order.
+        for path in (self.old_log_path, self.log_path):
+            if os.path.exists(path):
+                self.replay_log(path)
+        for number, game in self.games.iteritems():
+            self.written[number] = len(game.moves)
+        self.log_file = open(self.log_path, 'ab')
+        return [self.games[n] for n in sorted(self.games)]
+
+    def replay_log(self, path):
+        """Make the events logged at path since the last one made."""
+        with open(path, 'r+b') as f:
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line.endswith('\n'):
+                    # Cut off partway through writing, if not empty. Nothing 
+                    # after it was flushed, so it can go.
+                    f.truncate(offset)
+                    break
+                sequence, number, event = json.loads(line)
+                if sequence > self.sequence:
+                    self.apply(number, event)
+                    self.sequence = sequence
+                    self.logged += 1
+
+    def apply(self, number, event):
+        """Make a logged event happen again."""
+        if event[0] == 'new':
+            self.games[number] = gametools.new_game(number, event[1])
+            self.last_number = max(self.last_number, number)
+        elif event[0] == 'drop':
+            self.games.pop(number, None)
+        else:
+            gametools.make_move(self.games[number], event)
+
+    def record(self, game):
+        """Note that game has been made or changed, to be logged at the next
+        flush.
+        """
+        self.changed.add(game['number'])
+        self.games[game['number']] = game
+
+    def drop(self, number):
+        """Note that the numbered game is gone, to be logged at the next
+        flush.
+        """
+        self.changed.discard(number)
+        self.dropped.append(number)
+
+    def flush(self):
+        """Append everything recorded since the last flush to the log, and
+        sync it to disk in one go. Then takes a snapshot, if enough has been 
+        logged since the last.
+        """
+        if self.writer is not None:
+            self.finish_snapshot(wait=False)
+        if not self.changed and not self.dropped:
+            return
+        lines = []
+        for number in sorted(self.changed):
+            game = self.games[number]
+            if number not in self.written:
+                lines.append(self.line(number, ['new', game.seed]))
+                self.last_number = max(self.last_number, number)
+            for move in game.moves[self.written.get(number, 0):]:
+                lines.append(self.line(number, move))
+            self.written[number] = len(game.moves)
+        for number in self.dropped:
+            self.games.pop(number, None)
+            if self.written.pop(number, None) is not None:
+                lines.append(self.line(number, ['drop']))
+        self.changed.clear()
+        del self.dropped[:]
+        self.logged += len(lines)
+        self.log_file.write(''.join(lines))
+        self.log_file.flush()
+        os.fsync(self.log_file.fileno())
+        if self.logged >= self.snapshot_every and self.writer is None:
+            self.snapshot()
+
+    def line(self, number, event):
+        """Returns the log line for the event, with the next sequence
+        number.
+        """
+        self.sequence += 1
+        return json.dumps([self.sequence, number, event]) + '\n'
+
+    def snapshot(self):
+        """Start writing every game to a new snapshot in a child process, 
+        and start the log over. Everything logged so far must be flushed.
+        """
+        self.log_file.close()
+        if os.path.exists(self.old_log_path):
+            # The last snapshot didn't make it; keep what it would have had.
+            with open(self.old_log_path, 'ab') as old_log:
+                with open(self.log_path, 'rb') as log:
+                    old_log.write(log.read())
+                old_log.flush()
+                os.fsync(old_log.fileno())
+            os.remove(self.log_path)
+        else:
+            os.rename(self.log_path, self.old_log_path)
+        sync_directory(self.log_path)
+        self.log_file = open(self.log_path, 'ab')
+        self.logged = 0
+        self.writer = os.fork()
+        if self.writer == 0:
+            status = 1
+            try:
+                self.write_snapshot()
+                status = 0
+            finally:
+                os._exit(status)
+
+    def write_snapshot(self):
+        """Write every game to the snapshot file, replacing it only once the 
+        new one is all on disk.
+        """
+        temporary_path = self.snapshot_path + '.new'
+        gc.disable()
+        snapshot = {
+            'sequence': self.sequence,
+            'last_number': self.last_number,
+            'games': [model.Game.from_dict(g) 
+                      for g in self.games.itervalues()],
+        }
+        with open(temporary_path, 'wb') as f:
+            pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temporary_path, self.snapshot_path)
+        sync_directory(self.snapshot_path)
+
+    def finish_snapshot(self, wait=True):
+        """See whether the snapshot being written is done, waiting for it if 
+        wait is True. Once it's in place, the log set aside for it goes; if 
+        it failed, another is tried at the next flush.
+        """
+        pid, status = os.waitpid(self.writer, 0 if wait else os.WNOHANG)
+        if not pid:
+            return
+        self.writer = None
+        if status == 0:
+            os.remove(self.old_log_path)
+        else:
+            self.logged = self.snapshot_every
+
+    def close(self):
+        """Flush and close the log, once any snapshot is written."""
+        self.flush()
+        if self.writer is not None:
+            self.finish_snapshot()
+        self.log_file.close()
+
+
+def sync_directory(path):
+    """Sync the directory holding path, so files renamed into or out of it 
+    stay that way.
+    """
+    fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,141 @@
+# A compact form for games written to disk. gametools works on games as dicts,
+# which is what gets sent around, what the frontends expect, and what the
+# backend keeps in memory, but all those strings and little dicts add up when
+# thousands of games go into a journal snapshot (see the journal module). Here
+# tiles are board cell numbers in byte arrays, shares are a byte per hotel, and
+# everything lives in __slots__. to_dict and from_dict go back and forth
+# between the two forms without changing a thing, including the seed and move
+# log that gametools keeps alongside the dict.
+
+from array import array
+
+from acquire import board, gametools
+
+
+def pack_tiles(tiles):
+    """Returns an array of the cell numbers of tiles."""
+    return array('B', [board.tile_indices[t] for t in tiles])
+
+def unpack_tiles(cells):
+    """Returns the list of tiles for an array of cell numbers."""
+    return [board.tile_names[i] for i in cells]
+
+
+class Hotel(object):
+    """A hotel: its name and the cells of its tiles."""
+
+    __slots__ = ('name', 'tiles')
+
+    def __init__(self, name, tiles=()):
+        self.name = name
+        self.tiles = array('B', tiles)
+
+    @classmethod
+    def from_dict(cls, hotel):
+        """A compact copy of the given hotel dict."""
+        return cls(hotel['name'], pack_tiles(hotel['tiles']))
+
+    def to_dict(self):
+        """Returns the hotel as a dict."""
+        return {'name': self.name, 'tiles': unpack_tiles(self.tiles)}
+
+
+class Player(object):
+    """A player. Everything but the name is None until the game starts."""
+
+    __slots__ = ('name', 'rack', 'shares', 'cash')
+
+    def __init__(self, name, rack=None, shares=None, cash=None):
+        self.name = name
+        self.rack = rack
+        self.shares = shares
+        self.cash = cash
+
+    @classmethod
+    def from_dict(cls, player):
+        """A compact copy of the given player dict."""
+        compact = cls(player['name'])
+        if 'rack' in player:
+            compact.rack = pack_tiles(player['rack'])
+        if 'shares' in player:
+            shares = player['shares']
+            compact.shares = array('B', [shares.get(h, 0)
+                                         for h in gametools.hotel_names])
+        if 'cash' in player:
+            compact.cash = player['cash']
+        return compact
+
+    def to_dict(self):
+        """Returns the player as a dict."""
+        player = {'name': self.name}
+        if self.rack is not None:
+            player['rack'] = unpack_tiles(self.rack)
+        if self.shares is not None:
+            player['shares'] = dict(zip(gametools.hotel_names, self.shares))
+        if self.cash is not None:
+            player['cash'] = self.cash
+        return player
+
+
+class Game(object):
+    """A game. Attributes for keys that a game dict may not have yet (number,
+    hotels, tilebag, lonely_tiles, action_queue, merge_info) are None when the
+    key is missing. seed is None for game dicts not made by new_game.
+    """
+
+    __slots__ = ('number', 'started', 'ended', 'players', 'hotels', 'tilebag',
+                 'lonely_tiles', 'action_queue', 'merge_info', 'seed', 'moves')
+
+    def __init__(self, number=None):
+        self.number = number
+        self.started = False
+        self.ended = False
+        self.players = []
+        self.hotels = None
+        self.tilebag = None
+        self.lonely_tiles = None
+        self.action_queue = None
+        self.merge_info = None
+        self.seed = None
+        self.moves = ()
+
+    @classmethod
+    def from_dict(cls, game):
+        """A compact copy of the given game dict."""
+        compact = cls(game.get('number'))
+        compact.started = game['started']
+        compact.ended = game['ended']
+        compact.players = [Player.from_dict(p) for p in game['players']]
+        if 'hotels' in game:
+            compact.hotels = [Hotel.from_dict(h) for h in game['hotels']]
+        for key in ('tilebag', 'lonely_tiles'):
+            if key in game:
+                setattr(compact, key, pack_tiles(game[key]))
+        if 'action_queue' in game:
+            compact.action_queue = [dict(a) for a in game['action_queue']]
+        if 'merge_info' in game:
+            compact.merge_info = dict(game['merge_info'])
+        compact.seed = getattr(game, 'seed', None)
+        compact.moves = tuple(getattr(game, 'moves', ()))
+        return compact
+
+    def to_dict(self):
+        """Returns the game as a gametools game, just as it was before
+        from_dict.
+        """
+        game = gametools.new_game(self.number, self.seed)
+        game.moves = list(self.moves)
+        game['started'] = self.started
+        game['ended'] = self.ended
+        game['players'] = [p.to_dict() for p in self.players]
+        if self.hotels is not None:
+            game['hotels'] = [h.to_dict() for h in self.hotels]
+        for key in ('tilebag', 'lonely_tiles'):
+            cells = getattr(self, key)
+            if cells is not None:
+                game[key] = unpack_tiles(cells)
+        if self.action_queue is not None:
+            game['action_queue'] = [dict(a) for a in self.action_queue]
+        if self.merge_info is not None:
+            game['merge_info'] = dict(self.merge_info)
+        return game
@@ -1,14 +1,40 @@
 # Accepts connections from NetAcquire clients and translates between NetAcquire
 # directives and Acquire messages.
 
+import errno
 import logging
-import Queue
 import socket
 import sys
 import zmq
+from collections import deque
+from timeit import default_timer as timer
 
-from acquire import gametools
+from acquire import codec, gametools, profiling, stats, topics
+from acquire.backend import set_hwms
+from acquire.delta import GameCache
 from acquire.directive import Directive
+from acquire.timers import Timers
+
+# What to do about a client that has too much waiting for it:
+#     drop      disconnect it.
+#     collapse  throw out the view updates waiting for it that later ones make 
+#               redundant, and disconnect it if that doesn't free up enough.
+#     pause     stop reading from it until it catches up, so it can't ask for 
+#               more, and disconnect it if it gets much further behind.
+slow_client_policies = ('drop', 'collapse', 'pause')
+
+def view_key(directive):
+    """Returns what the directive sets in the client's view, if it's one that 
+    a later directive with the same key makes redundant, or None otherwise.
+    """
+    if not isinstance(directive, Directive):
+        return None
+    if directive.code == 'SV':
+        return tuple([directive.code] + directive.params[:-1])
+    if directive.code in ('SB', 'AT'):
+        return (directive.code, directive.params[0])
+    return None
+
 
 class NetAcquire(object):
     """Accept NetAcquire client connections and translate between directives 
@@ -20,10 +46,12 @@ class NetAcquire(object):
     def start_handshake(self):
         """Accept a client connection and start shaking hands."""
         client, address = self.server.accept()
+        client.setblocking(0)
         self.clients[client.fileno()] = client
-        self.client_queues[client.fileno()] = Queue.Queue()
-        self.inputs.append(client)
-        client.send(str(self.announce))
+        self.client_queues[client.fileno()] = []
+        self.client_sizes[client.fileno()] = 0
+        self.watch_client(client.fileno())
+        self.send_to_client(client, self.announce)
         self.shaking_hands[client.fileno()] = ''
         self.log.debug("New client from %s:%d." % address)
     
@@ -31,6 +59,7 @@ class NetAcquire(object):
         """The client is continuing the handshake by telling us their name."""
         if client.fileno() in self.shaking_hands:
             name = self.shaking_hands[client.fileno()] = directive[0]
+            self.subscriptions.add(topics.player(name))
             self.send_to_backend('login', player=name)
             self.log.debug('Attempting login for %s...', name)
     
@@ -45,6 +74,7 @@ class NetAcquire(object):
             del self.shaking_hands[fileno]
             if message['game']:
                 game = message['game']
+                self.follow_game(client, game)
                 self.set_client_state(client, 4)
                 if not game['started']:
                     host = gametools.host(game)
@@ -113,9 +143,29 @@ class NetAcquire(object):
                                     for m in messages))
     
     def games_list_message(self, message):
-        """The games list changed, or someone requested an updated list."""
+        """Someone requested an updated list of game lobby summaries."""
         self.games_list = message['games_list']
     
+    def lobby_game_message(self, message):
+        """A game was added to the lobby, changed, or removed from it."""
+        if message['event'] == 'add':
+            self.games_list.append(message['summary'])
+        elif message['event'] == 'update':
+            summary = message['summary']
+            self.games_list = [summary if g['number'] == summary['number'] 
+                               else g for g in self.games_list]
+        elif message['event'] == 'remove':
+            number = message['game_number']
+            self.games_list = [g for g in self.games_list 
+                               if g['number'] != number]
+            # Anyone still in the game, such as when a finished game is 
+            # reaped, is back in the lobby.
+            for fileno, game_number in self.client_games.items():
+                if game_number == number:
+                    client = self.clients[fileno]
+                    self.unfollow_game(client)
+                    self.set_client_state(client, 3)
+    
     def SG_directive(self, client, directive):
         """The client would like to start a new game."""
         self.send_to_backend('start_game', player=self.name_of_client(client))
@@ -127,6 +177,7 @@ class NetAcquire(object):
         player, game = message['player'], message['game']
         client = self.client_named(player)
         if client:
+            self.follow_game(client, game)
             self.set_client_state(client, 4)
             self.set_client_state(client, 5)
         announcement = '* %s has started new game %d.' % (player, 
@@ -146,6 +197,7 @@ class NetAcquire(object):
         player, game = message['player'], message['game']
         client = self.client_named(player)
         if client:
+            self.follow_game(client, game)
             self.set_client_state(client, 4)
         announcement = '* %s has joined game %d.' % (player, game['number'])
         self.send_to_all_clients(Directive('LM', announcement))
@@ -164,6 +216,7 @@ class NetAcquire(object):
         player, game = message['player'], message['game']
         client = self.client_named(player)
         if client:
+            self.unfollow_game(client)
             self.set_client_state(client, 3)
         host = gametools.host(game)
         if host:
@@ -197,6 +250,11 @@ class NetAcquire(object):
         self.send_to_clients_in_game(game, ''.join(str(d) for d in directives))
         self.update_game_views(game)
     
+    def game_snapshot_message(self, message):
+        """The whole of a game, sent after some frontend missed updates to it.
+        """
+        self.update_game_views(message['game'])
+    
     
     #### Playing games.
     
@@ -482,20 +540,98 @@ class NetAcquire(object):
         self.log = logging.getLogger('NetAcquire')
         self.log.setLevel(logging.DEBUG)
         self.log.addHandler(logging.StreamHandler())
+        self.timers = Timers(log=self.log)
+        self.start_stats()
+    
+    def start_stats(self):
+        """Set up the metrics kept on this frontend (see the stats module), 
+        and its profiler.
+        """
+        self.stats = stats.Stats('acquire_netacquire')
+        self.profiler = profiling.Profiler('acquire_netacquire', self.timers)
+        # Directives and paths without a handler are counted together, so a 
+        # client can't make up new labels.
+        self.known_codes = set(name[:-len('_directive')] for name in dir(self) 
+                               if name.endswith('_directive'))
+        self.known_paths = set(name[:-len('_message')] for name in dir(self) 
+                               if name.endswith('_message'))
+        self.directives_in = self.stats.counter(
+            'directives_total', 'Directives from clients, by code.', 'code')
+        self.directive_seconds = self.stats.histogram(
+            'directive_seconds', 'Seconds spent handling a directive, by code.', 
+            'code')
+        self.messages_in = self.stats.counter(
+            'messages_total', 'Messages from the backend, by path.', 'path')
+        self.message_seconds = self.stats.histogram(
+            'message_seconds', 'Seconds spent handling a message, by path.', 
+            'path')
+        self.client_bytes_in = self.stats.counter(
+            'client_received_bytes_total', 'Bytes received from clients.')
+        self.client_bytes_out = self.stats.counter(
+            'client_sent_bytes_total', 'Bytes sent to clients.')
+        self.backend_bytes_in = self.stats.counter(
+            'backend_received_bytes_total', 
+            'Bytes received from the backend, topics included.')
+        self.backend_bytes_out = self.stats.counter(
+            'backend_sent_bytes_total', 'Bytes sent to the backend.')
+        self.stats.gauge('clients', 'Connected clients.', 
+                         lambda: len(self.clients))
+        self.stats.gauge('client_queued_bytes', 
+                         'Bytes waiting to be sent to clients.', 
+                         lambda: sum(self.client_sizes.itervalues()))
+        self.stats.gauge('paused_clients', 
+                         'Clients not read from until they catch up.', 
+                         lambda: len(self.paused_clients))
+        self.stats.gauge('backend_queue', 
+                         'Messages waiting to be sent to the backend.', 
+                         lambda: len(self.backend_queue))
+        self.stats.gauge('backend_pauses_total', 
+                         'Times clients stopped being read from because the '
+                         'backend was backed up.', 
+                         lambda: self.backend_pauses, kind='counter')
+        self.stats.gauge('slow_clients_total', 
+                         'Times the slow client policies were applied.', 
+                         lambda: self.slow_client_counts, label='policy', 
+                         kind='counter')
     
     def run(self, server_name='Acquire', accept_address=('localhost', 31415), 
             backend_push_address='tcp://localhost:27183', 
-            backend_sub_address='tcp://localhost:16180'):
-        """Start accepting clients and connect to the backend."""
+            backend_sub_address='tcp://localhost:16180', codec_name='json', 
+            client_buffer=65536, slow_client='collapse', send_hwm=0, 
+            recv_hwm=0, backend_queue_limit=10000, stats_address=None):
+        """Start accepting clients and connect to the backend, talking to it 
+        with the codec named codec_name.
+        
+        A client with more than client_buffer bytes waiting for it is slow, 
+        and is dealt with according to the slow_client policy (see 
+        slow_client_policies). send_hwm and recv_hwm, if not 0, are the 
+        high-water marks for the sockets to and from the backend. No client 
+        is read from while more than backend_queue_limit messages are waiting 
+        for the backend.
+        
+        If stats_address is given, the frontend's metrics can be had from a 
+        REP socket there (see the stats module).
+        """
+        if slow_client not in slow_client_policies:
+            raise ValueError('unknown slow client policy %r' % slow_client)
         
         # Socket setup.
         self.log.info("NetAcquire frontend starting. Press CTRL-D to exit.")
+        self.codec = codec.named(codec_name)
         self.context = zmq.Context()
         self.backend_push = self.context.socket(zmq.PUSH)
+        set_hwms(self.backend_push, send_hwm=send_hwm)
         self.backend_push.connect(backend_push_address)
         self.backend_sub = self.context.socket(zmq.SUB)
+        set_hwms(self.backend_sub, recv_hwm=recv_hwm)
         self.backend_sub.connect(backend_sub_address)
-        self.backend_sub.setsockopt(zmq.SUBSCRIBE, '')
+        self.subscriptions = topics.Subscriptions(self.backend_sub)
+        self.subscriptions.add(topics.lobby)
+        self.stats_socket = None
+        if stats_address:
+            self.stats_socket = self.context.socket(zmq.REP)
+            self.stats_socket.bind(stats_address)
+            self.log.info("Stats on %s", stats_address)
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.setblocking(0)
         self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -503,17 +639,38 @@ class NetAcquire(object):
         self.server.listen(5)
         self.log.info("Listening on %s:%d" % accept_address)
         
-        # Queue, select, and announce setup.
-        self.inputs = [self.server, self.backend_sub, sys.stdin]
-        self.backend_queue = Queue.Queue()
+        # Queue, poller, and announce setup. Only this thread touches the 
+        # queues, so they needn't be Queue.Queues.
+        self.backend_queue = deque()
+        self.backend_queue_limit = backend_queue_limit
+        self.backend_backed_up = False
+        self.backend_pauses = 0
         self.clients = {}
         self.client_queues = {}
+        self.client_sizes = {}
+        self.client_buffer = client_buffer
+        self.slow_client = slow_client
+        self.slow_client_counts = dict.fromkeys(slow_client_policies, 0)
+        self.paused_clients = set()
+        self.dropped_clients = set()
         self.client_states = {}
         self.client_racks = {}
         self.names = {}
         self.shaking_hands = {}
+        self.games = GameCache()
+        self.client_games = {}
         self.announce = Directive("SP", "2", "0", "4", str(server_name))
         
+        # Everything is registered with the poller once. Sockets with 
+        # something waiting to go out are also polled for writing, until it's 
+        # all gone.
+        self.poller = zmq.Poller()
+        self.poller.register(self.backend_sub, zmq.POLLIN)
+        self.poller.register(self.server.fileno(), zmq.POLLIN)
+        self.poller.register(sys.stdin.fileno(), zmq.POLLIN)
+        if self.stats_socket:
+            self.poller.register(self.stats_socket, zmq.POLLIN)
+        
         # Request initial game list.
         self.games_list = []
         self.send_to_backend('games_list')
@@ -524,76 +681,206 @@ class NetAcquire(object):
     
     def _runloop(self):
         """A single run-through of all sockets handled by this frontend."""
-        outputs = [] if self.backend_queue.empty() else [self.backend_push]
-        for fileno, q in self.client_queues.iteritems():
-            if not q.empty():
-                outputs.append(fileno)
-        read, write, error = zmq.select(self.inputs, outputs, self.inputs)
-        for fileno in read:
+        for fileno, event in self.poller.poll(self.timers.timeout()):
+            if event & zmq.POLLERR:
+                if fileno in self.clients:
+                    self.disconnected(self.clients[fileno])
+                elif fileno == self.server.fileno():
+                    raise Exception('server socket in exceptional state')
+                elif fileno == sys.stdin.fileno():
+                    raise Exception('stdin in exceptional state')
+                continue
             if fileno == self.backend_sub:
-                self.route_message(self.backend_sub.recv_json())
+                self.receive_messages()
+            elif fileno == self.backend_push:
+                self.send_messages()
             elif fileno == self.server.fileno():
                 self.start_handshake()
+            elif fileno == self.stats_socket:
+                self.stats.answer(self.stats_socket, 
+                                  {'profile': self.profiler.command})
             elif fileno == sys.stdin.fileno():
                 for _ in sys.stdin:
                     pass
                 sys.exit(0)
             elif fileno in self.clients:
+                # Not there if it disconnected earlier this time round.
                 client = self.clients[fileno]
-                data = client.recv(4096)
-                if data:
-                    self.route_directives(client, data)
-                else:
-                    self.disconnected(client)
-            else:
-                self.log.warning('unknown input file descriptor %r', fileno)
-                self.remove_fileno(self.inputs, fileno)
-        
-        for fileno in write:
-            if fileno == self.backend_push:
-                try:
-                    message = self.backend_queue.get_nowait()
-                except Queue.Empty:
-                    continue
-                self.backend_push.send_json(message)
-            elif fileno in self.clients:
-                try:
-                    directives = self.client_queues[fileno].get_nowait()
-                except Queue.Empty:
-                    continue
-                self.clients[fileno].send(directives)
-            else:
-                log.warning('unknown output file descriptor %r', fileno)
-                self.remove_fileno(self.outputs, fileno)
-        
-        for fileno in error:
-            if fileno == self.server.fileno():
-                raise Exception('server socket in exceptional state')
-            elif fileno == self.backend_sub:
-                raise Exception('backend SUB socket in exceptional state')
-            elif fileno == sys.stdin.fileno():
-                raise Exception('stdin in exceptional state')
-            elif fileno in self.clients:
-                self.disconnected(self.clients[fileno])
+                if event & zmq.POLLOUT:
+                    self.write_to_client(client)
+                if event & zmq.POLLIN and fileno in self.clients:
+                    self.read_from_client(client)
+        for fileno in list(self.dropped_clients):
+            self.disconnected(self.clients[fileno])
+        self.timers.run_due()
+    
+    def receive_messages(self, limit=100):
+        """Route messages waiting from the backend, up to limit of them so 
+        that clients get a turn.
+        """
+        for _ in xrange(limit):
+            try:
+                # A topic frame, then one or more messages.
+                parts = self.backend_sub.recv_multipart(zmq.NOBLOCK)
+            except zmq.ZMQError, e:
+                if e.errno == zmq.EAGAIN:
+                    return
+                raise
+            self.backend_bytes_in.add(n=sum(map(len, parts)))
+            if parts[0] in self.subscriptions:
+                for part in parts[1:]:
+                    self.route_message(self.codec.decode(part))
+    
+    def send_messages(self):
+        """Send the backend everything waiting for it, or as much as it will 
+        take.
+        """
+        queue = self.backend_queue
+        while queue:
+            data = self.codec.encode(queue[0])
+            try:
+                self.backend_push.send(data, zmq.NOBLOCK)
+            except zmq.ZMQError, e:
+                if e.errno == zmq.EAGAIN:
+                    return
+                raise
+            self.backend_bytes_out.add(n=len(data))
+            queue.popleft()
+            if self.backend_backed_up:
+                self.check_backend_queue()
+        self.poller.unregister(self.backend_push)
+    
+    def read_from_client(self, client):
+        """Handle whatever the client sent, or its disconnecting."""
+        try:
+            data = client.recv(4096)
+        except socket.error, e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            data = ''
+        if data:
+            self.client_bytes_in.add(n=len(data))
+            self.route_directives(client, data)
+        else:
+            self.disconnected(client)
+    
+    def write_to_client(self, client):
+        """Send the client as much of what's waiting for it as it will take."""
+        fileno = client.fileno()
+        pending = self.client_queues[fileno]
+        data = ''.join(wiredata for _, wiredata in pending)
+        try:
+            sent = client.send(data)
+        except socket.error, e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            self.disconnected(client)
+            return
+        self.client_bytes_out.add(n=sent)
+        del pending[:]
+        if sent < len(data):
+            pending.append((None, data[sent:]))
+        self.client_sizes[fileno] = len(data) - sent
+        if (fileno in self.paused_clients and 
+            self.client_sizes[fileno] <= self.client_buffer // 2):
+            self.paused_clients.discard(fileno)
+            self.log.info('client %d caught up, reading again', fileno)
+        self.watch_client(fileno)
     
     def route_directives(self, client, wiredata):
         """Parse directives from wiredata, as sent from client, and pass them 
         along to directive-specific handlers.
         """
         for directive in Directive.parse_multiple(wiredata):
-            handler_name = directive.code + '_directive'
+            code = directive.code
+            handler_name = code + '_directive'
+            start = timer()
             if hasattr(self, handler_name):
                 try:
                     getattr(self, handler_name)(client, directive)
                 except Exception:
-                    self.log.exception('error handling %s directive', 
-                                       directive.code)
+                    self.log.exception('error handling %s directive', code)
             else:
-                self.log.debug('unimplemented directive %s', directive.code)
+                self.log.debug('unimplemented directive %s', code)
+            if code not in self.known_codes:
+                code = 'unknown'
+            elapsed = timer() - start
+            self.directive_seconds.observe(code, elapsed)
+            self.profiler.handled(code + '_directive', elapsed)
+            self.directives_in.add(code)
     
     def send_to_client(self, client, directive):
-        """Send a directive to a client."""
-        self.client_queues[client.fileno()].put(str(directive))
+        """Send a directive, or a string of them, to a client. A client with 
+        too much waiting for it is dealt with by slow_client_caught.
+        """
+        fileno = client.fileno()
+        if fileno in self.dropped_clients:
+            return
+        pending = self.client_queues[fileno]
+        wiredata = str(directive)
+        pending.append((view_key(directive), wiredata))
+        self.client_sizes[fileno] += len(wiredata)
+        if len(pending) == 1:
+            self.watch_client(fileno)
+        if self.client_sizes[fileno] > self.client_buffer:
+            self.slow_client_caught(fileno)
+    
+    def slow_client_caught(self, fileno):
+        """The client has more than client_buffer bytes waiting for it. Apply 
+        the slow client policy, counting each time it's applied, and drop the 
+        client if the policy doesn't keep what's waiting within bounds.
+        """
+        size = self.client_sizes[fileno]
+        policy = self.slow_client
+        if policy == 'collapse':
+            self.collapse_client_queue(fileno)
+            self.slow_client_counts['collapse'] += 1
+            if self.client_sizes[fileno] > self.client_buffer // 2:
+                policy = 'drop'
+        elif policy == 'pause':
+            if fileno not in self.paused_clients:
+                self.paused_clients.add(fileno)
+                self.watch_client(fileno)
+                self.slow_client_counts['pause'] += 1
+                self.log.info('client %d is behind, not reading from it', 
+                              fileno)
+            if size > self.client_buffer * 2:
+                policy = 'drop'
+        if policy == 'drop':
+            self.slow_client_counts['drop'] += 1
+            self.log.info('client %d is too far behind (%d bytes), dropping '
+                          'it', fileno, self.client_sizes[fileno])
+            self.dropped_clients.add(fileno)
+            del self.client_queues[fileno][:]
+            self.client_sizes[fileno] = 0
+    
+    def collapse_client_queue(self, fileno):
+        """Throw out the view updates waiting for the client that later ones 
+        make redundant.
+        """
+        pending = self.client_queues[fileno]
+        seen = set()
+        kept = []
+        for key, wiredata in reversed(pending):
+            if key is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append((key, wiredata))
+        kept.reverse()
+        pending[:] = kept
+        self.client_sizes[fileno] = sum(len(w) for _, w in kept)
+    
+    def watch_client(self, fileno):
+        """Poll the client for reading unless it or the backend is backed up, 
+        and for writing while anything is waiting for it.
+        """
+        flags = zmq.POLLIN
+        if fileno in self.paused_clients or self.backend_backed_up:
+            flags = 0
+        if self.client_queues[fileno]:
+            flags |= zmq.POLLOUT
+        self.poller.register(fileno, flags)
     
     def send_to_clients_in_game(self, game, directive):
         """Send the directive to all clients of this frontend who are in the 
@@ -610,32 +897,73 @@ class NetAcquire(object):
             self.send_to_client(client, directive)
     
     def route_message(self, message):
-        """Pass message along to a path-specific handler."""
-        handler_name = message['path'] + '_message'
+        """Pass message along to a path-specific handler. A message whose game 
+        can't be worked out from the updates seen so far is dropped, and the 
+        whole game asked for instead.
+        """
+        if not self.games.resolve(message):
+            if self.games.request(message['game_number']):
+                self.send_to_backend('game_snapshot', 
+                                     game_number=message['game_number'])
+            return
+        path = message['path']
+        handler_name = path + '_message'
+        start = timer()
         if hasattr(self, handler_name):
             try:
                 getattr(self, handler_name)(message)
             except Exception:
-                self.log.exception('error handling %s message', message['path'])
+                self.log.exception('error handling %s message', path)
         else:
-            self.log.debug('unimplemented message %s', message['path'])
+            self.log.debug('unimplemented message %s', path)
+        if path not in self.known_paths:
+            path = 'unknown'
+        elapsed = timer() - start
+        self.message_seconds.observe(path, elapsed)
+        self.profiler.handled(path + '_message', elapsed)
+        self.messages_in.add(path)
     
     def send_to_backend(self, path, **message):
         """Send a message with the given path and key-value pairs to the 
         backend.
         """
         message.update(dict(path=path))
-        self.backend_queue.put(message)
-    
-    def remove_fileno(self, collection, fileno):
-        """Remove all objects in collection whose fileno is given."""
-        to_remove = []
-        for obj in collection:
-            if obj == fileno or (hasattr(obj, 'fileno') and 
-                                 obj.fileno() == fileno):
-                to_remove.append(obj)
-        for obj in to_remove:
-            collection.remove(obj)
+        if not self.backend_queue:
+            self.poller.register(self.backend_push, zmq.POLLOUT)
+        self.backend_queue.append(message)
+        if not self.backend_backed_up:
+            self.check_backend_queue()
+    
+    def check_backend_queue(self):
+        """Stop reading from clients while more than backend_queue_limit 
+        messages are waiting for the backend, so they can't pile up without 
+        end, and read from them again once it's within the limit.
+        """
+        backed_up = len(self.backend_queue) > self.backend_queue_limit
+        if backed_up == self.backend_backed_up:
+            return
+        self.backend_backed_up = backed_up
+        if backed_up:
+            self.backend_pauses += 1
+            self.log.info('%d messages waiting for the backend, not reading '
+                          'from clients for now', len(self.backend_queue))
+        else:
+            self.log.info('backend caught up, reading from clients again')
+        for fileno in self.clients:
+            self.watch_client(fileno)
+    
+    def follow_game(self, client, game):
+        """Subscribe to messages about game on behalf of client, who is in it.
+        """
+        self.unfollow_game(client)
+        self.client_games[client.fileno()] = game['number']
+        self.subscriptions.add(topics.game(game['number']))
+    
+    def unfollow_game(self, client):
+        """Drop client's reason for hearing about the game they were in."""
+        number = self.client_games.pop(client.fileno(), None)
+        if number is not None:
+            self.subscriptions.discard(topics.game(number))
     
     def name_of_client(self, client_to_name):
         """Returns the name associated with the given client, or None if the 
@@ -741,13 +1069,17 @@ class NetAcquire(object):
         this frontend who are in game so that their game views represent the 
         given game.
         """
+        if game['started']:
+            unplayable = set(gametools.unplayable_tiles(game))
+        else:
+            unplayable = set()
         for player in game['players']:
             client = self.client_named(player['name'])
             if client:
                 self.update_scoreboard_view(client, game)
                 self.update_board(client, game)
                 self.set_client_rack(client, player.get('rack', []))
-                self.update_rack(client, game)
+                self.update_rack(client, unplayable)
         if game['started'] and not game['ended']:
             self.update_action_queue(game)
     
@@ -774,10 +1106,11 @@ class NetAcquire(object):
             template[4] = ' '
             send()
         if game['started']:
+            bank = gametools.ledger_for(game).bank
             for i, hotel_name in enumerate(gametools.hotel_names):
                 hotel = gametools.hotel_named(game, hotel_name)
                 template[2] = 9 + i
-                template[4] = gametools.bank_shares(game, hotel)
+                template[4] = bank[hotel_name]
                 send()
                 template[2] = 17 + i
                 template[4] = len(hotel['tiles']) or '-'
@@ -802,16 +1135,11 @@ class NetAcquire(object):
                 template[0] = self.tile_id(tile)
                 send()
     
-    def update_rack(self, client, game):
+    def update_rack(self, client, unplayable):
         """Sends a series of Activate Tile directives to the given client so 
-        that its tile rack represents the one saved by this frontend.
+        that its tile rack represents the one saved by this frontend, greying 
+        out the tiles in unplayable.
         """
-        if game['started']:
-            unplayable = gametools.tiles_that_merge_safe_hotels(game)
-            if not gametools.hotels_off_board(game):
-                unplayable.extend(gametools.tiles_that_create_hotels(game))
-        else:
-            unplayable = []
         for i, tile in enumerate(self.client_racks[client.fileno()]):
             if tile:
                 if tile in unplayable:
@@ -860,13 +1188,19 @@ class NetAcquire(object):
         fileno = client.fileno()
         if fileno in self.names:
             self.send_to_backend('logout', player=self.names[fileno])
+        name = self.names.get(fileno, self.shaking_hands.get(fileno))
+        if name is not None:
+            self.subscriptions.discard(topics.player(name))
+        self.unfollow_game(client)
         client_collections = [self.client_queues, self.names, self.clients, 
                               self.shaking_hands, self.client_states, 
-                              self.client_racks]
+                              self.client_racks, self.client_sizes]
         for collection in client_collections:
             if fileno in collection:
                 del collection[fileno]
-        self.remove_fileno(self.inputs, fileno)
+        self.paused_clients.discard(fileno)
+        self.dropped_clients.discard(fileno)
+        self.poller.unregister(fileno)
         client.close()
         self.log.debug('client %d has disconnected', fileno)
     
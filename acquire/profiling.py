@@ -0,0 +1,175 @@
+# Profiling a running backend or frontend, without restarting it. Each process
+# keeps a Profiler, turned on for a while by a request on its stats socket (see
+# the stats module):
+#
+#     python acquire/stats.py ADDRESS profile [cprofile|sample] [SECONDS] [PATH]
+#     python acquire/stats.py ADDRESS profile stop
+#     python acquire/stats.py ADDRESS profile status
+#
+# The profile stops by a timer on the process's loop (see the timers module).
+#
+# 'cprofile' profiles every call made on the process's loop, and writes a
+# pstats file (read it with the pstats module, or snakeviz and friends).
+# 'sample' looks at the loop's stack every few milliseconds from another
+# thread, which costs the loop next to nothing, and writes collapsed stacks,
+# one per line with how often it was seen, as flamegraph.pl takes them.
+#
+# Either way, the wall time spent in each message or directive handler while
+# profiling is written next to it, in PATH.handlers.
+
+import cProfile
+import os
+import sys
+import tempfile
+import threading
+import time
+
+kinds = ('cprofile', 'sample')
+
+
+class Profiler(object):
+    """Profiles the thread that starts it, one profile at a time, until a 
+    timer from timers stops it. The timers must be run by the same thread.
+    """
+
+    def __init__(self, name, timers):
+        self.name = name
+        self.timers = timers
+        self.profile = None
+        self.sampler = None
+        self.timer = None
+        self.path = None
+        self.handlers = {}
+
+    @property
+    def running(self):
+        return self.timer is not None
+
+    def start(self, kind='cprofile', seconds=30, path=None):
+        """Start profiling for the given number of seconds, writing the
+        profile to path, or a new file in the temporary directory if None.
+        Returns the path.
+
+        Raises ValueError if already profiling, for a kind not in kinds, or 
+        if path can't be written.
+        """
+        if self.running:
+            raise ValueError('already profiling into %s' % self.path)
+        if kind not in kinds:
+            raise ValueError('unknown profile kind %r; pick one of %s' %
+                             (kind, ', '.join(kinds)))
+        if path is None:
+            suffix = '.pstats' if kind == 'cprofile' else '.collapsed'
+            prefix = '%s-%s-' % (self.name, time.strftime('%Y%m%d-%H%M%S'))
+            fd, path = tempfile.mkstemp(suffix, prefix)
+            os.close(fd)
+        else:
+            # Find out now rather than when the profile's done.
+            try:
+                open(path, 'w').close()
+            except EnvironmentError, e:
+                raise ValueError('cannot write %s: %s' % (path, e.strerror))
+        self.path = path
+        self.handlers = {}
+        if kind == 'cprofile':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.sampler = Sampler(threading.current_thread().ident)
+            self.sampler.start()
+        self.timer = self.timers.call_later(seconds, self.stop)
+        return path
+
+    def stop(self):
+        """Stop profiling and write out what was found. Returns the path
+        written to, or None if not profiling.
+        
+        Raises EnvironmentError if the profile can't be written, after which 
+        profiling has stopped all the same.
+        """
+        if not self.running:
+            return None
+        profile, sampler = self.profile, self.sampler
+        self.timers.cancel(self.timer)
+        self.timer = self.profile = self.sampler = None
+        if profile:
+            profile.disable()
+            profile.dump_stats(self.path)
+        else:
+            sampler.stop()
+            sampler.write(self.path)
+        self.write_handlers(self.path + '.handlers')
+        return self.path
+
+    def handled(self, name, seconds):
+        """Note that the named handler took seconds, if profiling."""
+        if self.timer is not None:
+            try:
+                totals = self.handlers[name]
+            except KeyError:
+                totals = self.handlers[name] = [0, 0.0]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def write_handlers(self, path):
+        """Write the time spent in each handler to path, slowest first."""
+        with open(path, 'w') as f:
+            f.write('# handler calls seconds mean_ms\n')
+            for name, (calls, seconds) in sorted(
+                    self.handlers.iteritems(), key=lambda i: -i[1][1]):
+                f.write('%s %d %.6f %.3f\n' % (name, calls, seconds,
+                                              seconds * 1000 / calls))
+
+    def command(self, *args):
+        """Handle a profile request (see above), and return the reply."""
+        if args == ('stop',):
+            try:
+                path = self.stop()
+            except EnvironmentError, e:
+                raise ValueError('could not write %s: %s' % (self.path, e))
+            return 'wrote %s' % path if path else 'not profiling'
+        if args == ('status',):
+            if not self.running:
+                return 'not profiling'
+            return 'profiling into %s for %.1f more seconds' % (
+                self.path, self.timers.deadline(self.timer) - 
+                self.timers.clock())
+        kind = args[0] if args else 'cprofile'
+        seconds = float(args[1]) if len(args) > 1 else 30
+        path = self.start(kind, seconds, args[2] if len(args) > 2 else None)
+        return 'profiling into %s for %g seconds' % (path, seconds)
+
+
+class Sampler(threading.Thread):
+    """Counts the stacks seen on a thread every interval seconds."""
+
+    def __init__(self, thread_id, interval=0.005):
+        threading.Thread.__init__(self, name='sampler')
+        self.daemon = True
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append('%s:%s:%d' % (os.path.basename(code.co_filename),
+                                           code.co_name, code.co_firstlineno))
+                frame = frame.f_back
+            if names:
+                stack = ';'.join(reversed(names))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def write(self, path):
+        """Write the stacks seen to path, in the collapsed format."""
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.iteritems()):
+                f.write('%s %d\n' % (stack, count))
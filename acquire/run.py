@@ -15,15 +15,38 @@ except ImportError:
     sys.path.insert(1, os.path.realpath(os.path.join(path_here, '../lib')))
 from acquire.backend import Backend
 from acquire.netacquire import NetAcquire
+from acquire.shards import Router
 
 settings = {
     'pub_spec': 'tcp://127.0.0.1:16180',
     'push_spec': 'tcp://127.0.0.1:27183',
+    'game_updates': 'full',
+    'pub_batch': 'false',
+    'workers': '0',
+    'journal': '',
+    'snapshot_every': '10000',
+    'codec': 'json',
+    'send_hwm': '0',
+    'recv_hwm': '0',
+    'pub_queue_limit': '10000',
+    'stats_spec': '',
+    'reap_every': '60',
+    'finished_idle': '600',
+    'lobby_idle': '1800',
+    'archive': '',
+    'turn_limit': '0',
+    'admin_spec': '',
+    'admin_budget': '0.005',
     'netacquire_address': '127.0.0.1:31415',
     'netacquire_name': 'Acquire',
+    'netacquire_client_buffer': '65536',
+    'netacquire_slow_client': 'collapse',
+    'netacquire_backend_queue_limit': '10000',
+    'netacquire_stats_spec': '',
     'mongrel2_sender_id': 'd693a7cc-2bba-469a-b478-11a50ca09116',
     'mongrel2_send_spec': 'tcp://127.0.0.1:9999',
     'mongrel2_recv_spec': 'tcp://127.0.0.1:9998',
+    'mongrel2_stats_spec': '',
 }
 
 config_path = "acquire.cfg" if len(sys.argv) <= 1 else sys.argv[1]
@@ -33,14 +56,22 @@ try:
 except ConfigParser.Error:
     config = None
 if config and config.sections():
-    for backend_setting in ['pub_spec', 'push_spec']:
+    for backend_setting in ['pub_spec', 'push_spec', 'game_updates', 
+                            'pub_batch', 'workers', 'journal', 
+                            'snapshot_every', 'codec', 'send_hwm', 
+                            'recv_hwm', 'pub_queue_limit', 'stats_spec', 
+                            'reap_every', 'finished_idle', 'lobby_idle', 
+                            'archive', 'turn_limit', 'admin_spec', 
+                            'admin_budget']:
         try:
             settings[backend_setting] = config.get('backend', backend_setting)
         except ConfigParser.NoOptionError:
             pass
         except ConfigParser.NoSectionError:
             break
-    for netacquire_setting in ['address', 'name']:
+    for netacquire_setting in ['address', 'name', 'client_buffer', 
+                               'slow_client', 'backend_queue_limit', 
+                               'stats_spec']:
         try:
             settings['netacquire_' + netacquire_setting] = config.get(
                 'netacquire', netacquire_setting)
@@ -50,7 +81,8 @@ if config and config.sections():
             del settings['netacquire_address']
             del settings['netacquire_name']
             break
-    for mongrel2_setting in ['sender_id', 'send_spec', 'recv_spec']:
+    for mongrel2_setting in ['sender_id', 'send_spec', 'recv_spec', 
+                             'stats_spec']:
         try:
             settings['mongrel2_' + mongrel2_setting] = config.get('mongrel2', 
                                                             mongrel2_setting)
@@ -62,11 +94,34 @@ if config and config.sections():
             del settings['mongrel2_recv_spec']
         break
 
-back = Backend()
 back_settings = {
     'pub_address': settings['pub_spec'],
     'pull_address': settings['push_spec'],
+    'game_updates': settings['game_updates'],
+    'pub_batch': settings['pub_batch'].lower() in ('1', 'yes', 'true', 'on'),
+    'journal_path': settings['journal'] or None,
+    'snapshot_every': int(settings['snapshot_every']),
+    'codec_name': settings['codec'],
+    'send_hwm': int(settings['send_hwm']),
+    'recv_hwm': int(settings['recv_hwm']),
+    'pub_queue_limit': int(settings['pub_queue_limit']),
+    'stats_address': settings['stats_spec'] or None,
+    'reap_every': float(settings['reap_every']),
+    'finished_idle': float(settings['finished_idle']),
+    'lobby_idle': float(settings['lobby_idle']),
+    'archive_path': settings['archive'] or None,
+    'turn_limit': float(settings['turn_limit']),
 }
+if int(settings['workers']):
+    if settings['admin_spec']:
+        sys.exit("%s: admin_spec can't be used with workers; leave one of "
+                 "them out." % config_path)
+    back = Router()
+    back_settings['workers'] = int(settings['workers'])
+else:
+    back = Backend()
+    back_settings['admin_address'] = settings['admin_spec'] or None
+    back_settings['admin_budget'] = float(settings['admin_budget'])
 back_thread = Thread(target=back.run, name='backend', kwargs=back_settings)
 front_thread = None
 if 'netacquire_address' in settings:
@@ -78,6 +133,13 @@ if 'netacquire_address' in settings:
         'backend_sub_address': settings['pub_spec'],
         'backend_push_address': settings['push_spec'],
         'accept_address': accept_address,
+        'codec_name': settings['codec'],
+        'client_buffer': int(settings['netacquire_client_buffer']),
+        'slow_client': settings['netacquire_slow_client'],
+        'send_hwm': back_settings['send_hwm'],
+        'recv_hwm': back_settings['recv_hwm'],
+        'backend_queue_limit': int(settings['netacquire_backend_queue_limit']),
+        'stats_address': settings['netacquire_stats_spec'] or None,
     }
     front_thread = Thread(target=front.run, name='netacquire', 
                           kwargs=front_settings)
@@ -89,7 +151,9 @@ if 'mongrel2_send_spec' in settings:
                             send_spec=settings['mongrel2_send_spec'], 
                             recv_spec=settings['mongrel2_recv_spec'])
         h.run(backend_sub_address=settings['pub_spec'], 
-              backend_push_address=settings['push_spec'])
+              backend_push_address=settings['push_spec'], 
+              codec_name=settings['codec'], 
+              stats_address=settings['mongrel2_stats_spec'] or None)
     http_thread = Thread(target=http, name='http')
 
 back_thread.start()
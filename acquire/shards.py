@@ -0,0 +1,460 @@
+# Run games across several processes. A router binds the same PULL and PUB
+# sockets as a lone Backend, so frontends can't tell the difference, and looks
+# after logging in, lobby chat, the games list and game numbering itself.
+# Everything to do with a game goes to the worker process that owns it: game
+# number n lives on worker n % workers. Workers are Backends that hear from the
+# router instead of the frontends, and whose messages go back through the
+# router to be published as they are.
+#
+# Workers can keep their games in journals, one each. A restarted worker tells
+# the lobby about the games it restored, then says it's ready, and the router
+# waits for every worker to be ready before numbering any games. Which worker 
+# has a game depends on how many there are, so the number is saved alongside 
+# the journals, and the router won't start with any other.
+
+import errno
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import zmq
+from multiprocessing import Process
+
+from acquire import codec, gametools, topics
+from acquire.archive import Archive, Reaper
+from acquire.backend import Backend, set_hwms
+from acquire.journal import Journal, sync_directory
+from acquire.timers import Timers
+
+# Messages the router passes on to whichever worker has the player's game.
+player_game_paths = """leave_game play_game play_tile create_hotel
+                       choose_survivor disburse_shares purchase
+                       game_chat""".split()
+
+# The topic of a worker's message to the router that it's ready.
+ready_topic = 'ready'
+
+
+class Worker(Backend):
+    """A Backend for just the games the router gives it."""
+
+    def __init__(self):
+        # The router gave the log its handler before starting this process.
+        self.log = logging.getLogger('Backend')
+        self.timers = Timers(log=self.log)
+        self.turn_limit = 0
+        self.turn_clocks = {}
+        self.start_stats('acquire_worker')
+        self.logged_out = set()
+
+    def run(self, in_address, out_address, game_updates='full',
+            pub_batch=False, journal_path=None, snapshot_every=10000,
+            codec_name='json', send_hwm=0, recv_hwm=0, pub_queue_limit=10000,
+            reap_every=60, finished_idle=600, lobby_idle=1800,
+            archive_path=None, turn_limit=0):
+        """Take messages from the router at in_address and send messages back
+        to it at out_address. The rest is as for Backend.run.
+        """
+        self.context = zmq.Context()
+        out_socket = self.context.socket(zmq.PUSH)
+        set_hwms(out_socket, send_hwm=send_hwm)
+        out_socket.connect(out_address)
+        in_socket = self.context.socket(zmq.PULL)
+        set_hwms(in_socket, recv_hwm=recv_hwm)
+        in_socket.connect(in_address)
+        journal = journal_path and Journal(journal_path, snapshot_every)
+        reaper = reap_every and Reaper(reap_every, finished_idle, lobby_idle,
+                                       archive_path and Archive(archive_path))
+        self.serve(out_socket, in_socket, game_updates, pub_batch, 
+                   journal=journal, codec_name=codec_name, 
+                   pub_queue_limit=pub_queue_limit, reaper=reaper,
+                   turn_limit=turn_limit)
+
+    def restore_games(self, games, last_number):
+        """Pick up the restored games and tell the lobby about them, then let
+        the router know this worker is ready.
+        """
+        Backend.restore_games(self, games, last_number)
+        for game in games:
+            self.send_lobby_game_to_frontends('add', game)
+        self.pub_queue.append((ready_topic, {'last_number': last_number}))
+
+    def login_message(self, message):
+        """The router let in a player who's in one of this worker's games."""
+        player = message['player']
+        self.logged_out.discard(player)
+        self.send_to_frontends('logged_in', player=player,
+                               game=self.game_for_player(player))
+
+    def logout_message(self, message):
+        """The router let out a player who's in one of this worker's games."""
+        self.logged_out.add(message['player'])
+        Backend.logout_message(self, message)
+
+    def forget_game(self, game):
+        """Forget the game, and who logged out of it if they've no other game 
+        here, so logged_out only keeps players this worker still has games for.
+        """
+        Backend.forget_game(self, game)
+        for player in game['players']:
+            if self.game_for_player(player['name']) is None:
+                self.logged_out.discard(player['name'])
+
+    def host_gone(self, game):
+        """Returns True if the game's host has logged out. A worker only 
+        hears about players in its games, so it goes by who logged out 
+        rather than who logged in.
+        """
+        host = gametools.host(game)
+        return host is None or host['name'] in self.logged_out
+
+    def start_game_message(self, message):
+        """Start a game numbered by the router."""
+        self.assigned_number = message.get('game_number')
+        Backend.start_game_message(self, message)
+
+    def next_game_number(self):
+        """Returns the number the router picked for the game being started."""
+        return self.assigned_number
+
+
+def check_workers(journal_path, workers):
+    """Make sure the worker journals named after journal_path are for this 
+    many workers, noting the number down in journal_path.workers if it hasn't 
+    been yet.
+    
+    Raises ValueError if they're for some other number of workers, who would 
+    each have the wrong games.
+    """
+    path = journal_path + '.workers'
+    try:
+        with open(path) as f:
+            saved = int(f.read())
+    except IOError, e:
+        if e.errno != errno.ENOENT:
+            raise
+    else:
+        if saved != workers:
+            raise ValueError('the journals at %s are for %d workers, not %d; '
+                             'run with workers = %d' % 
+                             (journal_path, saved, workers, saved))
+        return
+    with open(path + '.new', 'w') as f:
+        f.write('%d\n' % workers)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(path + '.new', path)
+    sync_directory(path)
+
+def run_worker(*args):
+    """Run a worker until the router goes away. Meant for a child process."""
+    Worker().run(*args)
+
+
+class Router(Backend):
+    """Log players in and out, pass chat around the lobby, and hand everything
+    to do with games to the worker owning the game.
+
+    The router learns who is in which game from the workers' lobby messages
+    as it passes them on. Until it hears back, a player who just asked to
+    start, join or leave a game is taken to be on the worker that was asked,
+    so whatever the player sends next ends up in the same place.
+    """
+
+    #### Logging in and out.
+
+    def login_message(self, message):
+        """A player wants to log in. A player still in a game is logged in by
+        the game's worker, so it can send the game along.
+        """
+        player = message['player']
+        if player in self.players:
+            Backend.login_message(self, message)
+            return
+        self.players.add(player)
+        worker = self.worker_for_player(player)
+        if worker is None:
+            self.send_to_frontends('logged_in', player=player, game=None)
+            self.log.debug('Hello %s!', player)
+        else:
+            self.forward(worker, message)
+
+    def logout_message(self, message):
+        """A player has left."""
+        player = message['player']
+        self.players.discard(player)
+        worker = self.worker_for_player(player)
+        if worker is None:
+            self.send_to_frontends('logged_out', player=player)
+            self.log.debug('Goodbye %s.', player)
+        else:
+            self.forward(worker, message)
+
+
+    #### Starting, joining and leaving games.
+
+    def start_game_message(self, message):
+        """Someone's starting a new game. It goes on the player's worker, if
+        they have one, so the worker can tell them to leave their game first.
+        """
+        player = message['player']
+        worker = self.worker_for_player(player)
+        if worker is None:
+            worker = (self._next_game_number + 1) % len(self.worker_sockets)
+        message['game_number'] = self.next_game_number(worker)
+        self.pending[player] = worker
+        self.forward(worker, message)
+
+    def join_game_message(self, message):
+        """Someone wants to join a game. If they're already in one, its worker
+        turns them down.
+        """
+        player = message['player']
+        worker = self.in_game.get(player)
+        if worker is None:
+            worker = self.worker_for_game(message['game_number'])
+            self.pending[player] = worker
+        self.forward(worker, message)
+
+    def leave_game_message(self, message):
+        """Someone wants to leave their game."""
+        player = message['player']
+        worker = self.worker_for_player(player)
+        if worker is not None:
+            self.pending[player] = self.in_game.pop(player, worker)
+            self.forward(worker, message)
+
+    def game_snapshot_message(self, message):
+        """A frontend wants all of a game."""
+        self.forward(self.worker_for_game(message['game_number']), message)
+
+
+    #### Hearing back from workers.
+
+    def worker_messages(self, parts):
+        """Note any changes to who's in which game or what's in the lobby from
+        a worker's messages, which are otherwise passed on untouched.
+        """
+        if parts[0] != topics.lobby:
+            return
+        for part in parts[1:]:
+            message = self.codec.decode(part)
+            path = message['path']
+            if path in ('started_game', 'joined_game'):
+                number = message['game']['number']
+                self.in_game[message['player']] = self.worker_for_game(number)
+                self.pending.pop(message['player'], None)
+            elif path == 'left_game':
+                self.in_game.pop(message['player'], None)
+                self.pending.pop(message['player'], None)
+            elif path == 'lobby_game':
+                if message['event'] == 'remove':
+                    number = message['game_number']
+                    summary = self.summaries.pop(number, None)
+                    if summary:
+                        # A reaped game's players are in no game now.
+                        worker = self.worker_for_game(number)
+                        for player in summary['players']:
+                            if self.in_game.get(player) == worker:
+                                del self.in_game[player]
+                else:
+                    summary = message['summary']
+                    self.summaries[summary['number']] = summary
+                    worker = self.worker_for_game(summary['number'])
+                    for player in summary['players']:
+                        self.in_game[player] = worker
+
+
+    #### Helpers
+
+    def run(self, pub_address="tcp://127.0.0.1:16180",
+            pull_address="tcp://127.0.0.1:27183", game_updates='full',
+            pub_batch=False, workers=2, journal_path=None,
+            snapshot_every=10000, codec_name='json', send_hwm=0, recv_hwm=0,
+            pub_queue_limit=10000, stats_address=None, reap_every=60,
+            finished_idle=600, lobby_idle=1800, archive_path=None,
+            turn_limit=0):
+        """Start the given number of worker processes, then route messages
+        between them and the frontends, with PUB and PULL sockets on the given
+        addresses. The other settings are as for Backend.run, and are passed
+        on to the workers; each worker's journal is journal_path with its
+        number on the end, as is each worker's archive_path. The router talks 
+        to the workers with the same codec
+        and high-water marks as to the frontends. The stats at stats_address
+        are the router's; handler times for game messages are how long they
+        took to forward.
+        
+        Raises ValueError if the journals were kept by a different number of 
+        workers (see check_workers).
+        """
+        if journal_path:
+            check_workers(journal_path, workers)
+        # Start the workers before this process has a zmq context, so they 
+        # don't inherit one. They talk to the router over IPC.
+        ipc_dir = tempfile.mkdtemp(prefix='acquire-')
+        out_address = 'ipc://' + os.path.join(ipc_dir, 'out')
+        in_addresses = ['ipc://' + os.path.join(ipc_dir, 'in%d' % i)
+                        for i in xrange(workers)]
+        processes = []
+        for i, address in enumerate(in_addresses):
+            worker_journal = journal_path and '%s.%d' % (journal_path, i)
+            worker_archive = archive_path and '%s.%d' % (archive_path, i)
+            processes.append(Process(target=run_worker, name='worker %d' % i,
+                                     args=(address, out_address, game_updates,
+                                           pub_batch, worker_journal,
+                                           snapshot_every, codec_name,
+                                           send_hwm, recv_hwm,
+                                           pub_queue_limit, reap_every,
+                                           finished_idle, lobby_idle,
+                                           worker_archive, turn_limit)))
+        for process in processes:
+            process.daemon = True
+            process.start()
+
+        # Socket setup.
+        self.context = zmq.Context()
+        self.out_socket = self.context.socket(zmq.PULL)
+        set_hwms(self.out_socket, recv_hwm=recv_hwm)
+        self.out_socket.bind(out_address)
+        self.worker_sockets = []
+        for address in in_addresses:
+            socket = self.context.socket(zmq.PUSH)
+            set_hwms(socket, send_hwm=send_hwm)
+            socket.bind(address)
+            self.worker_sockets.append(socket)
+        pub_socket = self.context.socket(zmq.PUB)
+        set_hwms(pub_socket, send_hwm=send_hwm)
+        pub_socket.bind(pub_address)
+        pull_socket = self.context.socket(zmq.PULL)
+        set_hwms(pull_socket, recv_hwm=recv_hwm)
+        pull_socket.bind(pull_address)
+        self.log.info("Acquire router is listening on %s", pull_address)
+        self.log.info("                and sending on %s", pub_address)
+        self.log.info("                 with %d workers", workers)
+        stats_socket = stats_address and self.bind_stats(stats_address)
+        self.log.info("Press CTRL-D to exit.")
+
+        self.in_game = {}
+        self.pending = {}
+        self.summaries = {}
+        self._next_game_number = 0
+        try:
+            self.pub_socket = pub_socket
+            self.codec = codec.named(codec_name)
+            self.ready = 0
+            while self.ready < workers:
+                self.out_socket.poll()
+                self.pass_on_messages()
+            self.serve(pub_socket, pull_socket, game_updates, pub_batch,
+                       sys.stdin, codec_name=codec_name,
+                       pub_queue_limit=pub_queue_limit,
+                       stats_socket=stats_socket)
+        finally:
+            for process in processes:
+                process.terminate()
+            shutil.rmtree(ipc_dir, ignore_errors=True)
+
+    def _runloop(self):
+        """A single run-through of all sockets handled by this router."""
+        events = self.poll()
+        if self.pull_socket in events:
+            self.receive_messages()
+        if self.out_socket in events:
+            self.pass_on_messages()
+        if self.stdin.fileno() in events:
+            for _ in self.stdin:
+                pass
+            sys.exit(0)
+        if self.pub_socket in events:
+            self.publish_messages()
+        if self.stats_socket in events:
+            self.stats.answer(self.stats_socket,
+                              {'profile': self.profiler.command})
+        self.timers.run_due()
+
+    def start_polling(self):
+        """Listen to the workers too."""
+        Backend.start_polling(self)
+        self.poller.register(self.out_socket, zmq.POLLIN)
+
+    def pass_on_messages(self, limit=100):
+        """Publish what the workers have sent, up to limit of their multipart
+        messages.
+        """
+        for _ in xrange(limit):
+            try:
+                parts = self.out_socket.recv_multipart(zmq.NOBLOCK)
+            except zmq.ZMQError, e:
+                if e.errno == zmq.EAGAIN:
+                    return
+                raise
+            if parts[0] == ready_topic:
+                last_number = self.codec.decode(parts[1])['last_number']
+                self._next_game_number = max(self._next_game_number, 
+                                             last_number)
+                self.ready += 1
+                continue
+            try:
+                self.worker_messages(parts)
+            except Exception:
+                self.log.exception('error reading worker messages')
+            self.pub_socket.send_multipart(parts)
+            self.bytes_out.add(n=sum(map(len, parts)))
+
+    def forward(self, worker, message):
+        """Send message to the numbered worker."""
+        self.worker_sockets[worker].send(self.codec.encode(message))
+
+    def route_message(self, message):
+        """Pass messages about a player's game to its worker, and handle the
+        rest here.
+        """
+        if message['path'] in player_game_paths:
+            worker = self.worker_for_player(message['player'])
+            if worker is not None:
+                self.forward(worker, message)
+        else:
+            Backend.route_message(self, message)
+
+    def worker_for_player(self, player):
+        """Returns the worker with the named player's game, or the worker
+        they were last sent to, or None if neither.
+        """
+        worker = self.in_game.get(player)
+        if worker is None:
+            worker = self.pending.get(player)
+        return worker
+
+    def worker_for_game(self, game_number):
+        """Returns the worker that owns the numbered game. Anything that isn't
+        a game number goes to the first worker, which can say so.
+        """
+        if isinstance(game_number, (int, long)):
+            return game_number % len(self.worker_sockets)
+        return 0
+
+    def restore_games(self, games, last_number):
+        """The router keeps no games of its own, and goes on numbering new 
+        ones from the last number the workers had when they got ready.
+        """
+    
+    def next_game_number(self, worker):
+        """Returns a unique game number for a game on the given worker."""
+        number = self._next_game_number + 1
+        number += (worker - number) % len(self.worker_sockets)
+        self._next_game_number = number
+        return number
+
+    def send_games_list_to_frontends(self):
+        """Send the lobby summaries of all games to the frontends."""
+        summaries = [self.summaries[n] for n in sorted(self.summaries)]
+        self.send_to_frontends('games_list', games_list=summaries)
+
+    def count_games(self):
+        """Returns the number of games the workers have."""
+        return len(self.summaries)
+
+
+if __name__ == '__main__':
+    Router().run()
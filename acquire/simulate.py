@@ -0,0 +1,278 @@
+# Play whole games of Acquire with bots, straight through gametools, to see how
+# fast the game engine goes. Games are spread over a pool of processes, and
+# each process times every call it makes into gametools.
+#
+#     python acquire/simulate.py --games 1000 --policy random --policy greedy
+
+import optparse
+import random
+import sys
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+from timeit import default_timer as timer
+try:
+    import acquire
+except ImportError:
+    import os
+    path_here = os.path.dirname(os.path.realpath(__file__))
+    sys.path.insert(0, os.path.realpath(os.path.join(path_here, '../')))
+from acquire import gametools
+
+
+#### Bots
+#
+# A bot decides what its player does next. There's a method per action that
+# can be at the head of a game's action queue, each returning the arguments
+# for the matching gametools function.
+
+class RandomBot(object):
+    """Does any old thing that's allowed."""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def play_tile(self, game, player):
+        """Returns a tile to play, or None if no tile on the rack can be
+        played.
+        """
+        playable = gametools.playable_tiles(game, player)
+        return self.rng.choice(playable) if playable else None
+
+    def create_hotel(self, game, player):
+        """Returns the hotel to create."""
+        return self.rng.choice(gametools.hotels_off_board(game))
+
+    def choose_survivor(self, game, player, choices):
+        """Returns the hotel that survives the merge."""
+        return gametools.hotel_named(game, self.rng.choice(choices))
+
+    def disburse_shares(self, game, player, hotel_name, survivor):
+        """Returns a disbursement of the player's shares in hotel_name."""
+        held = player['shares'][hotel_name]
+        trade = self.rng.randint(0, held) // 2 * 2
+        trade = min(trade, 2 * gametools.bank_shares(game, survivor))
+        sell = self.rng.randint(0, held - trade)
+        return {'hotel': hotel_name, 'trade': trade, 'sell': sell}
+
+    def purchase(self, game, player):
+        """Returns a purchase order and whether to end the game."""
+        order = {}
+        cash = player['cash']
+        on_board = gametools.hotels_on_board(game)
+        for _ in xrange(self.rng.randint(0, 3) if on_board else 0):
+            hotel = self.rng.choice(on_board)
+            price = gametools.share_price(hotel)
+            bought = order.get(hotel['name'], 0)
+            if price <= cash and bought < gametools.bank_shares(game, hotel):
+                order[hotel['name']] = bought + 1
+                cash -= price
+        return order, gametools.game_can_end(game)
+
+
+class GreedyBot(RandomBot):
+    """Grows whatever it owns most of, and buys as much of that as it can."""
+
+    def favourite(self, player, hotels):
+        """Returns whichever of hotels the player holds the most shares in."""
+        return max(hotels, key=lambda h: (player['shares'][h['name']],
+                                          len(h['tiles'])))
+
+    def play_tile(self, game, player):
+        playable = gametools.playable_tiles(game, player)
+        if not playable:
+            return None
+        creators = set(gametools.tiles_that_create_hotels(game))
+        def value(tile):
+            if tile in creators:
+                return 100
+            hotels = gametools.hotels_adjacent_to_tile(game, tile)
+            return sum(player['shares'][h['name']] for h in hotels)
+        return max(playable, key=value)
+
+    def create_hotel(self, game, player):
+        return gametools.hotels_off_board(game)[-1]
+
+    def choose_survivor(self, game, player, choices):
+        hotels = [gametools.hotel_named(game, name) for name in choices]
+        return self.favourite(player, hotels)
+
+    def disburse_shares(self, game, player, hotel_name, survivor):
+        held = player['shares'][hotel_name]
+        trade = min(held // 2, gametools.bank_shares(game, survivor)) * 2
+        return {'hotel': hotel_name, 'trade': trade, 'sell': held - trade}
+
+    def purchase(self, game, player):
+        order = {}
+        affordable = [h for h in gametools.hotels_on_board(game)
+                        if gametools.share_price(h) <= player['cash'] and
+                           gametools.bank_shares(game, h)]
+        if affordable:
+            hotel = self.favourite(player, affordable)
+            price = gametools.share_price(hotel)
+            order[hotel['name']] = min(3, player['cash'] // price,
+                                       gametools.bank_shares(game, hotel))
+        winning = player in gametools.winners(game)
+        return order, winning and gametools.game_can_end(game)
+
+
+policies = {
+    'random': RandomBot,
+    'greedy': GreedyBot,
+}
+
+
+#### Playing
+
+def play_game(seed, policy_names, max_moves=1000):
+    """Play one game through to the end, one player per policy name, seeding
+    the game and the bots' random number generator with seed.
+
+    Returns the number of moves made and whether the game stalled (nobody could
+    play a tile or end it) instead of ending.
+    """
+    rng = random.Random(seed)
+    game = gametools.new_game(seed, seed)
+    bots = {}
+    for i, policy_name in enumerate(policy_names):
+        name = '%s%d' % (policy_name, i)
+        gametools.add_player_named(game, name)
+        bots[name] = policies[policy_name](rng)
+    gametools.start_game(game)
+    moves = 0
+    while not game['ended'] and moves < max_moves:
+        first_action = game['action_queue'][0]
+        action = first_action['action']
+        player = gametools.player_named(game, first_action['player'])
+        bot = bots[player['name']]
+        if action == 'play_tile':
+            tile = bot.play_tile(game, player)
+            if tile is None:
+                return moves, True
+            gametools.play_tile(game, player, tile)
+        elif action == 'create_hotel':
+            gametools.create_hotel(game, player,
+                                   bot.create_hotel(game, player))
+        elif action == 'choose_survivor':
+            survivor = bot.choose_survivor(game, player,
+                                           first_action['choices'])
+            gametools.choose_survivor(game, player, survivor)
+        elif action == 'disburse_shares':
+            survivor = gametools.hotel_named(game, first_action['survivor'])
+            disbursement = bot.disburse_shares(game, player,
+                                               first_action['hotel'], survivor)
+            gametools.disburse_shares(game, player, disbursement)
+        elif action == 'purchase':
+            order, end_game = bot.purchase(game, player)
+            gametools.purchase(game, player, order, end_game)
+        moves += 1
+    return moves, not game['ended']
+
+
+timed_functions = """start_game play_tile create_hotel choose_survivor
+                     disburse_shares purchase""".split()
+
+def timed(function, times):
+    """Returns a wrapper around function that adds each call's duration to
+    times[function name].
+    """
+    name = function.__name__
+    def wrapper(*args, **kwargs):
+        start = timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            times[name][0] += 1
+            times[name][1] += timer() - start
+    return wrapper
+
+def play_games(job):
+    """Play a batch of games in this process. job is a tuple of the seeds to
+    use and the policy names of the players.
+
+    Returns a dict of totals: games, moves, stalled games, and a mapping of
+    gametools function name to [calls, seconds].
+    """
+    seeds, policy_names = job
+    times = defaultdict(lambda: [0, 0.0])
+    originals = dict((n, getattr(gametools, n)) for n in timed_functions)
+    for name, function in originals.iteritems():
+        setattr(gametools, name, timed(function, times))
+    totals = {'games': 0, 'moves': 0, 'stalled': 0}
+    try:
+        for seed in seeds:
+            moves, stalled = play_game(seed, policy_names)
+            totals['games'] += 1
+            totals['moves'] += moves
+            totals['stalled'] += int(stalled)
+    finally:
+        for name, function in originals.iteritems():
+            setattr(gametools, name, function)
+    totals['times'] = dict(times)
+    return totals
+
+
+def simulate(games, policy_names, processes=None, seed=0, batch_size=50):
+    """Play games across a pool of processes. Returns the summed totals from
+    play_games, plus the elapsed wall time in seconds.
+    """
+    seeds = range(seed, seed + games)
+    jobs = [(seeds[i:i + batch_size], policy_names)
+            for i in xrange(0, games, batch_size)]
+    start = time.time()
+    if processes == 1:
+        results = map(play_games, jobs)
+    else:
+        pool = Pool(processes)
+        try:
+            results = pool.map(play_games, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    totals = {'games': 0, 'moves': 0, 'stalled': 0,
+              'times': defaultdict(lambda: [0, 0.0])}
+    for result in results:
+        for key in ('games', 'moves', 'stalled'):
+            totals[key] += result[key]
+        for name, (calls, seconds) in result['times'].iteritems():
+            totals['times'][name][0] += calls
+            totals['times'][name][1] += seconds
+    totals['elapsed'] = time.time() - start
+    return totals
+
+def report(totals):
+    """Print a summary of simulate's totals."""
+    elapsed = totals['elapsed']
+    print '%d games (%d stalled), %d moves in %.2fs' % (
+        totals['games'], totals['stalled'], totals['moves'], elapsed)
+    print '%.1f games/s, %.1f moves/s' % (totals['games'] / elapsed,
+                                          totals['moves'] / elapsed)
+    print '%-16s %10s %12s %12s' % ('function', 'calls', 'total s', 'per call')
+    for name in timed_functions:
+        calls, seconds = totals['times'].get(name, (0, 0.0))
+        per_call = '%.1fus' % (seconds / calls * 1e6) if calls else '-'
+        print '%-16s %10d %12.3f %12s' % (name, calls, seconds, per_call)
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--games', type='int', default=100,
+                      help='number of games to play [%default]')
+    parser.add_option('-p', '--policy', action='append', dest='policies',
+                      choices=sorted(policies),
+                      help='add a player with this policy (%s); may be given '
+                           'up to six times [random x4]' %
+                           ', '.join(sorted(policies)))
+    parser.add_option('-j', '--processes', type='int', default=None,
+                      help='worker processes [one per CPU]')
+    parser.add_option('-s', '--seed', type='int', default=0,
+                      help='seed of the first game [%default]')
+    options, _ = parser.parse_args(argv)
+    policy_names = options.policies or ['random'] * 4
+    if len(policy_names) > 6:
+        parser.error('at most six players')
+    report(simulate(options.games, policy_names, options.processes,
+                    options.seed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+# Counters, latency histograms and gauges for a running backend or frontend,
+# cheap enough to leave on. Each process keeps one Stats, and can answer for it
+# on a 0MQ REP socket: send 'prometheus' for the Prometheus text format, or
+# anything else for JSON. The socket takes a few commands too, such as
+# 'profile' (see the profiling module). To ask from the command line:
+#
+#     python acquire/stats.py tcp://127.0.0.1:16182 [prometheus | COMMAND...]
+
+import json
+import sys
+from bisect import bisect_left
+from timeit import default_timer as timer
+try:
+    import acquire
+except ImportError:
+    import os
+    path_here = os.path.dirname(os.path.realpath(__file__))
+    sys.path.insert(0, os.path.realpath(os.path.join(path_here, '../')))
+
+# Upper bounds, in seconds, of the latency histograms' buckets. Anything
+# slower goes in a last bucket of its own.
+latency_bounds = (0.00001, 0.00003, 0.0001, 0.0003, 0.001, 0.003, 0.01, 0.03,
+                  0.1, 0.3, 1.0, 3.0)
+
+
+class Counter(object):
+    """A count that only goes up, one per label value (or just the one, for
+    None, if the counter has no label).
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}
+
+    def add(self, key=None, n=1):
+        """Add n to the count for key."""
+        self.values[key] = self.values.get(key, 0) + n
+
+    def sample(self):
+        """Returns a dict of label value to count."""
+        return self.values
+
+
+class Histogram(object):
+    """How many observations fell in each of some buckets, their total and
+    their number, per label value.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, label=None, bounds=latency_bounds):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.bounds = bounds
+        self.values = {}
+
+    def observe(self, key, value):
+        """Note one observation of value for key."""
+        try:
+            counts = self.values[key]
+        except KeyError:
+            counts = self.values[key] = [0] * (len(self.bounds) + 1) + [0.0]
+        counts[bisect_left(self.bounds, value)] += 1
+        counts[-1] += value
+
+    def sample(self):
+        """Returns a dict of label value to a dict of the count, sum and
+        cumulative bucket counts (keyed by upper bound) of its observations.
+        """
+        samples = {}
+        for key, counts in self.values.iteritems():
+            buckets = []
+            total = 0
+            for bound, count in zip(self.bounds + ('+Inf',), counts):
+                total += count
+                buckets.append((bound, total))
+            samples[key] = {'count': total, 'sum': counts[-1],
+                            'buckets': buckets}
+        return samples
+
+
+class Gauge(object):
+    """A value worked out when asked for, by calling function. function
+    returns a number, or a dict of label value to number for a gauge with a
+    label. A count kept somewhere else can be a Gauge of kind 'counter'.
+    """
+
+    def __init__(self, name, help, function, label=None, kind='gauge'):
+        self.name = name
+        self.help = help
+        self.function = function
+        self.label = label
+        self.kind = kind
+
+    def sample(self):
+        """Returns a dict of label value to the gauge's value."""
+        value = self.function()
+        if self.label is None:
+            return {None: value}
+        return value
+
+
+class Stats(object):
+    """The metrics of one process. Metric names are given prefix_ in front
+    when reported.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.metrics = []
+        self.started = timer()
+
+    def counter(self, name, help, label=None):
+        """Returns a new Counter, reported with the others."""
+        return self.add(Counter(name, help, label))
+
+    def histogram(self, name, help, label=None, bounds=latency_bounds):
+        """Returns a new Histogram, reported with the others."""
+        return self.add(Histogram(name, help, label, bounds))
+
+    def gauge(self, name, help, function, label=None, kind='gauge'):
+        """Returns a new Gauge, reported with the others."""
+        return self.add(Gauge(name, help, function, label, kind))
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def to_dict(self):
+        """Returns every metric's current values, as a dict of metric name to
+        either the value, for metrics without a label, or a dict of label
+        value to value.
+        """
+        report = {'uptime_seconds': timer() - self.started}
+        for metric in self.metrics:
+            sample = metric.sample()
+            if metric.label is None:
+                report[metric.name] = sample.get(None, 0)
+            else:
+                report[metric.name] = dict(sample)
+        return report
+
+    def to_json(self):
+        """Returns to_dict as JSON."""
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    def to_prometheus(self):
+        """Returns every metric's current values in the Prometheus text
+        format.
+        """
+        lines = []
+        def line(name, labels, value):
+            if labels:
+                label_text = ','.join('%s="%s"' % (k, escape_label(v))
+                                      for k, v in labels)
+                lines.append('%s{%s} %s' % (name, label_text, 
+                                            format_value(value)))
+            else:
+                lines.append('%s %s' % (name, format_value(value)))
+        uptime = '%s_uptime_seconds' % self.prefix
+        lines.append('# HELP %s Seconds since the process started.' % uptime)
+        lines.append('# TYPE %s gauge' % uptime)
+        line(uptime, [], timer() - self.started)
+        for metric in self.metrics:
+            name = '%s_%s' % (self.prefix, metric.name)
+            lines.append('# HELP %s %s' % (name, metric.help))
+            lines.append('# TYPE %s %s' % (name, metric.kind))
+            for key, value in sorted(metric.sample().iteritems()):
+                labels = [] if metric.label is None else [(metric.label, key)]
+                if metric.kind == 'histogram':
+                    for bound, count in value['buckets']:
+                        line(name + '_bucket', labels + [('le', bound)], count)
+                    line(name + '_sum', labels, value['sum'])
+                    line(name + '_count', labels, value['count'])
+                else:
+                    line(name, labels, value)
+        return '\n'.join(lines) + '\n'
+
+    def answer(self, socket, commands=None):
+        """Reply to a request waiting on a REP socket. A request starting 
+        with the name of one of commands, a dict of name to function, is 
+        answered with what the function returns when called with the rest of 
+        the request's words. A request is always answered, even if its 
+        command fails, so the socket is ready for the next.
+        """
+        words = socket.recv().split()
+        if words and commands and words[0] in commands:
+            try:
+                reply = commands[words[0]](*words[1:])
+            except ValueError, e:
+                reply = 'error: %s' % e
+            except Exception, e:
+                reply = 'error: %s: %s' % (e.__class__.__name__, e)
+            socket.send(reply)
+        elif words == ['prometheus']:
+            socket.send(self.to_prometheus())
+        else:
+            socket.send(self.to_json())
+
+
+def escape_label(value):
+    """Returns value escaped for use as a Prometheus label value."""
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+                      .replace('\n', '\\n'))
+
+def format_value(value):
+    """Returns a number as Prometheus writes it."""
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def main(argv=None):
+    import zmq
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print 'usage: %s address [prometheus | command...]' % sys.argv[0]
+        return 2
+    socket = zmq.Context.instance().socket(zmq.REQ)
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.connect(argv[0])
+    socket.send(' '.join(argv[1:]) or 'json')
+    if not socket.poll(5000):
+        print 'no answer from %s' % argv[0]
+        return 1
+    print socket.recv()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# Calls to make later, for processes whose loops otherwise only wake up when a
+# message comes in. Each loop keeps one Timers, polls no longer than its
+# timeout, and calls run_due each time round:
+#
+#     timers = Timers()
+#     timer = timers.call_later(30, turn_over, game)
+#     timers.cancel(timer)
+#     reaping = timers.call_every(60, reap_games)
+#     ...
+#     poller.poll(timers.timeout())
+#     timers.run_due()
+#
+# Timers are kept in a heap, as plain lists of [deadline, sequence, function,
+# args, interval], so there can be millions of them: adding one is a heappush,
+# and cancelling one just blanks its function, to be thrown away when it comes
+# up (or sooner, if cancelled timers outnumber the live ones). Run this module
+# to time them:
+#
+#     python acquire/timers.py --timers 1000000
+
+import logging
+import optparse
+import random
+from heapq import heapify, heappop, heappush
+from itertools import count
+from timeit import default_timer as timer
+
+# Below this many cancelled timers, the heap isn't worth cleaning out.
+compact_minimum = 1024
+
+
+class Timers(object):
+    """Calls to make at set times on clock, which returns seconds. Errors
+    raised by the calls are logged, and don't stop the others.
+    """
+
+    def __init__(self, clock=timer, log=None):
+        self.clock = clock
+        self.log = log or logging.getLogger('Timers')
+        self.heap = []
+        self.cancelled = 0
+        self.sequence = count()
+
+    def __len__(self):
+        return len(self.heap) - self.cancelled
+
+    def call_at(self, deadline, function, *args):
+        """Call function with args once clock reaches deadline. Returns the
+        timer, to cancel it with.
+        """
+        entry = [deadline, next(self.sequence), function, args, None]
+        heappush(self.heap, entry)
+        return entry
+
+    def call_later(self, delay, function, *args):
+        """Call function with args in delay seconds. Returns the timer, to
+        cancel it with.
+        """
+        return self.call_at(self.clock() + delay, function, *args)
+
+    def call_every(self, interval, function, *args):
+        """Call function with args every interval seconds, starting in one.
+        Returns the timer, to cancel it with.
+
+        Raises ValueError if interval isn't positive.
+        """
+        if not interval > 0:
+            raise ValueError('timer interval must be positive, not %r' %
+                             (interval,))
+        entry = self.call_later(interval, function, *args)
+        entry[4] = interval
+        return entry
+
+    def cancel(self, entry):
+        """Don't make the timer's call, or any more of them. Cancelling a
+        timer that's been and gone does nothing.
+        """
+        # A timer that's still to be called is always in the heap: one-off 
+        # timers are blanked as they leave it, and repeating ones go back in 
+        # before they're called.
+        if entry is None or entry[2] is None:
+            return
+        entry[2] = entry[3] = entry[4] = None
+        self.cancelled += 1
+        if (self.cancelled > compact_minimum and
+            self.cancelled * 2 > len(self.heap)):
+            # In place, since run_due may be looking at it.
+            self.heap[:] = [e for e in self.heap if e[2] is not None]
+            heapify(self.heap)
+            self.cancelled = 0
+
+    def active(self, entry):
+        """Returns True if the timer is still to be called."""
+        return entry is not None and entry[2] is not None
+
+    def deadline(self, entry):
+        """Returns when the timer is next due, or None if it isn't."""
+        return entry[0] if self.active(entry) else None
+
+    def timeout(self):
+        """Returns how long, in milliseconds, a poll can wait before the next
+        timer is due, or None if there are none.
+        """
+        heap = self.heap
+        while heap and heap[0][2] is None:
+            heappop(heap)
+            self.cancelled -= 1
+        if not heap:
+            return None
+        return max(0, int((heap[0][0] - self.clock()) * 1000) + 1)
+
+    def run_due(self):
+        """Make every call that's due. Returns how many were made."""
+        now = self.clock()
+        heap = self.heap
+        made = 0
+        while heap and heap[0][0] <= now:
+            entry = heappop(heap)
+            function, args, interval = entry[2], entry[3], entry[4]
+            if function is None:
+                self.cancelled -= 1
+                continue
+            if interval is None:
+                entry[2] = entry[3] = None
+            else:
+                # A repeating timer that's fallen behind skips the calls it
+                # missed, rather than making them all at once.
+                entry[0] += interval
+                if entry[0] <= now:
+                    entry[0] = now + interval
+                entry[1] = next(self.sequence)
+                heappush(heap, entry)
+            try:
+                function(*args)
+            except Exception:
+                self.log.exception('error in timer calling %r', function)
+            made += 1
+        return made
+
+
+#### Timing timers
+
+def benchmark(timers_count, seed=0):
+    """Returns the microseconds per timer it took to add timers_count timers
+    over a minute of a fake clock, cancel half of them, and run the rest.
+    """
+    rng = random.Random(seed)
+    now = [0.0]
+    timers = Timers(clock=lambda: now[0])
+    calls = [0]
+    def call():
+        calls[0] += 1
+    delays = [rng.random() * 60 for _ in xrange(timers_count)]
+    results = {}
+    start = timer()
+    entries = [timers.call_later(delay, call) for delay in delays]
+    results['add'] = timer() - start
+    start = timer()
+    for entry in entries[::2]:
+        timers.cancel(entry)
+    results['cancel'] = timer() - start
+    start = timer()
+    while timers.timeout() is not None:
+        now[0] += 0.01
+        timers.run_due()
+    results['run'] = timer() - start
+    assert calls[0] == timers_count - len(entries[::2])
+    return dict((k, v * 1e6 / timers_count) for k, v in results.iteritems())
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--timers', type='int', default=100000,
+                      help='number of timers to add')
+    options, _ = parser.parse_args(argv)
+    results = benchmark(options.timers)
+    print '%d timers, microseconds per timer:' % options.timers
+    for step in ('add', 'cancel', 'run'):
+        print '%-8s %8.2f' % (step, results[step])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# Topics for messages published by the backend. Each message goes out behind a
+# topic frame, so frontends can subscribe to just the lobby and the games and
+# players they serve, and leave libzmq to drop everything else.
+
+import zmq
+
+lobby = 'lobby'
+
+def game(number):
+    """Returns the topic for messages about the numbered game."""
+    return 'game.%d' % number
+
+def player(name):
+    """Returns the topic for messages meant for the named player alone."""
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    return 'player.' + name
+
+
+class Subscriptions(object):
+    """The topics a SUB socket is subscribed to. A topic can be added more than
+    once, say once per client in a game, and stays subscribed until it has
+    been discarded as many times.
+    """
+
+    def __init__(self, socket):
+        self.socket = socket
+        self.counts = {}
+
+    def add(self, topic):
+        """Subscribe to topic, if not already subscribed."""
+        if not self.counts.get(topic):
+            self.socket.setsockopt(zmq.SUBSCRIBE, topic)
+        self.counts[topic] = self.counts.get(topic, 0) + 1
+
+    def discard(self, topic):
+        """Give up one reason for subscribing to topic, unsubscribing once
+        there are none left.
+        """
+        count = self.counts.get(topic, 0)
+        if count == 1:
+            self.socket.setsockopt(zmq.UNSUBSCRIBE, topic)
+            del self.counts[topic]
+        elif count:
+            self.counts[topic] = count - 1
+
+    def __contains__(self, topic):
+        """Returns True if subscribed to exactly topic. Subscriptions match
+        any topic they begin, so 'game.1' also lets through 'game.12'; this
+        tells the two apart.
+        """
+        return topic in self.counts
@@ -0,0 +1,144 @@
+import json
+import logging
+import unittest
+import zmq
+from collections import deque
+
+from acquire import gametools
+from acquire.admin import Admin
+from acquire.backend import Backend
+
+class TestAdmin(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = Backend()
+        self.backend.log.disabled = True
+        self.backend.pub_queue = deque()
+        self.backend.pub_queue_limit = 10000
+        self.backend.polling_pull = True
+        self.backend.players = set()
+        self.backend.games_list = []
+        self.backend.numbered_games = {}
+        self.backend.player_games = {}
+        self.backend.published_games = {}
+        self.backend.game_updates = 'full'
+        self.backend.journal = None
+        self.backend.reaper = None
+        for player in ('alice', 'bob', 'carol'):
+            self.send('login', player=player)
+        self.send('start_game', player='alice')
+        self.send('join_game', player='bob', game_number=1)
+        self.send('start_game', player='carol')
+        self.sent_paths()
+        self.context = zmq.Context()
+        self.rep = self.context.socket(zmq.REP)
+        self.rep.bind('inproc://admin')
+        self.admin = Admin(self.backend, self.rep)
+
+    def tearDown(self):
+        self.backend.log.disabled = False
+        self.backend.log.setLevel(logging.DEBUG)
+        self.context.destroy(linger=0)
+
+    def send(self, path, **message):
+        message['path'] = path
+        self.backend.route_message(message)
+
+    def sent_paths(self):
+        paths = [m['path'] for _, m in self.backend.pub_queue]
+        self.backend.pub_queue.clear()
+        return paths
+
+    def test_over_the_socket(self):
+        reqs = []
+        for command in ('players', 'games 1', 'nonsense'):
+            req = self.context.socket(zmq.REQ)
+            req.connect('inproc://admin')
+            req.send(command)
+            reqs.append(req)
+        self.assertTrue(self.rep.poll(1000))
+        self.assertEqual(self.admin.answer(), 3)
+        answers = [json.loads(req.recv()) for req in reqs]
+        self.assertEqual(answers[0], {'logged_in': 3, 'in_games': 3})
+        self.assertEqual(answers[1]['total'], 2)
+        self.assertEqual([g['number'] for g in answers[1]['games']], [2])
+        self.assertFalse('next' in answers[1])
+        self.assertTrue('games' in answers[2]['commands'])
+        self.assertEqual(self.admin.answer(), 0)
+
+    def test_budget(self):
+        self.admin.budget = 0
+        reqs = []
+        for _ in xrange(3):
+            req = self.context.socket(zmq.REQ)
+            req.connect('inproc://admin')
+            req.send('queues')
+            reqs.append(req)
+        self.assertTrue(self.rep.poll(1000))
+        self.assertEqual(self.admin.answer(), 1)
+        self.assertEqual(self.admin.answer(), 1)
+
+    def test_games_in_pages(self):
+        answer = self.admin.command('games', '0', '1')
+        self.assertEqual([g['number'] for g in answer['games']], [1])
+        self.assertEqual(answer['next'], 1)
+        self.admin.budget = 0
+        answer = self.admin.command('games')
+        self.assertEqual([g['number'] for g in answer['games']], [1])
+        self.assertEqual(answer['next'], 1)
+        answer = self.admin.command('games', str(answer['next']))
+        self.assertEqual([g['number'] for g in answer['games']], [2])
+        self.assertFalse('next' in answer)
+
+    def test_game(self):
+        answer = self.admin.command('game', '1')
+        self.assertEqual([p['name'] for p in answer['game']['players']],
+                         ['alice', 'bob'])
+        self.assertEqual(answer['moves'], [('add_player_named', 'alice'),
+                                           ('add_player_named', 'bob')])
+        self.assertTrue('error' in self.admin.command('game', '9'))
+        self.assertTrue('error' in self.admin.command('game', 'x'))
+        self.assertTrue('error' in self.admin.command('game'))
+
+    def test_end(self):
+        self.assertTrue('error' in self.admin.command('end', '1'))
+        self.send('play_game', player='alice')
+        self.sent_paths()
+        self.assertEqual(self.admin.command('end', '1'), {'ended': 1})
+        game = self.backend.game_numbered(1)
+        self.assertTrue(game['ended'])
+        self.assertEqual(self.sent_paths(), ['game_over'])
+        self.assertEqual(gametools.replay(game.seed, game.moves, 1), game)
+        self.assertTrue('error' in self.admin.command('end', '1'))
+
+    def test_evict(self):
+        self.send('play_game', player='alice')
+        self.sent_paths()
+        self.assertEqual(self.admin.command('evict', '1'), {'evicted': 1})
+        self.assertEqual([g['number'] for g in self.backend.games_list], [2])
+        self.assertEqual(self.backend.game_for_player('bob'), None)
+        self.assertEqual(self.sent_paths(), ['game_over', 'lobby_game'])
+
+    def test_failing_command_is_answered(self):
+        def fail(number):
+            raise RuntimeError('journal gone')
+        self.backend.evict_game = fail
+        req = self.context.socket(zmq.REQ)
+        req.connect('inproc://admin')
+        req.send('evict 1')
+        self.assertTrue(self.rep.poll(1000))
+        self.assertEqual(self.admin.answer(), 1)
+        self.assertEqual(json.loads(req.recv()),
+                         {'error': 'RuntimeError: journal gone'})
+        req.send('players')
+        self.assertTrue(self.rep.poll(1000))
+        self.admin.answer()
+        self.assertEqual(json.loads(req.recv())['logged_in'], 3)
+
+    def test_log_level(self):
+        self.assertEqual(self.admin.command('log_level', 'warning'),
+                         {'log_level': 'WARNING'})
+        self.assertEqual(self.backend.log.level, logging.WARNING)
+        self.admin.command('log_level', '10')
+        self.assertEqual(self.backend.log.level, logging.DEBUG)
+        self.assertTrue('error' in self.admin.command('log_level', 'loud'))
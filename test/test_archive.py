@@ -0,0 +1,146 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import deque
+
+from acquire import gametools
+from acquire.archive import Archive, Reaper
+from acquire.backend import Backend
+
+def new_game(number, players=('alice', 'bob')):
+    game = gametools.new_game(number, number)
+    for name in players:
+        gametools.add_player_named(game, name)
+    return game
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.archive = Archive(os.path.join(self.dir, 'games.archive.gz'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_nothing_archived(self):
+        self.assertEqual(list(self.archive.games()), [])
+
+    def test_batches_read_back_in_order(self):
+        games = [new_game(n) for n in (1, 2, 3)]
+        gametools.start_game(games[0])
+        self.archive.store(games[:2])
+        self.archive.store(games[2:])
+        records = list(self.archive.games())
+        self.assertEqual([r['number'] for r in records], [1, 2, 3])
+        self.assertEqual(records[0]['game'], games[0])
+        self.assertEqual(records[0]['seed'], 1)
+        self.assertEqual(records[0]['moves'], map(list, games[0].moves))
+
+    def test_replay(self):
+        game = new_game(4)
+        gametools.start_game(game)
+        self.archive.store([game])
+        record = list(self.archive.games())[0]
+        replayed = gametools.new_game(record['number'], record['seed'])
+        for move in record['moves']:
+            gametools.make_move(replayed, move)
+        self.assertEqual(replayed['players'], game['players'])
+
+class TestReaper(unittest.TestCase):
+
+    def setUp(self):
+        self.reaper = Reaper(every=60, finished_idle=10, lobby_idle=100)
+
+    def idle(self, game, seconds):
+        self.reaper.touch(game['number'])
+        self.reaper.touched[game['number']] -= seconds
+
+    def test_reapable(self):
+        finished, stale_lobby, fresh_lobby, playing = [new_game(n)
+                                                       for n in (1, 2, 3, 4)]
+        finished['started'] = finished['ended'] = True
+        playing['started'] = True
+        self.idle(finished, 20)
+        self.idle(stale_lobby, 200)
+        self.idle(fresh_lobby, 50)
+        self.idle(playing, 1000)
+        games = [finished, stale_lobby, fresh_lobby, playing]
+        self.assertEqual(self.reaper.reapable(games, lambda g: True),
+                         ([finished], [stale_lobby]))
+        self.assertEqual(self.reaper.reapable(games, lambda g: False),
+                         ([finished], []))
+
+    def test_zero_keeps_games(self):
+        reaper = Reaper(every=60, finished_idle=0, lobby_idle=0)
+        game = new_game(1)
+        game['ended'] = True
+        reaper.touch(1)
+        reaper.touched[1] -= 1000
+        self.assertEqual(reaper.reapable([game], lambda g: True), ([], []))
+
+class TestBackendReaping(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.archive = Archive(os.path.join(self.dir, 'games.archive.gz'))
+        self.backend = Backend()
+        self.backend.log.disabled = True
+        self.backend.pub_queue = deque()
+        self.backend.players = set()
+        self.backend.games_list = []
+        self.backend.numbered_games = {}
+        self.backend.player_games = {}
+        self.backend.published_games = {}
+        self.backend.game_updates = 'full'
+        self.backend.journal = None
+        self.backend.reaper = Reaper(60, 10, 100, self.archive)
+
+    def tearDown(self):
+        self.backend.log.disabled = False
+        shutil.rmtree(self.dir)
+
+    def send(self, path, **message):
+        message['path'] = path
+        self.backend.route_message(message)
+
+    def make_idle(self, number, seconds):
+        self.backend.reaper.touched[number] -= seconds
+
+    def sent_paths(self):
+        paths = [m['path'] for _, m in self.backend.pub_queue]
+        self.backend.pub_queue.clear()
+        return paths
+
+    def test_abandoned_lobby(self):
+        self.send('login', player='alice')
+        self.send('start_game', player='alice')
+        self.make_idle(1, 200)
+        self.backend.reap_games()
+        self.assertEqual(len(self.backend.games_list), 1)
+        self.send('logout', player='alice')
+        self.sent_paths()
+        self.backend.reap_games()
+        self.assertEqual(self.backend.games_list, [])
+        self.assertEqual(self.backend.numbered_games, {})
+        self.assertEqual(self.backend.player_games, {})
+        self.assertEqual(self.sent_paths(), ['game_over', 'lobby_game'])
+        self.assertEqual(list(self.archive.games()), [])
+
+    def test_finished_game(self):
+        game = new_game(7)
+        gametools.start_game(game)
+        game['ended'] = True
+        self.backend.restore_games([game, new_game(8, ['carol'])], 8)
+        self.backend.players.update(['alice', 'bob', 'carol'])
+        self.make_idle(7, 5)
+        self.backend.reap_games()
+        self.assertEqual(len(self.backend.games_list), 2)
+        self.make_idle(7, 5)
+        self.make_idle(8, 1000)
+        self.backend.reap_games()
+        self.assertEqual([g['number'] for g in self.backend.games_list], [8])
+        self.assertEqual(self.backend.game_for_player('alice'), None)
+        self.assertEqual(self.sent_paths(), ['lobby_game'])
+        self.assertEqual([r['number'] for r in self.archive.games()], [7])
+        self.assertTrue(7 not in self.backend.reaper.touched)
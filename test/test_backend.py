@@ -0,0 +1,140 @@
+import unittest
+from collections import deque
+
+from acquire import gametools, topics
+from acquire.backend import Backend
+from acquire.timers import Timers
+
+class TestTurnClocks(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.backend = Backend()
+        self.backend.log.disabled = True
+        self.backend.timers = Timers(clock=lambda: self.now)
+        self.backend.pub_queue = deque()
+        self.backend.players = set()
+        self.backend.games_list = []
+        self.backend.numbered_games = {}
+        self.backend.player_games = {}
+        self.backend.published_games = {}
+        self.backend.game_updates = 'full'
+        self.backend.journal = None
+        self.backend.reaper = None
+        self.backend.turn_limit = 30
+        for player in ('alice', 'bob'):
+            self.send('login', player=player)
+        self.send('start_game', player='alice')
+        self.send('join_game', player='bob', game_number=1)
+        self.game = self.backend.game_numbered(1)
+
+    def tearDown(self):
+        self.backend.log.disabled = False
+
+    def send(self, path, **message):
+        message['path'] = path
+        self.backend.route_message(message)
+
+    def advance(self, seconds):
+        self.now += seconds
+        self.backend.timers.run_due()
+
+    def sent_paths(self):
+        paths = [m['path'] for _, m in self.backend.pub_queue]
+        self.backend.pub_queue.clear()
+        return paths
+
+    def play(self):
+        self.send('play_game', player='alice')
+        self.sent_paths()
+        return self.game['action_queue'][0]['player']
+
+    def test_no_clock_before_play(self):
+        self.assertEqual(self.backend.timers.timeout(), None)
+        self.advance(100)
+        self.assertEqual(self.game['started'], False)
+
+    def test_default_tile_played(self):
+        name = self.play()
+        player = gametools.player_named(self.game, name)
+        tile = gametools.playable_tiles(self.game, player)[0]
+        self.advance(29)
+        self.assertEqual(self.sent_paths(), [])
+        self.advance(1)
+        self.assertTrue(tile not in player['rack'])
+        self.assertTrue('tile_played' in self.sent_paths())
+        self.assertEqual(self.backend.turns_timed_out.values,
+                         {'play_tile': 1})
+
+    def test_moves_reset_the_clock(self):
+        self.play()
+        self.advance(20)
+        action = gametools.default_action(self.game)
+        self.send(action.pop('action'), **action)
+        self.sent_paths()
+        self.advance(20)
+        self.assertEqual(self.backend.turns_timed_out.values, {})
+        self.advance(10)
+        self.assertEqual(sum(self.backend.turns_timed_out.values.values()), 1)
+
+    def test_abandoned_game_ends(self):
+        self.play()
+        for _ in xrange(1000):
+            if self.game['ended']:
+                break
+            self.advance(30)
+        self.assertTrue(self.game['ended'])
+        self.assertEqual(self.backend.turns_timed_out.values['game_over'], 1)
+        self.assertEqual(self.sent_paths()[-1], 'game_over')
+        self.assertEqual(self.backend.turn_clocks, {})
+        self.assertEqual(self.backend.timers.timeout(), None)
+        self.assertEqual(gametools.replay(self.game.seed, self.game.moves, 1),
+                         self.game)
+
+    def test_stuck_game_ends(self):
+        name = self.play()
+        player = gametools.player_named(self.game, name)
+        # No tile to play, so nothing they can do.
+        player['rack'][:] = []
+        self.assertEqual(gametools.default_action(self.game), None)
+        self.advance(30)
+        self.assertTrue(self.game['ended'])
+        self.assertEqual(self.sent_paths(), ['game_over'])
+
+    def test_ended_game_has_no_clock(self):
+        self.play()
+        self.assertEqual(list(self.backend.turn_clocks), [1])
+        gametools.force_game_over(self.game)
+        self.backend.record_game(self.game)
+        self.assertEqual(self.backend.turn_clocks, {})
+        self.assertEqual(self.backend.timers.timeout(), None)
+
+    def test_forgotten_game_has_no_clock(self):
+        self.play()
+        self.backend.games_list.remove(self.game)
+        self.backend.forget_game(self.game)
+        self.assertEqual(self.backend.turn_clocks, {})
+        self.assertEqual(self.backend.timers.timeout(), None)
+
+
+class TestLogin(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = Backend()
+        self.backend.log.disabled = True
+        self.backend.pub_queue = deque()
+        self.backend.players = set()
+        self.backend.games_list = []
+        self.backend.player_games = {}
+
+    def tearDown(self):
+        self.backend.log.disabled = False
+
+    def login(self, player):
+        self.backend.route_message({'path': 'login', 'player': player})
+        topic, message = self.backend.pub_queue.pop()
+        return topic, message['path']
+
+    def test_answers_go_to_the_lobby(self):
+        self.assertEqual(self.login('alice'), (topics.lobby, 'logged_in'))
+        self.assertEqual(self.login('alice'), (topics.lobby, 'duplicate_name'))
@@ -0,0 +1,95 @@
+import json
+import unittest
+
+from acquire import board, gametools
+
+class TestCells(unittest.TestCase):
+
+    def test_cell_numbers_follow_tile_ids(self):
+        self.assertEqual(board.index('1A'), 0)
+        self.assertEqual(board.index('1I'), 8)
+        self.assertEqual(board.index('2A'), 9)
+        self.assertEqual(board.index('12I'), 107)
+        for tile in ['0E', '11', '1J', '13C']:
+            self.assertEqual(board.index(tile), None)
+
+    def test_neighbours_match_adjacent_tiles(self):
+        for tile in board.tile_names:
+            neighbours = board.neighbours[board.index(tile)]
+            self.assertEqual(sorted(board.tiles_in(neighbours)),
+                             sorted(gametools.adjacent_tiles(tile)), tile)
+
+    def test_mask_round_trip(self):
+        tiles = ['1A', '5D', '12I']
+        mask = board.mask_of(tiles + ['13C'])
+        self.assertEqual(board.tiles_in(mask), tiles)
+        self.assertEqual(board.size(mask), 3)
+
+
+class TestBoard(unittest.TestCase):
+
+    def setUp(self):
+        self.game = gametools.new_game()
+        gametools.set_up_hotels(self.game)
+        self.game['lonely_tiles'] = ['1A', '8E']
+        gametools.hotel_named(self.game, 'zeta')['tiles'] = ['3C', '3D']
+
+    def test_where(self):
+        b = board.Board.from_game(self.game)
+        self.assertEqual(b.where(board.index('1A')), 'lonely')
+        self.assertEqual(b.where(board.index('3D')), 'zeta')
+        self.assertEqual(b.where(board.index('3E')), None)
+
+    def test_hotels_adjacent(self):
+        b = board.Board.from_game(self.game)
+        self.assertEqual(b.hotels_adjacent(board.index('3E')), ['zeta'])
+        self.assertEqual(b.hotels_adjacent(board.index('1B')), [])
+
+    def test_watching_notices_replaced_and_resized_lists(self):
+        b = board.Board.from_game(self.game)
+        self.assertTrue(b.watching(self.game))
+        self.game['lonely_tiles'].append('12I')
+        self.assertFalse(b.watching(self.game))
+        b.watch(self.game)
+        gametools.hotel_named(self.game, 'zeta')['tiles'] = ['3C', '4C']
+        self.assertFalse(b.watching(self.game))
+
+    def test_cached_board_is_not_serialized(self):
+        gametools.where_is_tile(self.game, '1A')
+        self.assertTrue(self.game.board)
+        decoded = json.loads(json.dumps(self.game))
+        self.assertEqual(sorted(decoded.keys()),
+                         ['ended', 'hotels', 'lonely_tiles', 'players',
+                          'started'])
+
+    def test_plain_dict_games(self):
+        game = json.loads(json.dumps(self.game))
+        self.assertEqual(gametools.where_is_tile(game, '3C'), 'zeta')
+        self.assertEqual(gametools.hotels_adjacent_to_tile(game, '2C'),
+                         [gametools.hotel_named(game, 'zeta')])
+
+
+class TestGroups(unittest.TestCase):
+
+    def test_groups_join_placed_neighbours(self):
+        groups = board.Groups()
+        for tile in ['1A', '3A', '2B']:
+            groups.add(board.index(tile))
+        self.assertNotEqual(groups.find(board.index('1A')),
+                            groups.find(board.index('3A')))
+        root = groups.add(board.index('2A'))
+        self.assertEqual(groups.sizes[root], 4)
+        self.assertEqual(sorted(board.tiles_in(groups.masks[root])),
+                         ['1A', '2A', '2B', '3A'])
+
+    def test_merge_relabels_group(self):
+        b = board.Board(0, [('zeta', board.mask_of(['1A', '2A'])),
+                            ('hydra', board.mask_of(['4A', '5A', '6A']))])
+        b.grow('hydra', board.bit('3A'))
+        self.assertEqual(b.hotels['zeta'], 0)
+        self.assertEqual(b.hotel_size('hydra'), 6)
+        self.assertEqual(b.where(board.index('1A')), 'hydra')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import json
+import unittest
+
+from acquire import codec, gametools
+
+class TestCodecs(unittest.TestCase):
+    
+    def setUp(self):
+        self.messages = codec.game_messages(3, max_moves=40)
+        self.messages.append({'path': 'lobby_chat', 'player': u'caf\xe9', 
+                              'message': 'x' * 300, 'game': None, 
+                              'numbers': [-1, 19, 20, -129, 70000, 2 ** 40, 
+                                          2 ** 70, 1.5, True, False]})
+    
+    def test_round_trip(self):
+        for name in ('json', 'binary'):
+            c = codec.named(name)
+            for message in self.messages:
+                self.assertEqual(c.decode(c.encode(message)), message)
+    
+    def test_codecs_agree(self):
+        json_codec, binary = codec.named('json'), codec.named('binary')
+        for message in self.messages:
+            from_json = json_codec.decode(json_codec.encode(message))
+            from_binary = binary.decode(binary.encode(message))
+            self.assertEqual(from_binary, from_json)
+            self.assertEqual(json.dumps(from_binary, sort_keys=True), 
+                             json.dumps(from_json, sort_keys=True))
+    
+    def test_game_dicts(self):
+        game = gametools.new_game(1, 1)
+        gametools.add_player_named(game, 'testlady')
+        message = {'path': 'started_game', 'game': game}
+        data = codec.named('binary').encode(message)
+        self.assertEqual(codec.named('binary').decode(data), message)
+    
+    def test_binary_is_smaller(self):
+        binary = codec.named('binary')
+        for message in self.messages:
+            self.assertTrue(len(binary.encode(message)) < 
+                            len(json.dumps(message)))
+    
+    def test_interned_strings_are_a_byte(self):
+        binary = codec.named('binary')
+        self.assertEqual(len(binary.encode('sackson')), 1)
+        self.assertEqual(len(binary.encode(u'12I')), 1)
+        self.assertEqual(len(binary.encode(19)), 1)
+        self.assertEqual(len(binary.encode('testlady')), 10)
+    
+    def test_bad_binary(self):
+        binary = codec.named('binary')
+        data = binary.encode(self.messages[0])
+        self.assertRaises(ValueError, binary.decode, data[:-1])
+        self.assertRaises(ValueError, binary.decode, data + '\x00')
+        self.assertRaises(ValueError, binary.decode, '\x0f')
+        self.assertRaises(ValueError, binary.decode, '')
+    
+    def test_unknown_codec(self):
+        self.assertRaises(ValueError, codec.named, 'xml')
+    
+
+if __name__ == '__main__':
+    unittest.main()
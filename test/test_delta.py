@@ -0,0 +1,112 @@
+import json
+import random
+import unittest
+
+from acquire import delta, gametools
+from acquire.delta import GameCache
+
+def played_games(seed, moves):
+    """Yield a game after each of the given number of moves, taking a random 
+    legal action each time.
+    """
+    rng = random.Random(seed)
+    game = gametools.new_game(1, seed)
+    for name in ['testlady', 'testgirl', 'testwoman']:
+        gametools.add_player_named(game, name)
+    gametools.start_game(game)
+    yield game
+    for _ in xrange(moves):
+        actions = list(gametools.legal_actions(game))
+        if not actions:
+            return
+        action = rng.choice(actions)
+        name, player = action['action'], action['player']
+        move = [name, player]
+        if name in ('create_hotel', 'choose_survivor'):
+            move.append(action['hotel'])
+        elif name == 'play_tile':
+            move.append(action['tile'])
+        elif name == 'disburse_shares':
+            move.append(dict((k, action[k]) for k in ('hotel', 'trade', 
+                                                      'sell')))
+        else:
+            move.extend([action['order'], action['end_game']])
+        gametools.make_move(game, move)
+        yield game
+
+class TestTrackAndPatch(unittest.TestCase):
+    
+    def test_patches_follow_a_game(self):
+        published = received = None
+        for game in played_games(3, 300):
+            change, published = delta.track(published, game)
+            change = json.loads(json.dumps(change or {}))
+            received = delta.patch(received, change)
+            self.assertEqual(received, game)
+            self.assertEqual(published, game)
+    
+    def test_published_copy_is_not_shared(self):
+        game = {'a': [1, 2], 'b': {'c': 3}, 'd': [0]}
+        _, published = delta.track(None, game)
+        game['a'].append(4)
+        game['b']['c'] = 5
+        self.assertEqual(published, {'a': [1, 2], 'b': {'c': 3}, 'd': [0]})
+        game['d'] = [5, 6]
+        change, published = delta.track(published, game)
+        self.assertEqual(change['d']['d'], {'=': [5, 6]})
+    
+    def test_delta_forms(self):
+        old = {'tiles': ['1A', '2A', '3A'], 'hotels': [{'n': 1}, {'n': 2}], 
+               'gone': True}
+        new = {'tiles': ['1A', '3A', '4A'], 'hotels': [{'n': 1}, {'n': 3}], 
+               'new': 0}
+        change, _ = delta.track(old, new)
+        self.assertEqual(change['d']['tiles'], {'x': [1], 'a': ['4A']})
+        self.assertEqual(change['d']['hotels'], 
+                         {'i': {'1': {'d': {'n': {'=': 3}}}}})
+        self.assertEqual(change['d']['new'], {'=': 0})
+        self.assertEqual(change['r'], ['gone'])
+        self.assertEqual(delta.patch(old, change), new)
+        self.assertEqual(old['tiles'], ['1A', '2A', '3A'])
+    
+    def test_unchanged(self):
+        self.assertEqual(delta.track({'a': [1]}, {'a': [1]})[0], None)
+        self.assertEqual(delta.track({'a': 1}, {'a': 2, 'b': [1]})[0], 
+                         {'d': {'a': {'=': 2}, 'b': {'=': [1]}}})
+    
+
+class TestGameCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.cache = GameCache()
+        self.cache.resolve({'path': 'started_game', 'revision': 1, 
+                            'game': {'number': 4, 'players': []}})
+    
+    def test_delta_fills_in_game(self):
+        message = {'path': 'joined_game', 'revision': 2, 'game_number': 4, 
+                   'game_delta': {'d': {'players': {'x': [], 'a': ['x']}}}}
+        self.assertTrue(self.cache.resolve(message))
+        self.assertEqual(message['game'], {'number': 4, 'players': ['x']})
+    
+    def test_gap_needs_snapshot_once(self):
+        message = {'path': 'joined_game', 'revision': 3, 'game_number': 4, 
+                   'game_delta': {}}
+        self.assertFalse(self.cache.resolve(message))
+        self.assertTrue(self.cache.request(4))
+        self.assertFalse(self.cache.request(4))
+        message['revision'] = 4
+        self.assertFalse(self.cache.resolve(message))
+        snapshot = {'path': 'game_snapshot', 'revision': 4, 'game_number': 4, 
+                    'game': {'number': 4, 'players': ['x', 'y']}}
+        self.assertTrue(self.cache.resolve(snapshot))
+        message['revision'] = 5
+        self.assertTrue(self.cache.resolve(message))
+        self.assertEqual(message['game']['players'], ['x', 'y'])
+    
+    def test_game_over_forgets(self):
+        self.cache.resolve({'path': 'game_over', 'game_number': 4})
+        self.assertEqual(self.cache.games, {})
+    
+
+if __name__ == '__main__':
+    unittest.main()
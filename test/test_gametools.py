@@ -1,3 +1,5 @@
+import copy
+import json
 import unittest
 
 from acquire import gametools
@@ -45,6 +47,17 @@ class TestAddingAndRemovingPlayers(unittest.TestCase):
         gametools.remove_player_named(self.game, 'testwomanican')
         self.assertFalse(self.game['players'])
     
+    def test_lobby_summary(self):
+        game = gametools.new_game(8)
+        gametools.add_player_named(game, 'testwomanican')
+        gametools.add_player_named(game, 'testvetica')
+        gametools.start_game(game)
+        summary = gametools.lobby_summary(game)
+        self.assertEqual(sorted(summary['players']), 
+                         ['testvetica', 'testwomanican'])
+        self.assertEqual(summary['number'], 8)
+        self.assertTrue(summary['started'])
+    
 
 class TestAdjacentTiles(unittest.TestCase):
     
@@ -139,6 +152,21 @@ class TestSharePrice(unittest.TestCase):
         self.embiggen_and_check_prices(hydra, embiggen, expected)
     
 
+def take_action(game, action):
+    """Take a legal action through the usual gametools function."""
+    player = gametools.player_named(game, action['player'])
+    name = action['action']
+    if name == 'play_tile':
+        gametools.play_tile(game, player, action['tile'])
+    elif name in ('create_hotel', 'choose_survivor'):
+        hotel = gametools.hotel_named(game, action['hotel'])
+        getattr(gametools, name)(game, player, hotel)
+    elif name == 'disburse_shares':
+        disbursement = dict((k, action[k]) for k in ('hotel', 'trade', 'sell'))
+        gametools.disburse_shares(game, player, disbursement)
+    elif name == 'purchase':
+        gametools.purchase(game, player, action['order'], action['end_game'])
+
 class ThreePlayerGameTestCase(unittest.TestCase):
     
     def setUp(self):
@@ -343,6 +371,14 @@ class TestHotelGrowth(ThreePlayerGameTestCase):
         self.assertTrue('4C' in self.phoenix['tiles'])
         self.assertTrue('4C' not in self.game['lonely_tiles'])
     
+    def test_connected_lonely_tiles_added_to_hotel(self):
+        self.game['lonely_tiles'] = ['4C', '5C']
+        tile = self.player['rack'][0] = '3C'
+        gametools.play_tile(self.game, self.player, tile)
+        self.assertEqual(sorted(self.phoenix['tiles']), 
+                         ['1C', '2C', '3C', '4C', '5C'])
+        self.assertEqual(self.game['lonely_tiles'], [])
+    
 
 class TestTurnRotation(ThreePlayerGameTestCase):
     
@@ -454,6 +490,53 @@ class TestPurchasingShares(ThreePlayerGameTestCase):
             gametools.purchase(self.game, self.player, {'quantum': 2})
     
 
+class TestShareLedger(ThreePlayerGameTestCase):
+    
+    def test_bank_follows_purchases(self):
+        blank_board(self.game)
+        self.zeta['tiles'] = ['9C', '9D']
+        self.game['action_queue'][0]['action'] = 'purchase'
+        gametools.purchase(self.game, self.player, {'zeta': 3})
+        self.assertEqual(gametools.bank_shares(self.game, self.zeta), 22)
+    
+    def test_bank_follows_share_changes(self):
+        self.assertEqual(gametools.bank_shares(self.game, self.hydra), 25)
+        self.game['players'][1]['shares']['hydra'] = 5
+        self.player['shares']['hydra'] += 2
+        self.assertEqual(gametools.bank_shares(self.game, self.hydra), 18)
+        self.player['shares']['hydra'] = 0
+        self.assertEqual(gametools.bank_shares(self.game, self.hydra), 20)
+    
+    def test_copied_shares_are_plain(self):
+        gametools.bank_shares(self.game, self.hydra)
+        shares = copy.deepcopy(self.player['shares'])
+        self.assertEqual(type(shares), dict)
+        self.assertEqual(shares, self.player['shares'])
+    
+    def test_plain_dicts_are_left_alone(self):
+        game = json.loads(json.dumps(self.game))
+        game['players'][1]['shares']['hydra'] = 5
+        hydra = gametools.hotel_named(game, 'hydra')
+        self.assertEqual(gametools.bank_shares(game, hydra), 20)
+        self.assertEqual(type(game['players'][1]['shares']), dict)
+        game['players'][1]['shares']['hydra'] = 7
+        self.assertEqual(gametools.bank_shares(game, hydra), 18)
+    
+    def test_replaced_shares_get_a_new_ledger(self):
+        gametools.bank_shares(self.game, self.hydra)
+        self.player['shares'] = dict(self.player['shares'], hydra=4)
+        self.assertEqual(gametools.bank_shares(self.game, self.hydra), 21)
+        self.player['shares']['hydra'] = 1
+        self.assertEqual(gametools.bank_shares(self.game, self.hydra), 24)
+    
+    def test_shareholders(self):
+        holdings = [(3, 'a'), (1, 'b'), (3, 'c'), (2, 'd'), (2, 'e')]
+        self.assertEqual(gametools.shareholders(holdings), 
+                         (['a', 'c'], ['d', 'e']))
+        self.assertEqual(gametools.shareholders([(4, 'a'), (0, 'b')]), 
+                         (['a'], []))
+    
+
 class TestMerge(ThreePlayerGameTestCase):
     
     def setUp(self):
@@ -680,6 +763,248 @@ class TestUnplayableTileReplenishment(ThreePlayerGameTestCase):
         self.assertEqual(len(self.player['rack']), 6)
     
 
+class TestUnplayableTiles(ThreePlayerGameTestCase):
+    
+    def setUp(self):
+        super(TestUnplayableTiles, self).setUp()
+        blank_board(self.game)
+    
+    def test_safe_merge_tiles(self):
+        self.zeta['tiles'] = [str(i) + 'A' for i in xrange(1, 12)]
+        self.america['tiles'] = [str(i) + 'C' for i in xrange(1, 12)]
+        unplayable = gametools.unplayable_tiles(self.game)
+        self.assertEqual(sorted(unplayable, key=tile_order), 
+                         [str(i) + 'B' for i in xrange(1, 12)])
+    
+    def test_creation_tiles_only_when_all_hotels_on_board(self):
+        self.game['lonely_tiles'] = ['1I']
+        self.assertEqual(gametools.unplayable_tiles(self.game), [])
+        tilesets = [['1A', '2A'], ['4A', '5A'], ['7A', '8A'], ['10A', '11A'], 
+                    ['1C', '2C'], ['4C', '5C'], ['7C', '8C']]
+        for hotel, tileset in zip(self.game['hotels'], tilesets):
+            hotel['tiles'] = tileset
+        self.assertEqual(sorted(gametools.unplayable_tiles(self.game)), 
+                         ['1H', '2I'])
+    
+    def test_index_follows_hotel_creation(self):
+        self.game['lonely_tiles'] = ['1A']
+        self.assertTrue('1B' in gametools.tiles_that_create_hotels(self.game))
+        tile = self.player['rack'][0] = '1B'
+        gametools.play_tile(self.game, self.player, tile)
+        gametools.create_hotel(self.game, self.player, self.zeta)
+        self.assertEqual(gametools.tiles_that_create_hotels(self.game), [])
+        self.assertEqual(sorted(self.zeta['tiles']), ['1A', '1B'])
+        self.assertTrue(self.game.board.watching(self.game))
+    
+
+class TestTryingThingsOut(ThreePlayerGameTestCase):
+    
+    def setUp(self):
+        super(TestTryingThingsOut, self).setUp()
+        blank_board(self.game)
+        self.zeta['tiles'] = ['1A', '2A']
+        self.hydra['tiles'] = ['1C', '1D', '1E']
+        self.game['lonely_tiles'] = ['5E']
+        self.player['rack'][:3] = ['1B', '6E', '9I']
+    
+    def test_restore_undoes_merge(self):
+        before = copy.deepcopy(self.game)
+        snap = gametools.snapshot(self.game)
+        self.player['shares']['zeta'] = 3
+        gametools.play_tile(self.game, self.player, '1B')
+        self.assertEqual(self.game['action_queue'][0]['action'], 
+                         'disburse_shares')
+        self.assertEqual(gametools.bank_shares(self.game, self.zeta), 22)
+        gametools.restore(self.game, snap)
+        self.assertEqual(self.game, before)
+        self.assertEqual(gametools.bank_shares(self.game, self.zeta), 25)
+        self.assertEqual(gametools.where_is_tile(self.game, '1B'), None)
+        self.assertTrue(self.game.board.watching(self.game))
+    
+    def test_restore_twice(self):
+        snap = gametools.snapshot(self.game)
+        for tile in ['6E', '6E']:
+            gametools.play_tile(self.game, self.player, tile)
+            gametools.create_hotel(self.game, self.player, self.quantum)
+            self.assertEqual(len(self.quantum['tiles']), 2)
+            gametools.restore(self.game, snap)
+        self.assertEqual(self.quantum['tiles'], [])
+        self.assertTrue('6E' in self.player['rack'])
+    
+    def test_preview_changes_nothing(self):
+        before = copy.deepcopy(self.game)
+        self.assertEqual(gametools.preview_play_tile(self.game, self.player, 
+                                                     '9I'), 
+                         {'result': 'lonely'})
+        preview = gametools.preview_play_tile(self.game, self.player, '6E')
+        self.assertEqual(preview['result'], 'create')
+        self.assertEqual(preview['size'], 2)
+        self.assertEqual(self.game, before)
+    
+    def test_preview_grow(self):
+        self.player['rack'][0] = '3A'
+        self.assertEqual(gametools.preview_play_tile(self.game, self.player, 
+                                                     '3A'), 
+                         {'result': 'grow', 'hotel': 'zeta', 'size': 3})
+    
+    def test_preview_merge_bonuses(self):
+        self.player['shares']['zeta'] = 4
+        self.game['players'][1]['shares']['zeta'] = 2
+        preview = gametools.preview_play_tile(self.game, self.player, '1B')
+        self.assertEqual(preview['survivors'], ['hydra'])
+        bonuses = preview['bonuses']['zeta']
+        self.assertEqual(bonuses[self.player['name']], 2000)
+        self.assertEqual(bonuses[self.game['players'][1]['name']], 1000)
+        self.remember_cash()
+        gametools.play_tile(self.game, self.player, '1B')
+        paid = dict((p['name'], c) for p, c 
+                    in zip(self.game['players'], self.cash_difference()) if c)
+        self.assertEqual(paid, bonuses)
+    
+    def test_preview_tile_not_in_rack(self):
+        if '12I' in self.player['rack']:
+            self.player['rack'].remove('12I')
+        with self.assertRaises(gametools.GamePlayNotAllowedError):
+            gametools.preview_play_tile(self.game, self.player, '12I')
+    
+
+class TestLegalActions(ThreePlayerGameTestCase):
+    
+    def setUp(self):
+        super(TestLegalActions, self).setUp()
+        blank_board(self.game)
+        self.zeta['tiles'] = ['1A', '2A']
+        self.hydra['tiles'] = ['1C', '1D', '1E']
+        self.game['lonely_tiles'] = ['5E']
+        self.player['rack'][:3] = ['1B', '6E', '9I']
+    
+    def assert_all_allowed(self):
+        snap = gametools.snapshot(self.game)
+        actions = list(gametools.legal_actions(self.game))
+        self.assertTrue(actions)
+        for action in actions:
+            take_action(self.game, action)
+            gametools.restore(self.game, snap)
+        return actions
+    
+    def test_playable_tiles(self):
+        tiles = [a['tile'] for a in self.assert_all_allowed()]
+        self.assertEqual(tiles, gametools.playable_tiles(self.game, 
+                                                         self.player))
+        self.assertTrue('1B' in tiles and '6E' in tiles)
+    
+    def test_no_creation_tiles_when_all_hotels_on_board(self):
+        tilesets = [['3G', '4G'], ['6G', '7G'], ['9G', '10G'], ['12G', '12H'],
+                    ['8A', '9A']]
+        off_board = gametools.hotels_off_board(self.game)
+        for hotel, tileset in zip(off_board, tilesets):
+            hotel['tiles'] = tileset
+        tiles = [a['tile'] for a in gametools.legal_actions(self.game)]
+        self.assertTrue('6E' not in tiles)
+    
+    def test_create_hotel(self):
+        gametools.play_tile(self.game, self.player, '6E')
+        hotels = [a['hotel'] for a in self.assert_all_allowed()]
+        self.assertEqual(hotels, [h['name'] for h 
+                                  in gametools.hotels_off_board(self.game)])
+    
+    def test_disbursements(self):
+        self.player['shares']['zeta'] = 3
+        gametools.play_tile(self.game, self.player, '1B')
+        splits = [(a['trade'], a['sell']) for a in self.assert_all_allowed()]
+        self.assertEqual(sorted(splits), 
+                         [(0, 0), (0, 1), (0, 2), (0, 3), (2, 0), (2, 1)])
+    
+    def test_purchase_orders(self):
+        self.game['action_queue'][0]['action'] = 'purchase'
+        self.player['cash'] = 700
+        orders = [a['order'] for a in self.assert_all_allowed()]
+        self.assertEqual(len(orders), 6)
+        self.assertTrue({} in orders)
+        self.assertTrue({'zeta': 1, 'hydra': 1} in orders)
+        self.assertTrue({'zeta': 3} in orders)
+        self.assertTrue({'zeta': 2, 'hydra': 1} not in orders)
+    
+    def test_nothing_after_game_end(self):
+        self.game['ended'] = True
+        self.assertEqual(list(gametools.legal_actions(self.game)), [])
+        self.assertEqual(gametools.default_action(self.game), None)
+
+    def test_default_actions(self):
+        action = gametools.default_action(self.game)
+        self.assertEqual(action['tile'],
+                         gametools.playable_tiles(self.game, self.player)[0])
+        self.player['shares']['zeta'] = 3
+        gametools.play_tile(self.game, self.player, '1B')
+        action = gametools.default_action(self.game)
+        self.assertEqual((action['action'], action['trade'], action['sell']),
+                         ('disburse_shares', 0, 0))
+        self.game['action_queue'][0]['action'] = 'purchase'
+        action = gametools.default_action(self.game)
+        self.assertEqual((action['order'], action['end_game']), ({}, False))
+    
+
+class TestReplay(unittest.TestCase):
+    
+    def play(self, seed, players, moves):
+        """Returns a game with the given seed and players, played for the 
+        given number of moves, always taking the last legal action.
+        """
+        game = gametools.new_game(7, seed)
+        for name in players:
+            gametools.add_player_named(game, name)
+        gametools.start_game(game)
+        for _ in xrange(moves):
+            actions = list(gametools.legal_actions(game))
+            if not actions:
+                break
+            take_action(game, actions[-1])
+        return game
+    
+    def test_same_seed_same_game(self):
+        game = self.play(42, ['testlady', 'testgirl', 'testwoman'], 150)
+        again = self.play(42, ['testlady', 'testgirl', 'testwoman'], 150)
+        self.assertEqual(game, again)
+        other = self.play(43, ['testlady', 'testgirl', 'testwoman'], 150)
+        self.assertNotEqual(game['tilebag'], other['tilebag'])
+    
+    def test_replay(self):
+        game = self.play(5, ['testlady', 'testgirl'], 200)
+        self.assertEqual(game.moves[:3], [('add_player_named', 'testlady'), 
+                                          ('add_player_named', 'testgirl'), 
+                                          ('start_game',)])
+        self.assertEqual(game.rng, None)
+        replayed = gametools.replay(game.seed, game.moves, 7)
+        self.assertEqual(replayed, game)
+        self.assertEqual(replayed.moves, game.moves)
+        # As read back from a journal.
+        moves = json.loads(json.dumps(game.moves))
+        self.assertEqual(gametools.replay(game.seed, moves, 7), game)
+    
+    def test_failed_moves_not_logged(self):
+        game = self.play(1, ['testlady', 'testgirl'], 0)
+        player = gametools.player_after(game, gametools.active_player(game))
+        with self.assertRaises(gametools.GamePlayNotAllowedError):
+            gametools.play_tile(game, player, player['rack'][0])
+        self.assertEqual(len(game.moves), 3)
+    
+    def test_restore_rewinds_moves(self):
+        game = self.play(9, ['testlady', 'testgirl'], 10)
+        snap = gametools.snapshot(game)
+        moves = list(game.moves)
+        for _ in xrange(20):
+            take_action(game, next(gametools.legal_actions(game)))
+        gametools.restore(game, snap)
+        self.assertEqual(game.moves, moves)
+        for _ in xrange(20):
+            take_action(game, next(gametools.legal_actions(game)))
+        self.assertEqual(gametools.replay(game.seed, game.moves, 7), game)
+    
+    def test_unknown_move(self):
+        with self.assertRaises(gametools.GameError):
+            gametools.replay(1, [['game_over']])
+    
+
 class TestEndOfGame(ThreePlayerGameTestCase):
     
     def setUp(self):
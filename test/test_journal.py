@@ -0,0 +1,142 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from acquire import gametools
+from acquire.journal import Journal
+
+def play(game, moves, rng):
+    """Make up to the given number of random legal moves in game."""
+    for _ in xrange(moves):
+        actions = list(gametools.legal_actions(game))
+        if not actions:
+            return
+        action = rng.choice(actions)
+        move = [action['action'], action['player']]
+        if action['action'] in ('create_hotel', 'choose_survivor'):
+            move.append(action['hotel'])
+        elif action['action'] == 'play_tile':
+            move.append(action['tile'])
+        elif action['action'] == 'disburse_shares':
+            move.append(dict((k, action[k]) for k in ('hotel', 'trade', 
+                                                      'sell')))
+        elif action['action'] == 'purchase':
+            move.extend([action['order'], action['end_game']])
+        gametools.make_move(game, move)
+
+def started_game(number):
+    game = gametools.new_game(number)
+    for name in ['testlady', 'testgirl', 'testwoman']:
+        gametools.add_player_named(game, '%s%d' % (name, number))
+    gametools.start_game(game)
+    return game
+
+class TestJournal(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'games')
+        self.rng = random.Random(7)
+        self.journal = Journal(self.path, snapshot_every=100)
+        self.assertEqual(self.journal.restore(), [])
+        self.games = [started_game(n) for n in (1, 2, 3)]
+    
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.directory)
+    
+    def play_and_flush(self, rounds):
+        for _ in xrange(rounds):
+            for game in self.games:
+                play(game, 3, self.rng)
+                self.journal.record(game)
+            self.journal.flush()
+    
+    def assertRestored(self):
+        if self.journal.writer is not None:
+            self.journal.finish_snapshot()
+        restored = Journal(self.path).restore()
+        self.assertEqual(restored, self.games)
+        for before, after in zip(self.games, restored):
+            self.assertEqual(after.seed, before.seed)
+            self.assertEqual(after.moves, before.moves)
+        return restored
+    
+    def test_restore_from_log(self):
+        self.play_and_flush(3)
+        self.assertFalse(os.path.exists(self.path + '.snapshot'))
+        self.assertRestored()
+    
+    def test_restore_from_snapshot_and_log(self):
+        self.play_and_flush(15)
+        self.assertTrue(0 < self.journal.logged < 100)
+        self.assertRestored()
+        self.assertTrue(os.path.exists(self.path + '.snapshot'))
+        self.assertFalse(os.path.exists(self.path + '.log.old'))
+    
+    def test_failed_snapshot(self):
+        def fail():
+            raise IOError('disk full')
+        self.journal.write_snapshot = fail
+        self.play_and_flush(15)
+        self.journal.finish_snapshot()
+        self.assertFalse(os.path.exists(self.path + '.snapshot'))
+        self.assertTrue(os.path.exists(self.path + '.log.old'))
+        self.assertRestored()
+        # The next flush tries again, keeping everything logged since.
+        del self.journal.write_snapshot
+        self.play_and_flush(1)
+        self.assertRestored()
+        self.assertTrue(os.path.exists(self.path + '.snapshot'))
+        self.assertFalse(os.path.exists(self.path + '.log.old'))
+    
+    def test_games_change_while_snapshot_is_written(self):
+        self.play_and_flush(11)
+        self.assertNotEqual(self.journal.writer, None)
+        self.play_and_flush(2)
+        self.assertRestored()
+    
+    def test_log_left_over_from_before_snapshot(self):
+        self.play_and_flush(10)
+        with open(self.path + '.log') as f:
+            old_log = f.read()
+        self.journal.snapshot()
+        self.journal.finish_snapshot()
+        with open(self.path + '.log', 'w') as f:
+            f.write(old_log)
+        self.assertRestored()
+    
+    def test_restored_games_play_on_the_same(self):
+        self.play_and_flush(2)
+        restored = self.assertRestored()
+        for before, after in zip(self.games, restored):
+            play(before, 20, random.Random(before['number']))
+            play(after, 20, random.Random(after['number']))
+        self.assertEqual(restored, self.games)
+    
+    def test_cut_off_line(self):
+        self.play_and_flush(2)
+        with open(self.path + '.log', 'a') as f:
+            f.write('[99999, 1, ["play_ti')
+        self.assertRestored()
+        with open(self.path + '.log') as f:
+            self.assertTrue(f.read().endswith('\n'))
+    
+    def test_drop(self):
+        self.play_and_flush(1)
+        self.journal.drop(3)
+        new_game = gametools.new_game(4)
+        self.journal.record(new_game)
+        self.journal.drop(4)
+        self.journal.flush()
+        del self.games[2]
+        self.assertRestored()
+        journal = Journal(self.path)
+        journal.restore()
+        self.assertEqual(journal.last_number, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
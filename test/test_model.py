@@ -0,0 +1,62 @@
+import json
+import unittest
+
+from acquire import gametools, model
+
+class TestRoundTrip(unittest.TestCase):
+    
+    def assertRoundTrips(self, game):
+        before = json.loads(json.dumps(game))
+        after = model.Game.from_dict(game).to_dict()
+        self.assertEqual(json.loads(json.dumps(after)), before)
+    
+    def test_unstarted_game(self):
+        game = gametools.new_game(4)
+        gametools.add_player_named(game, 'testwomanican')
+        self.assertRoundTrips(game)
+    
+    def test_unnumbered_game(self):
+        game = gametools.new_game()
+        self.assertRoundTrips(game)
+        self.assertFalse('number' in model.Game.from_dict(game).to_dict())
+    
+    def test_started_game(self):
+        game = gametools.new_game(1)
+        for name in ['testwomanican', 'testmanican', 'testvetica']:
+            gametools.add_player_named(game, name)
+        gametools.start_game(game)
+        gametools.hotel_named(game, 'zeta')['tiles'] = ['3C', '3D']
+        game['players'][1]['shares']['zeta'] = 4
+        self.assertRoundTrips(game)
+    
+    def test_mid_merge_game(self):
+        game = gametools.new_game(2)
+        gametools.add_player_named(game, 'testwomanican')
+        gametools.start_game(game)
+        game['merge_info'] = {'tile': '4H', 'survivor': 'fusion', 
+                              'merging_player': 'testwomanican'}
+        game['action_queue'].append({'action': 'disburse_shares', 
+                                     'player': 'testwomanican', 
+                                     'hotel': 'quantum', 'survivor': 'fusion'})
+        self.assertRoundTrips(game)
+    
+    def test_seed_and_moves_kept(self):
+        game = gametools.new_game(5, 1234)
+        gametools.add_player_named(game, 'testwomanican')
+        gametools.start_game(game)
+        after = model.Game.from_dict(game).to_dict()
+        self.assertEqual(after.seed, 1234)
+        self.assertEqual(after.moves, game.moves)
+        self.assertEqual(gametools.replay(after.seed, after.moves, 5), game)
+    
+    def test_back_in_play(self):
+        game = gametools.new_game(3)
+        gametools.add_player_named(game, 'testwomanican')
+        gametools.start_game(game)
+        game = model.Game.from_dict(game).to_dict()
+        player = gametools.active_player(game)
+        gametools.play_tile(game, player, player['rack'][0])
+    
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import logging
+import unittest
+from collections import deque
+
+import zmq
+
+from acquire import codec
+from acquire.directive import Directive
+from acquire.netacquire import NetAcquire, view_key
+from acquire.timers import Timers
+
+
+class FakePoller(object):
+    def __init__(self):
+        self.flags = {}
+
+    def register(self, fileno, flags):
+        if flags:
+            self.flags[fileno] = flags
+        else:
+            self.flags.pop(fileno, None)
+
+    def unregister(self, fileno):
+        self.flags.pop(fileno, None)
+
+
+class FakeClient(object):
+    def __init__(self, fileno):
+        self._fileno = fileno
+        self.sent = ''
+
+    def fileno(self):
+        return self._fileno
+
+    def send(self, data):
+        self.sent += data[:10]
+        return min(len(data), 10)
+
+
+class FakePush(object):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data, flags=0):
+        self.sent.append(data)
+
+
+class TestSlowClients(unittest.TestCase):
+    def setUp(self):
+        self.front = NetAcquire.__new__(NetAcquire)
+        self.front.log = logging.getLogger('test')
+        self.front.timers = Timers()
+        self.front.start_stats()
+        self.front.poller = FakePoller()
+        self.front.client_queues = {}
+        self.front.client_sizes = {}
+        self.front.client_buffer = 200
+        self.front.slow_client_counts = dict(drop=0, collapse=0, pause=0)
+        self.front.paused_clients = set()
+        self.front.dropped_clients = set()
+        self.front.backend_queue = deque()
+        self.front.backend_queue_limit = 3
+        self.front.backend_backed_up = False
+        self.front.backend_pauses = 0
+        self.front.backend_push = FakePush()
+        self.front.codec = codec.named('json')
+        self.client = FakeClient(7)
+        self.front.clients = {7: self.client}
+        self.front.client_queues[7] = []
+        self.front.client_sizes[7] = 0
+
+    def send_board(self, times):
+        for i in xrange(times):
+            for tile_id in (1, 2, 3):
+                self.front.send_to_client(self.client, 
+                                          Directive('SB', tile_id, i))
+
+    def test_view_keys(self):
+        self.assertEqual(view_key(Directive('SB', 4, 0)), ('SB', 4))
+        self.assertEqual(view_key(Directive('SV', 'frmScoreSheet', 'lblData', 
+                                            3, 'Caption', 'x')),
+                         ('SV', 'frmScoreSheet', 'lblData', 3, 'Caption'))
+        self.assertEqual(view_key(Directive('GM', 'hi')), None)
+        self.assertEqual(view_key('SB;1,0;:'), None)
+
+    def test_collapse(self):
+        self.front.slow_client = 'collapse'
+        self.front.send_to_client(self.client, Directive('GM', 'hi'))
+        self.send_board(20)
+        self.assertTrue(self.front.slow_client_counts['collapse'] > 0)
+        self.assertEqual(self.front.dropped_clients, set())
+        self.assertTrue(self.front.client_sizes[7] <= 200)
+        self.front.collapse_client_queue(7)
+        wiredata = [w for _, w in self.front.client_queues[7]]
+        self.assertEqual(wiredata, ['GM;"hi";:', 'SB;1,19;:', 'SB;2,19;:', 
+                                    'SB;3,19;:'])
+        self.assertEqual(self.front.client_sizes[7], 
+                         sum(map(len, wiredata)))
+
+    def test_collapse_drops_when_it_cannot_help(self):
+        self.front.slow_client = 'collapse'
+        for _ in xrange(30):
+            self.front.send_to_client(self.client, Directive('GM', 'hello'))
+        self.assertEqual(self.front.dropped_clients, set([7]))
+        self.assertEqual(self.front.slow_client_counts['drop'], 1)
+        self.front.send_to_client(self.client, Directive('GM', 'hello'))
+        self.assertEqual(self.front.client_sizes[7], 0)
+
+    def test_drop(self):
+        self.front.slow_client = 'drop'
+        self.send_board(20)
+        self.assertEqual(self.front.dropped_clients, set([7]))
+        self.assertEqual(self.front.slow_client_counts, 
+                         dict(drop=1, collapse=0, pause=0))
+
+    def test_pause_until_caught_up(self):
+        self.front.slow_client = 'pause'
+        self.send_board(10)
+        self.assertEqual(self.front.paused_clients, set([7]))
+        self.assertEqual(self.front.poller.flags[7], zmq.POLLOUT)
+        while self.front.client_sizes[7]:
+            self.front.write_to_client(self.client)
+        self.assertEqual(self.front.paused_clients, set())
+        self.assertEqual(self.front.poller.flags[7], zmq.POLLIN)
+        self.assertEqual(self.front.slow_client_counts['pause'], 1)
+        self.assertEqual(self.client.sent, 
+                         ''.join('SB;%d,%d;:' % (t, i) for i in xrange(10) 
+                                                       for t in (1, 2, 3)))
+
+    def test_pause_then_drop(self):
+        self.front.slow_client = 'pause'
+        self.send_board(30)
+        self.assertEqual(self.front.dropped_clients, set([7]))
+
+    def test_backed_up_backend(self):
+        self.front.watch_client(7)
+        self.assertEqual(self.front.poller.flags[7], zmq.POLLIN)
+        for _ in xrange(3):
+            self.front.send_to_backend('games_list')
+        self.assertEqual(self.front.poller.flags[7], zmq.POLLIN)
+        self.front.send_to_backend('games_list')
+        self.assertFalse(7 in self.front.poller.flags)
+        self.assertEqual(self.front.backend_pauses, 1)
+        # Writing to the client doesn't start reading from it again.
+        self.front.send_to_client(self.client, Directive('GM', 'hi'))
+        self.assertEqual(self.front.poller.flags[7], zmq.POLLOUT)
+        while self.front.client_sizes[7]:
+            self.front.write_to_client(self.client)
+        self.assertFalse(7 in self.front.poller.flags)
+        self.front.send_messages()
+        self.assertEqual(len(self.front.backend_push.sent), 4)
+        self.assertEqual(self.front.poller.flags[7], zmq.POLLIN)
+        self.assertFalse(self.front.backend_backed_up)
+
+
+if __name__ == '__main__':
+    unittest.main()
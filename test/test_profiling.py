@@ -0,0 +1,108 @@
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+
+from acquire import profiling
+from acquire.timers import Timers
+
+def busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        sum(xrange(100))
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'profile')
+        self.now = 0.0
+        self.timers = Timers(clock=lambda: self.now)
+        self.profiler = profiling.Profiler('test', self.timers)
+
+    def tearDown(self):
+        self.profiler.stop()
+        shutil.rmtree(self.dir)
+
+    def test_cprofile(self):
+        self.profiler.start('cprofile', 60, self.path)
+        busy(0.01)
+        self.assertEqual(self.profiler.stop(), self.path)
+        functions = [f[2] for f in pstats.Stats(self.path).stats]
+        self.assertTrue('busy' in functions)
+        self.assertFalse(self.profiler.running)
+
+    def test_sample(self):
+        self.profiler.start('sample', 60, self.path)
+        busy(0.1)
+        self.profiler.stop()
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(any(':busy:' in line for line in lines))
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(int(count) > 0)
+
+    def test_stops_on_time(self):
+        self.profiler.start('cprofile', 10, self.path)
+        self.assertEqual(self.timers.timeout(), 10001)
+        self.now = 9.0
+        self.timers.run_due()
+        self.assertTrue(self.profiler.running)
+        self.now = 10.0
+        self.timers.run_due()
+        self.assertFalse(self.profiler.running)
+        self.assertEqual(self.timers.timeout(), None)
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_handlers(self):
+        self.profiler.handled('login_message', 1.0)
+        self.profiler.start('cprofile', 60, self.path)
+        self.profiler.handled('login_message', 0.002)
+        self.profiler.handled('login_message', 0.004)
+        self.profiler.handled('PL_directive', 0.5)
+        self.profiler.stop()
+        with open(self.path + '.handlers') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[1:], ['PL_directive 1 0.500000 500.000',
+                                     'login_message 2 0.006000 3.000'])
+
+    def test_command(self):
+        reply = self.profiler.command('sample', '60', self.path)
+        self.assertTrue(self.path in reply)
+        self.assertTrue(self.path in self.profiler.command('status'))
+        self.assertRaises(ValueError, self.profiler.command, 'cprofile')
+        self.assertEqual(self.profiler.command('stop'), 'wrote ' + self.path)
+        self.assertEqual(self.profiler.command('stop'), 'not profiling')
+        self.assertRaises(ValueError, self.profiler.command, 'strace')
+        self.assertRaises(ValueError, self.profiler.command, 'sample', 'x')
+
+    def test_unwritable_path(self):
+        missing = os.path.join(self.dir, 'missing', 'profile')
+        self.assertRaises(ValueError, self.profiler.start, 'cprofile', 60,
+                          missing)
+        self.assertFalse(self.profiler.running)
+        self.assertEqual(self.timers.timeout(), None)
+
+    def test_stops_when_writing_fails(self):
+        self.profiler.start('sample', 10, self.path)
+        shutil.rmtree(self.dir)
+        self.assertRaises(ValueError, self.profiler.command, 'stop')
+        self.assertFalse(self.profiler.running)
+        self.assertEqual(self.timers.timeout(), None)
+        os.mkdir(self.dir)
+        self.profiler.start('cprofile', 10, self.path)
+        self.assertTrue(self.profiler.running)
+
+    def test_default_path(self):
+        path = self.profiler.start('cprofile', 60)
+        try:
+            self.assertTrue(os.path.basename(path).startswith('test-'))
+            self.assertTrue(path.endswith('.pstats'))
+            self.profiler.stop()
+        finally:
+            os.remove(path)
+            os.remove(path + '.handlers')
@@ -0,0 +1,179 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zmq
+
+from collections import deque
+
+from acquire import codec, topics
+from acquire.shards import Router, Worker, check_workers, ready_topic
+
+
+class FakeSocket(object):
+    """Hands out the multipart messages it was given, then says there are
+    no more, and keeps what's sent on it.
+    """
+    def __init__(self, received=()):
+        self.received = list(received)
+        self.sent = []
+
+    def recv_multipart(self, flags=0):
+        if not self.received:
+            raise zmq.ZMQError(zmq.EAGAIN)
+        return self.received.pop(0)
+
+    def send_multipart(self, parts, flags=0):
+        self.sent.append(parts)
+
+    send = send_multipart
+
+
+class TestRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = Router()
+        self.router.worker_sockets = [None] * 3
+        self.router.codec = codec.named('json')
+        self.router.in_game = {}
+        self.router.pending = {}
+        self.router.summaries = {}
+        self.router._next_game_number = 0
+
+    def test_game_numbers_belong_to_their_worker(self):
+        numbers = [self.router.next_game_number(w) for w in (2, 2, 0, 1, 1)]
+        self.assertEqual(numbers, [2, 5, 6, 7, 10])
+        for number, worker in zip(numbers, (2, 2, 0, 1, 1)):
+            self.assertEqual(self.router.worker_for_game(number), worker)
+        self.assertEqual(self.router.worker_for_game('nope'), 0)
+
+    def test_numbering_after_restart(self):
+        # Two workers come back with games 1 to 5 between them.
+        self.router.worker_sockets = [FakeSocket(), FakeSocket()]
+        summaries = [{'number': n, 'players': ['player%d' % n], 
+                      'started': True} for n in xrange(1, 6)]
+        self.router.out_socket = FakeSocket(
+            [[topics.lobby, json.dumps({'path': 'lobby_game', 'event': 'add',
+                                        'summary': summary})]
+             for summary in summaries] + 
+            [[ready_topic, json.dumps({'last_number': 5})],
+             [ready_topic, json.dumps({'last_number': 4})]])
+        self.router.pub_socket = FakeSocket()
+        self.router.ready = 0
+        self.router.pass_on_messages()
+        self.assertEqual(self.router.ready, 2)
+        # Serving without a journal mustn't start the numbers over.
+        self.router.restore_games([], 0)
+        for player in ('testlady', 'testgirl', 'testwoman'):
+            self.router.start_game_message({'path': 'start_game', 
+                                            'player': player})
+        numbers = [json.loads(parts)['game_number']
+                   for socket in self.router.worker_sockets
+                   for parts in socket.sent]
+        self.assertEqual(sorted(numbers), [6, 7, 8])
+    
+    def test_routing_with_existing_games(self):
+        # Three workers already have games 1 to 6, one player in each.
+        sockets = self.router.worker_sockets = [FakeSocket() for _ in xrange(3)]
+        for number in xrange(1, 7):
+            summary = {'number': number, 'players': ['player%d' % number],
+                       'started': False}
+            self.router.worker_messages([topics.lobby, json.dumps(
+                {'path': 'lobby_game', 'event': 'add', 'summary': summary})])
+        self.router._next_game_number = 6
+        for number in xrange(1, 7):
+            self.assertEqual(self.router.worker_for_player('player%d' % number),
+                             number % 3)
+        # A player with a game is sent to its worker, to be turned down there.
+        self.router.start_game_message({'path': 'start_game', 
+                                        'player': 'player4'})
+        self.assertEqual(len(sockets[1].sent), 1)
+        for player in ('testlady', 'testgirl', 'testwoman', 'testperson'):
+            self.router.start_game_message({'path': 'start_game', 
+                                            'player': player})
+        numbers = []
+        for worker, socket in enumerate(sockets):
+            for data in socket.sent:
+                number = json.loads(data)['game_number']
+                self.assertEqual(self.router.worker_for_game(number), worker)
+                numbers.append(number)
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertTrue(min(numbers) > 6)
+    
+    def test_worker_messages(self):
+        def worker_says(topic, **message):
+            self.router.worker_messages([topic, json.dumps(message)])
+        summary = {'number': 4, 'players': ['testlady'], 'started': False}
+        self.router.pending['testlady'] = 1
+        worker_says(topics.lobby, path='started_game', player='testlady', 
+                    game={'number': 4})
+        worker_says(topics.lobby, path='lobby_game', event='add', 
+                    summary=summary)
+        self.assertEqual(self.router.worker_for_player('testlady'), 1)
+        self.assertEqual(self.router.pending, {})
+        self.assertEqual(self.router.summaries, {4: summary})
+        worker_says(topics.game(4), path='left_game', player='testlady')
+        self.assertEqual(self.router.worker_for_player('testlady'), 1)
+        worker_says(topics.lobby, path='left_game', player='testlady')
+        worker_says(topics.lobby, path='lobby_game', event='remove', 
+                    game_number=4)
+        self.assertEqual(self.router.worker_for_player('testlady'), None)
+        self.assertEqual(self.router.summaries, {})
+
+
+class TestWorker(unittest.TestCase):
+    def setUp(self):
+        self.worker = Worker()
+        self.worker.log.disabled = True
+        self.worker.pub_queue = deque()
+        self.worker.players = set()
+        self.worker.games_list = []
+        self.worker.numbered_games = {}
+        self.worker.player_games = {}
+        self.worker.published_games = {}
+        self.worker.game_updates = 'full'
+        self.worker.journal = None
+        self.worker.reaper = None
+
+    def tearDown(self):
+        self.worker.log.disabled = False
+
+    def send(self, path, **message):
+        message['path'] = path
+        self.worker.route_message(message)
+
+    def test_logged_out_forgotten_with_their_games(self):
+        self.send('start_game', player='alice', game_number=3)
+        self.send('join_game', player='bob', game_number=3)
+        self.send('start_game', player='carol', game_number=5)
+        for player in ('alice', 'bob', 'carol'):
+            self.send('logout', player=player)
+        self.assertEqual(self.worker.logged_out, set(['alice', 'bob', 
+                                                      'carol']))
+        game = self.worker.game_numbered(3)
+        self.worker.games_list.remove(game)
+        self.worker.forget_game(game)
+        self.assertEqual(self.worker.logged_out, set(['carol']))
+
+
+class TestWorkerCount(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'games')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_saved_then_checked(self):
+        check_workers(self.path, 3)
+        with open(self.path + '.workers') as f:
+            self.assertEqual(f.read(), '3\n')
+        check_workers(self.path, 3)
+        with self.assertRaises(ValueError):
+            check_workers(self.path, 2)
+        with self.assertRaises(ValueError):
+            Router().run(workers=2, journal_path=self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
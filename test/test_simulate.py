@@ -0,0 +1,22 @@
+import unittest
+
+from acquire import gametools, simulate
+
+class TestSimulate(unittest.TestCase):
+    
+    def test_games_play_through(self):
+        for seed in xrange(5):
+            moves, stalled = simulate.play_game(seed, ['random', 'greedy', 
+                                                       'random'])
+            self.assertTrue(moves > 0)
+    
+    def test_timing_restores_gametools(self):
+        play_tile = gametools.play_tile
+        totals = simulate.play_games(([0, 1], ['greedy', 'greedy']))
+        self.assertEqual(totals['games'], 2)
+        self.assertEqual(totals['times']['start_game'][0], 2)
+        self.assertTrue(gametools.play_tile is play_tile)
+    
+
+if __name__ == '__main__':
+    unittest.main()
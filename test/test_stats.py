@@ -0,0 +1,87 @@
+import json
+import unittest
+
+from acquire import stats
+from acquire.backend import Backend
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = stats.Stats('test')
+        self.counter = self.stats.counter('things_total', 'Things.', 'kind')
+        self.histogram = self.stats.histogram('seconds', 'Time.', 'kind',
+                                              bounds=(0.1, 1.0))
+        self.queue = [1, 2, 3]
+        self.stats.gauge('queue', 'Queue length.', lambda: len(self.queue))
+
+    def test_counts(self):
+        self.counter.add('a')
+        self.counter.add('a')
+        self.counter.add('b', 5)
+        self.assertEqual(self.stats.to_dict()['things_total'],
+                         {'a': 2, 'b': 5})
+
+    def test_histogram(self):
+        for value in (0.05, 0.1, 0.5, 2.0):
+            self.histogram.observe('a', value)
+        sample = self.stats.to_dict()['seconds']['a']
+        self.assertEqual(sample['count'], 4)
+        self.assertAlmostEqual(sample['sum'], 2.65)
+        self.assertEqual(sample['buckets'], [(0.1, 2), (1.0, 3), ('+Inf', 4)])
+
+    def test_gauge_is_read_when_asked(self):
+        self.assertEqual(self.stats.to_dict()['queue'], 3)
+        self.queue.pop()
+        self.assertEqual(json.loads(self.stats.to_json())['queue'], 2)
+
+    def test_prometheus(self):
+        self.counter.add('say "hi"')
+        self.histogram.observe('a', 0.5)
+        lines = self.stats.to_prometheus().splitlines()
+        self.assertTrue('# TYPE test_things_total counter' in lines)
+        self.assertTrue('test_things_total{kind="say \\"hi\\""} 1' in lines)
+        self.assertTrue('# TYPE test_seconds histogram' in lines)
+        self.assertTrue('test_seconds_bucket{kind="a",le="0.1"} 0' in lines)
+        self.assertTrue('test_seconds_bucket{kind="a",le="+Inf"} 1' in lines)
+        self.assertTrue('test_seconds_count{kind="a"} 1' in lines)
+        self.assertTrue('test_queue 3' in lines)
+        self.assertTrue(any(line.startswith('test_uptime_seconds ')
+                            for line in lines))
+
+    def test_answer(self):
+        class FakeSocket(object):
+            def __init__(self, request):
+                self.request = request
+            def recv(self):
+                return self.request
+            def send(self, data):
+                self.reply = data
+        socket = FakeSocket('prometheus')
+        self.stats.answer(socket)
+        self.assertTrue(socket.reply.startswith('# HELP'))
+        socket = FakeSocket('')
+        self.stats.answer(socket)
+        self.assertEqual(json.loads(socket.reply)['queue'], 3)
+        def echo(*words):
+            if not words:
+                raise ValueError('nothing to echo')
+            return ' '.join(words)
+        socket = FakeSocket('echo a b')
+        self.stats.answer(socket, {'echo': echo})
+        self.assertEqual(socket.reply, 'a b')
+        socket = FakeSocket('echo')
+        self.stats.answer(socket, {'echo': echo})
+        self.assertEqual(socket.reply, 'error: nothing to echo')
+        def fail():
+            raise IOError('disk gone')
+        socket = FakeSocket('fail')
+        self.stats.answer(socket, {'fail': fail})
+        self.assertEqual(socket.reply, 'error: IOError: disk gone')
+
+class TestBackendStats(unittest.TestCase):
+
+    def test_unknown_paths_are_lumped_together(self):
+        backend = Backend()
+        self.assertTrue('login' in backend.known_paths)
+        self.assertTrue('purchase' in backend.known_paths)
+        self.assertFalse('send_to' in backend.known_paths)
@@ -0,0 +1,95 @@
+import logging
+import unittest
+
+from acquire import timers
+from acquire.timers import Timers
+
+class TestTimers(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        self.timers = Timers(clock=lambda: self.now)
+        self.calls = []
+
+    def call(self, *args):
+        self.calls.append(args)
+
+    def advance(self, seconds):
+        self.now += seconds
+        return self.timers.run_due()
+
+    def test_nothing_to_do(self):
+        self.assertEqual(self.timers.timeout(), None)
+        self.assertEqual(self.timers.run_due(), 0)
+
+    def test_in_order(self):
+        self.timers.call_later(2, self.call, 'b')
+        self.timers.call_later(1, self.call, 'a')
+        self.timers.call_at(101, self.call, 'a2')
+        self.assertEqual(self.timers.timeout(), 1001)
+        self.assertEqual(self.advance(0.5), 0)
+        self.assertEqual(self.advance(0.5), 2)
+        self.assertEqual(self.calls, [('a',), ('a2',)])
+        self.advance(5)
+        self.assertEqual(self.calls, [('a',), ('a2',), ('b',)])
+        self.assertEqual(len(self.timers), 0)
+
+    def test_cancel(self):
+        timer = self.timers.call_later(1, self.call, 'a')
+        self.timers.call_later(2, self.call, 'b')
+        self.assertTrue(self.timers.active(timer))
+        self.timers.cancel(timer)
+        self.timers.cancel(timer)
+        self.assertFalse(self.timers.active(timer))
+        self.assertEqual(len(self.timers), 1)
+        self.assertEqual(self.timers.timeout(), 2001)
+        self.advance(3)
+        self.assertEqual(self.calls, [('b',)])
+        self.timers.cancel(timer)
+        self.assertEqual(len(self.timers), 0)
+
+    def test_every(self):
+        timer = self.timers.call_every(10, self.call)
+        self.advance(10)
+        self.advance(10)
+        self.assertEqual(len(self.calls), 2)
+        # Missed calls are skipped, not made in a rush.
+        self.advance(35)
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(self.timers.deadline(timer), self.now + 10)
+        self.timers.cancel(timer)
+        self.advance(100)
+        self.assertEqual(len(self.calls), 3)
+        self.assertRaises(ValueError, self.timers.call_every, 0, self.call)
+
+    def test_cancel_from_a_call(self):
+        # Enough to have the heap cleaned out while it's being run.
+        entries = []
+        def cancel_all():
+            for entry in entries:
+                self.timers.cancel(entry)
+        self.timers.call_later(1, cancel_all)
+        entries.append(self.timers.call_every(1, self.call, 'every'))
+        entries.extend(self.timers.call_later(1, self.call, i)
+                       for i in xrange(timers.compact_minimum * 3))
+        self.advance(1)
+        self.assertEqual(self.calls, [])
+        self.assertEqual(len(self.timers), 0)
+        self.assertEqual(self.timers.timeout(), None)
+
+    def test_errors_are_logged(self):
+        def fail():
+            raise RuntimeError('oops')
+        self.timers.log = logging.getLogger('test_timers')
+        self.timers.log.disabled = True
+        try:
+            self.timers.call_later(1, fail)
+            self.timers.call_later(1, self.call, 'after')
+            self.assertEqual(self.advance(1), 2)
+        finally:
+            self.timers.log.disabled = False
+        self.assertEqual(self.calls, [('after',)])
+
+    def test_many(self):
+        results = timers.benchmark(20000)
+        self.assertEqual(sorted(results), ['add', 'cancel', 'run'])
@@ -0,0 +1,43 @@
+import unittest
+
+import zmq
+
+from acquire import topics
+
+
+class FakeSocket(object):
+    def __init__(self):
+        self.calls = []
+
+    def setsockopt(self, option, value):
+        self.calls.append((option, value))
+
+
+class TestTopics(unittest.TestCase):
+    def test_names(self):
+        self.assertEqual(topics.game(12), 'game.12')
+        self.assertEqual(topics.player(u'caf\xe9'), 'player.caf\xc3\xa9')
+        self.assertEqual(topics.player('testlady'), 'player.testlady')
+
+    def test_subscriptions_are_counted(self):
+        socket = FakeSocket()
+        subscriptions = topics.Subscriptions(socket)
+        subscriptions.add('game.1')
+        subscriptions.add('game.1')
+        self.assertEqual(socket.calls, [(zmq.SUBSCRIBE, 'game.1')])
+        subscriptions.discard('game.1')
+        self.assertTrue('game.1' in subscriptions)
+        subscriptions.discard('game.1')
+        self.assertFalse('game.1' in subscriptions)
+        self.assertEqual(socket.calls[-1], (zmq.UNSUBSCRIBE, 'game.1'))
+        subscriptions.discard('game.1')
+        self.assertEqual(len(socket.calls), 2)
+
+    def test_exact_topics(self):
+        subscriptions = topics.Subscriptions(FakeSocket())
+        subscriptions.add(topics.game(1))
+        self.assertFalse(topics.game(12) in subscriptions)
+
+
+if __name__ == '__main__':
+    unittest.main()